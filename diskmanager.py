@@ -1,7 +1,9 @@
 # viewcpm_diskops.py
 import os
 import threading
-import ffhelper_logic as logic
+import ffhelper_utils as utils
+from ffhelper_copy import bulk_copy
+from ffhelper_jobs import Job, JobCancelled, format_rate
 
 class DiskImageManager:
     def __init__(self, conversion_tools_path,  prefs, status_callback=None):
@@ -13,23 +15,39 @@ class DiskImageManager:
         self._current_staging_path = None
         self.status_callback = status_callback or (lambda msg: None)
         self.prefs = prefs
+        self.current_job = None
 
     def set_current_staging_path(self, image_path):
         self._current_staging_path = image_path
 
     def get_current_staging_path(self):
         return self._current_staging_path
+
+    def cancel(self):
+        """Ask the running insert/delete to stop after the files in progress."""
+        job = self.current_job
+        if job is not None:
+            job.cancel()
         
     # --- Insert ---
     def insert_files(self, host_folder, files, callback=None):
         if not self._current_staging_path:
             raise RuntimeError("No disk image loaded.")
+        workers = max(1, utils.parse_size(self.prefs.get_pref("copy_workers", 4)))
+        verify_hash = bool(self.prefs.get_pref("copy_verify_hash", False))
+        job = Job("Insert", status_callback=self.status_callback)
+        self.current_job = job
         def task():
             try:
-                for f in files:
-                    host_file = os.path.join(host_folder, f)
-                    logic.copy_file_to_dir(host_file, self._current_staging_path)
-                self.status_callback("Insert complete.")
+                report = bulk_copy(host_folder, files, self._current_staging_path,
+                                   workers=workers, verify_hash=verify_hash, job=job)
+                msg = (f"Insert {'cancelled' if report['cancelled'] else 'complete'}: "
+                       f"{len(report['copied'])} copied, "
+                       f"{len(report['skipped'])} unchanged skipped, "
+                       f"{report['bytes'] / (1024 * 1024):.1f} MB at {format_rate(report['rate'])}")
+                if report["errors"]:
+                    msg += f", {len(report['errors'])} failed (see log)"
+                self.status_callback(msg)
             except Exception as e:
                 self.status_callback(f"Insert failed: {e}")
             if callback:
@@ -40,12 +58,22 @@ class DiskImageManager:
     def delete_files(self, files, callback=None):
         if not self._current_staging_path:
             raise RuntimeError("No disk image loaded.")
+        job = Job("Delete", total_files=len(files), status_callback=self.status_callback)
+        self.current_job = job
         def task():
+            import ffhelper_logic as logic
             try:
                 for f in files:
+                    job.check()
                     delete_file = os.path.join(self._current_staging_path, f)
-                    logic.delete_file(delete_file)
+                    with job.stage("delete"):
+                        logic.delete_file(delete_file)
+                    job.advance(1)
+                job.finish()
                 self.status_callback("Delete complete.")
+            except JobCancelled:
+                job.finish()
+                self.status_callback(f"Delete cancelled after {job.files_done} of {len(files)} file(s).")
             except Exception as e:
                 self.status_callback(f"Delete failed: {e}")
             if callback:
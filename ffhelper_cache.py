@@ -0,0 +1,148 @@
+# ffhelper_cache.py
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK = 1024 * 1024
+
+def hash_file(path, hasher=None):
+    """Return the sha256 hex digest of a file, read in large chunks."""
+    h = hasher or hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def tool_identity(tool_path):
+    """Identify a converter binary by path, size and mtime (changes when the tool is replaced)."""
+    try:
+        st = os.stat(tool_path)
+        return f"{os.path.abspath(tool_path)}|{st.st_size}|{st.st_mtime_ns}"
+    except OSError:
+        return os.path.abspath(tool_path)
+
+def evict_lru(folder, max_bytes, keep=()):
+    """
+    Delete least recently used files in folder until the total size is <= max_bytes.
+    Files are ordered by mtime, which the cache bumps on every hit.
+    Returns the number of bytes removed.
+    """
+    entries = []
+    total = 0
+    try:
+        with os.scandir(folder) as it:
+            for entry in it:
+                # Hidden files are in-flight writes (see ConversionCache.store)
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+    except FileNotFoundError:
+        return 0
+
+    removed = 0
+    if total <= max_bytes:
+        return removed
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        if path in keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.debug(f"evict_lru could not remove {path}: {e}")
+            continue
+        total -= size
+        removed += size
+    logger.debug(f"evict_lru removed {removed:,} bytes from {folder}")
+    return removed
+
+class ConversionCache:
+    """
+    Content-addressed store of converter outputs.
+
+    An entry is keyed by the sha256 of the input bytes, the command template
+    and the converter binary identity, so unchanged images never hit the
+    converter twice. Entries are evicted by total size, least recently used first.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, in_path, cmd_template, tool_path, out_ext=""):
+        h = hashlib.sha256()
+        h.update(cmd_template.encode("utf-8"))
+        h.update(b"\0")
+        h.update(tool_identity(tool_path).encode("utf-8"))
+        h.update(b"\0")
+        h.update(out_ext.lower().encode("utf-8"))
+        h.update(b"\0")
+        return hash_file(in_path, h)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def fetch(self, key, out_path, link=False):
+        """
+        Materialize a cached output at out_path. Returns True on a hit.
+        The output is a copy; link=True hard-links the entry instead, for
+        private intermediates only (writing to a link would corrupt the cache).
+        """
+        from ffhelper_copy import fast_copy     # ffhelper_copy imports this module
+        entry = self._entry_path(key)
+        if not os.path.isfile(entry):
+            with self._lock:
+                self.misses += 1
+            return False
+
+        try:
+            os.utime(entry)  # bump LRU position
+            if not link:
+                fast_copy(entry, out_path)      # reflink/copy_file_range where available
+            else:
+                if os.path.lexists(out_path):
+                    os.remove(out_path)
+                try:
+                    os.link(entry, out_path)
+                except OSError:
+                    shutil.copyfile(entry, out_path)
+        except FileNotFoundError:
+            # Evicted between the check and the copy
+            with self._lock:
+                self.misses += 1
+            return False
+
+        with self._lock:
+            self.hits += 1
+        logger.debug(f"Conversion cache hit {key[:12]} -> {out_path}")
+        return True
+
+    def store(self, key, produced_path):
+        """Add a converter output to the cache and evict old entries if over budget."""
+        entry = self._entry_path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix=".incoming-")
+        os.close(fd)
+        try:
+            shutil.copyfile(produced_path, tmp)
+            os.replace(tmp, entry)  # atomic, safe with concurrent workers
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        with self._lock:
+            evict_lru(self.cache_dir, self.max_bytes, keep=(entry,))
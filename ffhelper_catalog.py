@@ -0,0 +1,518 @@
+# ffhelper_catalog.py
+import os
+import json
+import time
+import queue
+import sqlite3
+import hashlib
+import threading
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from ffhelper_utils import get_resource_path
+from ffhelper_index import RACY_WINDOW_NS
+from ffhelper_cache import HASH_CHUNK
+from ffhelper_jobs import CancelToken, JobCancelled
+from ffhelper_sniff import SNIFF_BYTES, sniff_bytes, resolve_format, header_geometry
+import ffhelper_imd as imd
+import ffhelper_dmk as dmk
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1                      # any other version is dropped and rebuilt
+CATALOG_NAME = "catalog.sqlite3"
+CRAWL_WORKERS = 4
+WRITE_BATCH = 500
+DECODE_MAX_BYTES = 16 * 1024 * 1024     # larger files are hashed in chunks, not decoded
+
+# Extensions catalogued even when no signature is found (raw sector dumps)
+IMAGE_FORMATS = {"IMD", "TD0", "DSK", "EDSK", "DMK", "HFE", "ADF", "ST", "IMG", "IMA"}
+
+# Decoders for the geometry of images without a descriptive header
+DECODERS = {"IMD": imd.decode_imd, "DMK": dmk.decode_dmk}
+
+IMAGE_COLUMNS = ("path", "folder", "name", "size", "mtime", "sha256", "format", "detected",
+                 "detail", "cylinders", "heads", "sectors", "sector_size", "seen")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path        TEXT PRIMARY KEY,
+    folder      TEXT NOT NULL,
+    name        TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    mtime       INTEGER NOT NULL,
+    sha256      TEXT,
+    format      TEXT,
+    detected    TEXT,
+    detail      TEXT,
+    cylinders   INTEGER,
+    heads       INTEGER,
+    sectors     INTEGER,
+    sector_size INTEGER,
+    seen        INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_folder ON images (folder, name);
+CREATE INDEX IF NOT EXISTS images_format ON images (format, size);
+CREATE INDEX IF NOT EXISTS images_size ON images (size);
+CREATE INDEX IF NOT EXISTS images_sha256 ON images (sha256);
+CREATE TABLE IF NOT EXISTS folders (
+    path       TEXT PRIMARY KEY,
+    mtime      INTEGER NOT NULL,
+    scanned_at INTEGER NOT NULL,
+    subdirs    TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS others (
+    path   TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    size   INTEGER NOT NULL,
+    mtime  INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS others_folder ON others (folder);
+CREATE TABLE IF NOT EXISTS cpm_listings (
+    sha256  TEXT NOT NULL,
+    diskdef TEXT NOT NULL,
+    listing TEXT NOT NULL,
+    PRIMARY KEY (sha256, diskdef)
+);
+CREATE TABLE IF NOT EXISTS cpm_files (
+    sha256  TEXT NOT NULL,
+    diskdef TEXT NOT NULL,
+    user    INTEGER NOT NULL,
+    name    TEXT NOT NULL,
+    size    INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cpm_files_name ON cpm_files (name);
+CREATE INDEX IF NOT EXISTS cpm_files_image ON cpm_files (sha256, diskdef);
+"""
+
+def _prefix_bound(prefix):
+    """Smallest string greater than every string starting with prefix (for indexed range scans)."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+# ----------------------------
+# Per-file record
+# ----------------------------
+def image_geometry(image):
+    """{"cylinders", "heads", "sectors" (most on a track), "sector_size" (most common)} of a DiskImage."""
+    sizes = Counter(s.size for t in image.tracks for s in t.sectors)
+    return {"cylinders": image.cylinders, "heads": image.heads,
+            "sectors": max((len(t.sectors) for t in image.tracks), default=0),
+            "sector_size": sizes.most_common(1)[0][0] if sizes else None}
+
+def catalog_file(path, st=None):
+    """
+    Catalog row for one file: sniffed format, sha256 of the contents and
+    geometry (from the header, or by decoding IMD/DMK). Only the head is read
+    to sniff; images up to DECODE_MAX_BYTES are then read once for the hash
+    and geometry. Returns None for files that are not disk images.
+    Raises OSError if the file cannot be read.
+    """
+    name = os.path.basename(path)
+    with open(path, "rb") as f:
+        st = st or os.fstat(f.fileno())
+        head = f.read(SNIFF_BYTES)
+        found = sniff_bytes(head, st.st_size)
+        fmt = resolve_format(name, found)
+        if found is None and fmt not in IMAGE_FORMATS:
+            return None
+
+        data = head + f.read() if st.st_size <= DECODE_MAX_BYTES else None
+        if data is not None:
+            digest = hashlib.sha256(data).hexdigest()
+        else:
+            h = hashlib.sha256(head)
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+                h.update(chunk)
+            digest = h.hexdigest()
+
+    detected = found[0] if found else fmt
+    geometry = header_geometry(detected, head, st.st_size)
+    decoder = DECODERS.get(detected)
+    if decoder and data is not None:
+        try:
+            geometry = image_geometry(decoder(data))
+        except ValueError as e:
+            logger.debug(f"catalog {path}: {e}")
+
+    row = {"path": path, "folder": os.path.dirname(path), "name": name,
+           "size": st.st_size, "mtime": st.st_mtime_ns, "sha256": digest,
+           "format": fmt, "detected": found[0] if found else None, "detail": found[1] if found else "",
+           "cylinders": None, "heads": None, "sectors": None, "sector_size": None,
+           "seen": time.time_ns()}
+    row.update(geometry)
+    return row
+
+# ----------------------------
+# Catalog database
+# ----------------------------
+class ImageCatalog:
+    """
+    Every disk image seen under the crawled folders, in an SQLite database
+    (WAL mode: the crawler writes while the UI reads). Rows are keyed by
+    absolute path and indexed by folder/name, format, size and hash.
+    Each thread gets its own connection.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(get_resource_path("cache"), CATALOG_NAME)
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            logger.info(f"Catalog schema {version} is outdated, rebuilding {self.db_path}")
+            conn.executescript("DROP TABLE IF EXISTS images; DROP TABLE IF EXISTS folders; "
+                               "DROP TABLE IF EXISTS others; DROP TABLE IF EXISTS cpm_listings; "
+                               "DROP TABLE IF EXISTS cpm_files;")
+        conn.executescript(SCHEMA)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+
+    def close(self):
+        """Close this thread's connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # --- Writes ---
+    def upsert(self, rows):
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO images ({', '.join(IMAGE_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(IMAGE_COLUMNS))})",
+                [tuple(row[c] for c in IMAGE_COLUMNS) for row in rows])
+
+    def remove(self, paths):
+        conn = self._connect()
+        with conn:
+            conn.executemany("DELETE FROM images WHERE path = ?", [(p,) for p in paths])
+
+    def remove_tree(self, folder):
+        """Forget a folder and everything catalogued below it."""
+        folder = os.path.abspath(folder)
+        below = folder.rstrip(os.sep) + os.sep
+        conn = self._connect()
+        with conn:
+            for table in ("images", "others", "folders"):
+                conn.execute(f"DELETE FROM {table} WHERE path >= ? AND path < ?", (below, _prefix_bound(below)))
+            conn.execute("DELETE FROM folders WHERE path = ?", (folder,))
+
+    def set_others(self, folder, others):
+        """Record the non-image files of folder ({name: (size, mtime)}) so unchanged ones are not read again."""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM others WHERE folder = ?", (folder,))
+            conn.executemany("INSERT INTO others (path, folder, size, mtime) VALUES (?, ?, ?, ?)",
+                             [(os.path.join(folder, name), folder, size, mtime)
+                              for name, (size, mtime) in others.items()])
+
+    def set_folder(self, folder, mtime, scanned_at, subdirs):
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO folders (path, mtime, scanned_at, subdirs) VALUES (?, ?, ?, ?)",
+                         (folder, mtime, scanned_at, "\0".join(subdirs)))
+
+    # --- Queries ---
+    def folder_state(self, folder):
+        """(mtime, scanned_at, [subdir names]) recorded for folder, or None."""
+        row = self._connect().execute("SELECT mtime, scanned_at, subdirs FROM folders WHERE path = ?",
+                                      (folder,)).fetchone()
+        if row is None:
+            return None
+        return row["mtime"], row["scanned_at"], [d for d in row["subdirs"].split("\0") if d]
+
+    def folder_entries(self, folder):
+        """{name: row dict} for the images catalogued directly in folder."""
+        rows = self._connect().execute("SELECT * FROM images WHERE folder = ?", (os.path.abspath(folder),))
+        return {row["name"]: dict(row) for row in rows}
+
+    def folder_others(self, folder):
+        """{name: (size, mtime)} of the files in folder last found not to be disk images."""
+        rows = self._connect().execute("SELECT path, size, mtime FROM others WHERE folder = ?",
+                                       (os.path.abspath(folder),))
+        return {os.path.basename(path): (size, mtime) for path, size, mtime in rows}
+
+    def lookup(self, path):
+        row = self._connect().execute("SELECT * FROM images WHERE path = ?", (os.path.abspath(path),)).fetchone()
+        return dict(row) if row else None
+
+    def query(self, under=None, folder=None, name_prefix=None, fmt=None, min_size=None, max_size=None,
+              sha256=None, limit=None):
+        """
+        Rows matching all given filters, ordered by path:
+            under       - anywhere below this folder (path prefix range scan)
+            folder      - directly in this folder; name_prefix narrows it by file name
+            fmt         - sniffed format, e.g. "IMD"
+            min_size, max_size - bytes, inclusive
+            sha256      - same contents
+        """
+        where, args = [], []
+        if under:
+            below = os.path.abspath(under).rstrip(os.sep) + os.sep
+            where.append("path >= ? AND path < ?")
+            args += [below, _prefix_bound(below)]
+        if folder:
+            where.append("folder = ?")
+            args.append(os.path.abspath(folder))
+            if name_prefix:
+                where.append("name >= ? AND name < ?")
+                args += [name_prefix, _prefix_bound(name_prefix)]
+        if fmt:
+            where.append("format = ?")
+            args.append(fmt.upper())
+        if min_size is not None:
+            where.append("size >= ?")
+            args.append(min_size)
+        if max_size is not None:
+            where.append("size <= ?")
+            args.append(max_size)
+        if sha256:
+            where.append("sha256 = ?")
+            args.append(sha256)
+        sql = "SELECT * FROM images" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY path"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [dict(row) for row in self._connect().execute(sql, args)]
+
+    def format_counts(self, under=None):
+        """{format: (images, bytes)}, optionally only below a folder."""
+        sql, args = "SELECT format, COUNT(*), SUM(size) FROM images", []
+        if under:
+            below = os.path.abspath(under).rstrip(os.sep) + os.sep
+            sql += " WHERE path >= ? AND path < ?"
+            args = [below, _prefix_bound(below)]
+        rows = self._connect().execute(sql + " GROUP BY format", args)
+        return {fmt: (count, total) for fmt, count, total in rows}
+
+    # --- CP/M listings (see ffhelper_cpmfs), keyed by image hash and definition_key() ---
+    def get_cpm_listing(self, sha256, diskdef):
+        row = self._connect().execute("SELECT listing FROM cpm_listings WHERE sha256 = ? AND diskdef = ?",
+                                      (sha256, diskdef)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def store_cpm_listing(self, sha256, diskdef, listing):
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO cpm_listings (sha256, diskdef, listing) VALUES (?, ?, ?)",
+                         (sha256, diskdef, json.dumps(listing)))
+            conn.execute("DELETE FROM cpm_files WHERE sha256 = ? AND diskdef = ?", (sha256, diskdef))
+            conn.executemany("INSERT INTO cpm_files (sha256, diskdef, user, name, size) VALUES (?, ?, ?, ?, ?)",
+                             [(sha256, diskdef, f["user"], f["name"], f["size"]) for f in listing.get("files", ())])
+
+    def find_cpm_files(self, pattern, diskdef=None, under=None, limit=None):
+        """
+        CP/M files named like pattern (a glob such as '*.BAS'; upper case, as
+        CP/M stores names) inside catalogued images whose listing is cached.
+        Returns [{"path", "image", "user", "name", "size", "diskdef"}] by path and name,
+        diskdef being the cpmfs.definition_key() the listing was read with.
+        """
+        sql = ("SELECT images.path AS path, images.name AS image, cpm_files.user AS user, "
+               "cpm_files.name AS name, cpm_files.size AS size, cpm_files.diskdef AS diskdef "
+               "FROM cpm_files JOIN images ON images.sha256 = cpm_files.sha256 WHERE cpm_files.name GLOB ?")
+        args = [pattern.upper()]
+        if diskdef:
+            sql += " AND cpm_files.diskdef = ?"
+            args.append(diskdef)
+        if under:
+            below = os.path.abspath(under).rstrip(os.sep) + os.sep
+            sql += " AND images.path >= ? AND images.path < ?"
+            args += [below, _prefix_bound(below)]
+        sql += " ORDER BY images.path, cpm_files.name"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [dict(row) for row in self._connect().execute(sql, args)]
+
+    # ----------------------------
+    # Crawl
+    # ----------------------------
+    def crawl(self, root, force=False, workers=None, cancel=None, progress=None, recursive=True):
+        """
+        Bring the catalog up to date for everything below root (only root
+        itself when recursive is False).
+
+        A folder whose mtime is unchanged since its last scan is not listed
+        again (its subfolders are still visited); in a changed folder only new
+        or changed files (size/mtime) are sniffed and hashed, on a thread pool;
+        files found not to be images are remembered by size/mtime and skipped too.
+        force rescans every folder (for files rewritten in place).
+        progress(stats) is called after each folder. Returns the stats dict.
+        Raises JobCancelled if cancel (a CancelToken) is cancelled.
+        """
+        cancel = cancel or CancelToken()
+        root = os.path.abspath(root)
+        stats = {"root": root, "folders": 0, "skipped": 0, "added": 0, "changed": 0, "removed": 0, "images": 0}
+        stack = [root]
+        pending = []
+        with ThreadPoolExecutor(max_workers=max(1, workers or CRAWL_WORKERS)) as pool:
+            while stack:
+                cancel.check()
+                folder = stack.pop()
+                try:
+                    dir_mtime = os.stat(folder).st_mtime_ns
+                except OSError:
+                    self.remove_tree(folder)
+                    continue
+                stats["folders"] += 1
+                state = self.folder_state(folder)
+                if state and not force and state[0] == dir_mtime and dir_mtime < state[1] - RACY_WINDOW_NS:
+                    stats["skipped"] += 1
+                    if recursive:
+                        stack.extend(os.path.join(folder, d) for d in state[2])
+                    continue
+
+                scanned_at = time.time_ns()
+                subdirs, files = [], {}
+                try:
+                    with os.scandir(folder) as it:
+                        for entry in it:
+                            try:
+                                if entry.is_dir(follow_symlinks=False):
+                                    subdirs.append(entry.name)
+                                elif entry.is_file():
+                                    files[entry.name] = entry.stat()
+                            except OSError:
+                                continue
+                except OSError as e:
+                    logger.warning(f"Catalog: cannot list {folder}: {e}")
+                    continue
+
+                known = self.folder_entries(folder)
+                known_others = self.folder_others(folder)
+                others = {}
+                todo = []
+                for name, st in files.items():
+                    if name in known:
+                        if known[name]["size"] == st.st_size and known[name]["mtime"] == st.st_mtime_ns:
+                            continue
+                    elif known_others.get(name) == (st.st_size, st.st_mtime_ns):
+                        others[name] = known_others[name]
+                        continue
+                    todo.append((name, st))
+                gone = [row["path"] for name, row in known.items() if name not in files]
+
+                def record(item, folder=folder):
+                    """(row or None, True if the file was read)."""
+                    name, st = item
+                    if cancel.cancelled:
+                        return None, False
+                    try:
+                        return catalog_file(os.path.join(folder, name), st), True
+                    except OSError as e:
+                        logger.debug(f"Catalog: skipping {name}: {e}")
+                        return None, False
+
+                for (name, st), (row, read) in zip(todo, pool.map(record, todo)):
+                    if row is not None:
+                        pending.append(row)
+                        stats["changed" if name in known else "added"] += 1
+                    else:
+                        if read:
+                            others[name] = (st.st_size, st.st_mtime_ns)
+                        if name in known:
+                            gone.append(known[name]["path"])    # no longer an image
+                    if len(pending) >= WRITE_BATCH:
+                        self.upsert(pending)
+                        pending = []
+                cancel.check()
+                if pending:
+                    self.upsert(pending)
+                    pending = []
+                if gone:
+                    self.remove(gone)
+                    stats["removed"] += len(gone)
+                if others or known_others:
+                    self.set_others(folder, others)
+                # Subfolders that disappeared
+                for old in set(state[2] if state else ()) - set(subdirs):
+                    self.remove_tree(os.path.join(folder, old))
+                self.set_folder(folder, dir_mtime, scanned_at, subdirs)
+                if recursive:
+                    stack.extend(os.path.join(folder, d) for d in sorted(subdirs, reverse=True))
+                if progress:
+                    progress(stats)
+
+        stats["images"] = sum(count for count, _ in self.format_counts(root).values())
+        logger.info(f"Catalog crawl {root}: {stats['folders']} folder(s) ({stats['skipped']} unchanged), "
+                    f"+{stats['added']} ~{stats['changed']} -{stats['removed']}, {stats['images']} image(s)")
+        return stats
+
+class CatalogCrawler:
+    """
+    Background thread running ImageCatalog.crawl() for requested roots, one at
+    a time; asking again for a root already queued is a no-op. Roots are
+    crawled without their subfolders unless requested with recursive=True.
+    on_done(stats) is called from the crawler thread after each root.
+    """
+
+    def __init__(self, catalog, on_done=None, workers=None):
+        self.catalog = catalog
+        self.on_done = on_done
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._cancel = CancelToken()
+        self._thread = threading.Thread(target=self._run, name="CatalogCrawler", daemon=True)
+        self._thread.start()
+
+    def request(self, root, force=False, recursive=False):
+        root = os.path.abspath(root)
+        with self._lock:
+            if (root, recursive) in self._queued:
+                return
+            self._queued.add((root, recursive))
+        self._queue.put((root, force, recursive))
+
+    def stop(self):
+        self._cancel.cancel()
+        self._queue.put(None)
+        self._thread.join(timeout=2)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            root, force, recursive = item
+            with self._lock:
+                self._queued.discard((root, recursive))
+            try:
+                stats = self.catalog.crawl(root, force=force, workers=self.workers, cancel=self._cancel,
+                                           recursive=recursive)
+            except JobCancelled:
+                break
+            except Exception as e:
+                logger.error(f"Catalog crawl of {root} failed: {e}")
+                continue
+            if self.on_done:
+                try:
+                    self.on_done(stats)
+                except Exception as e:
+                    logger.error(f"Catalog callback failed: {e}")
+        self.catalog.close()
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def get_catalog():
+    """Return the shared ImageCatalog (cache/catalog.sqlite3)."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = ImageCatalog()
+        return _catalog
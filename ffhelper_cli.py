@@ -0,0 +1,433 @@
+# ffhelper_cli.py
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import logging
+import ffhelper_logic as logic
+import ffhelper_prefs as prefs
+from ffhelper_planner import ConversionPlanner, NoConversionRoute, file_format
+from ffhelper_utils import get_resource_path, list_files
+from ffhelper_logging import setup_logging
+from ffhelper_configurations import get_configurations
+from ffhelper_diskdefs import get_diskdefs
+from ffhelper_jobs import Job
+from ffhelper_dedup import find_duplicates
+import ffhelper_packing as packing
+
+logger = logging.getLogger(__name__)
+
+# Exit codes
+EXIT_OK = 0
+EXIT_FAILED = 1      # export ran, some files failed
+EXIT_USAGE = 2       # bad arguments (argparse uses 2 as well)
+EXIT_CONFIG = 3      # configuration / convert.txt problem
+EXIT_NO_ROUTE = 4    # a staged format has no conversion route
+EXIT_CANCELLED = 5   # interrupted (SIGINT/SIGTERM); files in progress were finished
+
+def emit(status):
+    """Write one JSON status document to stdout."""
+    json.dump(status, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    sys.stdout.flush()
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="ffhelper",
+                                     description="Flash Floppy Helper batch commands (no GUI).")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log progress to stderr")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    exp = sub.add_parser("export", help="convert and copy a staging folder to an output folder")
+    exp.add_argument("--format", required=True, help="configuration name, e.g. TRS804P")
+    exp.add_argument("--staging", required=True, help="staging folder with the disk images")
+    exp.add_argument("--out", required=True, help="output folder (e.g. mounted USB stick)")
+    exp.add_argument("--jobs", type=int, default=None, help="concurrent copy/convert jobs (default: CPU count)")
+    exp.add_argument("--configurations", default=None, help="configurations folder (default: pref)")
+    exp.add_argument("--tools", default=None, help="conversion tools folder (default: pref)")
+    exp.add_argument("--manifest", default=None, help="stick manifest from 'pack': export only its files")
+    exp.add_argument("--skip-duplicates", action="store_true", default=None,
+                     help="export one file per disk when the same disk is staged more than once")
+    exp.add_argument("--dry-run", action="store_true", help="print the conversion plan without exporting")
+
+    pack = sub.add_parser("pack", help="plan how a staging folder splits across USB sticks")
+    pack.add_argument("--format", required=True, help="configuration name, e.g. TRS804P")
+    pack.add_argument("--staging", required=True, help="staging folder with the disk images")
+    pack.add_argument("--capacity", default=None, help="stick size, e.g. 16G or 15GiB (default: free space of --target)")
+    pack.add_argument("--target", default=None, help="mounted stick to measure free space and cluster size on")
+    pack.add_argument("--sticks", type=int, default=None, help="number of sticks available (default: as many as needed)")
+    pack.add_argument("--manifests", default=None, help="folder to write stick-NN.json manifests into")
+    pack.add_argument("--configurations", default=None, help="configurations folder (default: pref)")
+
+    dup = sub.add_parser("dupes", help="report staged files that hold the same disk")
+    dup.add_argument("--staging", required=True, help="staging folder with the disk images")
+    dup.add_argument("--format", default=None, help="configuration name; keeps the file with the shortest conversion route")
+    dup.add_argument("--jobs", type=int, default=None, help="concurrent hashing jobs")
+    dup.add_argument("--configurations", default=None, help="configurations folder (default: pref)")
+
+    cat = sub.add_parser("catalog", help="crawl folders into the image catalog and query it")
+    cat.add_argument("--crawl", action="append", default=[], metavar="FOLDER", help="crawl FOLDER first (repeatable)")
+    cat.add_argument("--force", action="store_true", help="rescan folders whose mtime did not change")
+    cat.add_argument("--under", default=None, help="only images below this folder")
+    cat.add_argument("--format", default=None, help="only images of this (sniffed) format, e.g. IMD")
+    cat.add_argument("--min-size", type=int, default=None, help="only images of at least this many bytes")
+    cat.add_argument("--max-size", type=int, default=None, help="only images of at most this many bytes")
+    cat.add_argument("--limit", type=int, default=1000, help="at most this many images in the output (default 1000)")
+
+    cpm = sub.add_parser("cpmls", help="list the CP/M files inside disk images")
+    cpm.add_argument("images", nargs="*", help="image files (or use --staging; with only --find, "
+                                               "search the listings cached in the catalog)")
+    cpm.add_argument("--staging", default=None, help="list every image in this folder")
+    cpm.add_argument("--format", default=None, help="configuration name; reads with its DISKDEF")
+    cpm.add_argument("--diskdef", default=None, help="cpmtools definition name, e.g. kpii")
+    cpm.add_argument("--find", default=None, metavar="PATTERN", help="only files matching PATTERN, e.g. '*.BAS'")
+    cpm.add_argument("--jobs", type=int, default=None, help="concurrent image reads")
+    cpm.add_argument("--configurations", default=None, help="configurations folder (default: pref)")
+    cpm.add_argument("--tools", default=None, help="conversion tools folder (default: pref)")
+
+    fmts = sub.add_parser("formats", help="list available configurations")
+    fmts.add_argument("--configurations", default=None, help="configurations folder (default: pref)")
+    fmts.add_argument("--tools", default=None, help="conversion tools folder (default: pref)")
+    return parser
+
+# Paths given on the command line are relative to the working directory; only
+# the pref defaults are resolved against the install folder
+def _configurations_path(args):
+    if args.configurations:
+        return os.path.abspath(args.configurations)
+    return get_resource_path(prefs.get_pref("configurations_path", "configurations"))
+
+def _tools_path(args):
+    if args.tools:
+        return os.path.abspath(args.tools)
+    tools_path = prefs.get_pref("conversion_tools_path", "")
+    return get_resource_path(tools_path) if tools_path else ""
+
+# ----------------------------
+# Commands
+# ----------------------------
+def cmd_formats(args):
+    path = _configurations_path(args)
+    manager = get_configurations(path, _tools_path(args) or None)
+    formats = []
+    for name in sorted(manager.get_disk_names(), key=str.lower):
+        profile = manager.get_profile(name)
+        info = manager.get_disk_info(name)
+        formats.append({"name": name,
+                        "convert": profile.has_convert,
+                        "final_format": info.get("final_format"),
+                        "diskdef": info.get("diskdef"),
+                        "capacity": info.get("disksize"),
+                        "problems": profile.validate()})
+    emit({"status": "ok", "configurations": path, "formats": formats})
+    return EXIT_OK
+
+def _plan_export(args, status, files):
+    """
+    Load the profile and plan routes for files by their detected formats,
+    filling status. Returns (config_dir, final_format, conversions, routes,
+    formats), or an exit code after emitting the error.
+    """
+    if not os.path.isdir(args.staging):
+        status["error"] = f"Staging folder not found: {args.staging}"
+        emit(status)
+        return EXIT_USAGE
+
+    try:
+        config_dir, final_format, conversions = logic.load_export_profile(
+            _configurations_path(args), args.format)
+    except (FileNotFoundError, ValueError) as e:
+        status["error"] = str(e)
+        emit(status)
+        return EXIT_CONFIG
+
+    status["final_format"] = final_format
+    formats = logic.detect_formats(args.staging, [name for name, _ in files])
+    misnamed = {name: fmt for name, fmt in formats.items() if fmt != file_format(name)}
+    if misnamed:
+        status["misnamed"] = misnamed
+    planner = ConversionPlanner(conversions, final_format)
+    try:
+        routes = planner.plan_files((name for name, _ in files), formats)
+    except NoConversionRoute as e:
+        status["error"] = str(e)
+        status["missing"] = e.missing
+        emit(status)
+        return EXIT_NO_ROUTE
+    status["plan"] = {fmt: planner.describe(route) for fmt, route in sorted(routes.items())}
+    return config_dir, final_format, conversions, routes, formats
+
+def _config_bytes(config_dir, cluster):
+    """Space the configuration files take on a stick."""
+    return sum(packing.round_up(entry.stat().st_size, cluster)
+               for entry in os.scandir(config_dir) if entry.is_file())
+
+def _existing_parent(path):
+    path = os.path.abspath(path)
+    while not os.path.isdir(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return path
+
+def cmd_export(args):
+    started = time.monotonic()
+    status = {"status": "error", "command": "export", "format": args.format,
+              "staging": args.staging, "out": args.out}
+
+    files = None
+    if args.manifest:
+        try:
+            manifest = packing.load_manifest(args.manifest)
+        except (OSError, ValueError) as e:
+            status["error"] = str(e)
+            emit(status)
+            return EXIT_USAGE
+        files = manifest["files"]
+        status["manifest"] = {"path": args.manifest, "stick": manifest.get("stick"), "files": len(files)}
+
+    staged = list_files(args.staging) if os.path.isdir(args.staging) else []
+    if files is not None:
+        wanted = set(files)
+        staged = [(name, size) for name, size in staged if name in wanted]
+    planned = _plan_export(args, status, staged)
+    if isinstance(planned, int):
+        return planned
+    config_dir, final_format, conversions, routes, formats = planned
+    status["tool_warnings"] = logic.verify_route_tools(routes, _tools_path(args))
+
+    skip_duplicates = args.skip_duplicates
+    if skip_duplicates is None:
+        skip_duplicates = prefs.get_pref("skip_duplicates", False)
+    if skip_duplicates:
+        # Hashes are cached, export_files reuses them
+        duplicates = find_duplicates(args.staging, [name for name, _ in staged], formats, routes, args.jobs)
+        status["duplicates"] = duplicates
+        skipped = set(duplicates["skip"])
+        staged = [(name, size) for name, size in staged if name not in skipped]
+
+    if args.dry_run:
+        # Predicted output size against free space where the output goes (decodes
+        # images, so only for the plan; a real export reports what it wrote)
+        predictions = packing.predict_staging(args.staging, routes, staged, formats)
+        space = packing.check_fit(predictions, _existing_parent(args.out))
+        space["needed"] += _config_bytes(config_dir, space["cluster"])
+        space["fits"] = space["needed"] <= space["free"]
+        status["space"] = space
+        if not space["fits"]:
+            logger.warning(f"Export needs about {space['needed']:,} bytes, {space['free']:,} free on {args.out}")
+        status["status"] = "ok"
+        emit(status)
+        return EXIT_OK
+
+    # Progress lines go to the log; Ctrl-C / SIGTERM stop cleanly between files
+    job = Job("Export", log_interval=float(prefs.get_pref("progress_log_interval", 5.0)))
+    def on_signal(signum, frame):
+        logger.warning(f"Signal {signum}: cancelling export")
+        job.cancel()
+    previous = {sig: signal.signal(sig, on_signal) for sig in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        report = logic.export_files(
+            staging_path=args.staging,
+            configurations_path=config_dir,
+            out_folder=args.out,
+            target_ext="." + final_format.lower(),
+            conversions=conversions,
+            prefs=prefs,
+            workers=args.jobs,
+            tools_path=args.tools,
+            job=job,
+            files=files,
+            formats=formats,
+            skip_duplicates=skip_duplicates,
+        )
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+
+    if report["cancelled"]:
+        result, code = "cancelled", EXIT_CANCELLED
+    elif report["errors"]:
+        result, code = "failed", EXIT_FAILED
+    else:
+        result, code = "ok", EXIT_OK
+    status.update({
+        "status": result,
+        "exported": len(report["results"]),
+        "failed": len(report["errors"]),
+        "cancelled": report["cancelled"],
+        "configs": report["configs"],
+        "results": report["results"],
+        "errors": report["errors"],
+        "progress": report["job"],
+        "elapsed": round(time.monotonic() - started, 3),
+    })
+    emit(status)
+    return code
+
+def cmd_pack(args):
+    status = {"status": "error", "command": "pack", "format": args.format, "staging": args.staging}
+    staged = list_files(args.staging) if os.path.isdir(args.staging) else []
+    planned = _plan_export(args, status, staged)
+    if isinstance(planned, int):
+        return planned
+    config_dir, final_format, conversions, routes, formats = planned
+
+    cluster = packing.DEFAULT_CLUSTER
+    try:
+        capacity = packing.parse_capacity(args.capacity) if args.capacity else None
+        if args.target:
+            space = packing.target_space(args.target)
+            status["target"] = dict(space, path=args.target)
+            cluster = space["cluster"]
+            capacity = capacity or space["free"]
+    except (OSError, ValueError) as e:
+        status["error"] = str(e)
+        emit(status)
+        return EXIT_USAGE
+    if not capacity:
+        status["error"] = "Give --capacity or --target"
+        emit(status)
+        return EXIT_USAGE
+
+    predictions = packing.predict_staging(args.staging, routes, staged, formats)
+    plan = packing.plan_sticks(predictions, capacity, max_sticks=args.sticks, cluster=cluster,
+                               config_bytes=_config_bytes(config_dir, cluster))
+    status.update(plan)
+    if args.manifests:
+        status["manifests"] = packing.write_manifests(
+            packing.build_manifests(plan, args.format, args.staging), args.manifests)
+    status["status"] = "ok" if not plan["overflow"] else "overflow"
+    emit(status)
+    return EXIT_OK if not plan["overflow"] else EXIT_FAILED
+
+def cmd_dupes(args):
+    status = {"status": "error", "command": "dupes", "staging": args.staging}
+    staged = list_files(args.staging) if os.path.isdir(args.staging) else []
+    names = [name for name, _ in staged]
+    routes = {}
+    if args.format:
+        planned = _plan_export(args, status, staged)
+        if isinstance(planned, int):
+            return planned
+        routes, formats = planned[3], planned[4]
+    elif not os.path.isdir(args.staging):
+        status["error"] = f"Staging folder not found: {args.staging}"
+        emit(status)
+        return EXIT_USAGE
+    else:
+        formats = logic.detect_formats(args.staging, names)
+
+    status.update(find_duplicates(args.staging, names, formats, routes, args.jobs))
+    status["status"] = "ok"
+    emit(status)
+    return EXIT_OK
+
+def cmd_catalog(args):
+    from ffhelper_catalog import get_catalog
+    catalog = get_catalog()
+    status = {"status": "error", "command": "catalog", "database": catalog.db_path, "crawled": []}
+    for folder in args.crawl:
+        if not os.path.isdir(folder):
+            status["error"] = f"Folder not found: {folder}"
+            emit(status)
+            return EXIT_USAGE
+        status["crawled"].append(catalog.crawl(folder, force=args.force))
+
+    status["counts"] = {fmt: {"images": count, "bytes": total}
+                        for fmt, (count, total) in sorted(catalog.format_counts(args.under).items())}
+    status["images"] = catalog.query(under=args.under, fmt=args.format, min_size=args.min_size,
+                                     max_size=args.max_size, limit=args.limit)
+    status["status"] = "ok"
+    emit(status)
+    return EXIT_OK
+
+def _cpm_catalog():
+    """The image catalog to cache listings in, when enabled (pref 'catalog')."""
+    if not prefs.get_pref("catalog", True):
+        return None
+    from ffhelper_catalog import get_catalog
+    return get_catalog()
+
+def _cpm_definition(args, status):
+    """The diskdef for cpmls from --diskdef or the --format configuration; None after emitting the error."""
+    if args.diskdef:
+        diskdefs = get_diskdefs(_tools_path(args) or None)
+        definition = diskdefs.get(args.diskdef) if diskdefs else None
+        if definition is None:
+            status["error"] = f"diskdef '{args.diskdef}' not found"
+        return definition
+    if not args.format:
+        status["error"] = "Give --format or --diskdef"
+        return None
+    manager = get_configurations(_configurations_path(args), _tools_path(args) or None)
+    if args.format not in manager.get_disk_names():
+        status["error"] = f"Configuration not found: {args.format}"
+        return None
+    profile = manager.get_profile(args.format)
+    definition = profile.definition
+    if definition is None:
+        status["error"] = f"{args.format} has no usable DISKDEF in convert.txt"
+    return definition
+
+def cmd_cpmls(args):
+    from ffhelper_cpmfs import list_folder, find_files, definition_key
+    status = {"status": "error", "command": "cpmls"}
+    definition = _cpm_definition(args, status)
+    if definition is None:
+        emit(status)
+        return EXIT_CONFIG
+    status["diskdef"] = definition["name"]
+
+    catalog = _cpm_catalog()
+    if args.staging:
+        if not os.path.isdir(args.staging):
+            status["error"] = f"Staging folder not found: {args.staging}"
+            emit(status)
+            return EXIT_USAGE
+        folder, names = args.staging, [name for name, _ in list_files(args.staging)]
+        formats = logic.detect_formats(folder, names)
+        listings = list_folder(folder, names, definition, formats, catalog, args.jobs)
+    elif args.images:
+        listings = {}
+        for path in args.images:
+            folder, name = os.path.split(os.path.abspath(path))
+            listings[path] = list_folder(folder, [name], definition, catalog=catalog)[name]
+    elif args.find and catalog is not None:
+        # every image whose listing the catalog already holds
+        pattern = args.find if "*" in args.find or "?" in args.find else f"*{args.find}*"
+        status["matches"] = catalog.find_cpm_files(pattern, definition_key(definition))
+        status["status"] = "ok"
+        emit(status)
+        return EXIT_OK
+    else:
+        status["error"] = "Give image files or --staging"
+        emit(status)
+        return EXIT_USAGE
+
+    if args.find:
+        status["matches"] = [dict(f, image=image) for image, f in find_files(listings, args.find)]
+    else:
+        status["images"] = listings
+    status["status"] = "ok"
+    emit(status)
+    return EXIT_OK
+
+def main(argv=None):
+    """Run a batch command. Returns the process exit code."""
+    args = build_parser().parse_args(argv)
+
+    # Full log goes to the log file; stderr stays quiet unless asked, stdout is JSON only
+    setup_logging(console_level=logging.INFO if args.verbose else logging.WARNING)
+
+    commands = {"export": cmd_export, "formats": cmd_formats, "pack": cmd_pack, "dupes": cmd_dupes,
+                "catalog": cmd_catalog, "cpmls": cmd_cpmls}
+    try:
+        return commands[args.command](args)
+    except BrokenPipeError:
+        # stdout consumer went away (e.g. piped into head); nothing left to report to
+        sys.stdout = open(os.devnull, "w")
+        return EXIT_FAILED
+    except Exception as e:
+        logger.exception(f"{args.command} failed")
+        emit({"status": "error", "command": args.command, "error": str(e)})
+        return EXIT_FAILED
@@ -1,37 +1,310 @@
 # ffhelper_configurations.py
 import os
+import re
+import threading
+import logging
+import ffhelper_utils as utils
+from ffhelper_diskdefs import get_diskdefs
+
+logger = logging.getLogger(__name__)
+
+IMG_CFG_NAMES = ("IMG.CFG",)
+IMG_SECTION = re.compile(r"^\[([^\]]*)\]$")
+GEOMETRY_KEYS = ("cyls", "heads", "secs", "bps")
+
+# ----------------------------
+# File parsers
+# ----------------------------
+def _key_values(path):
+    """Yield (lineno, key, value, raw_line) for 'key = value' lines, (lineno, None, None, line) for others."""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for lineno, raw in enumerate(f, 1):
+            line = raw.split("#", 1)[0].strip()
+            if not line:
+                continue
+            if "=" in line and not line.startswith("["):
+                key, value = line.split("=", 1)
+                yield lineno, key.strip().lower(), value.strip(), line
+            else:
+                yield lineno, None, None, line
+
+def parse_ff_cfg(path):
+    """FF.CFG as {option: value} (strings). Returns (options, problems)."""
+    options, problems = {}, []
+    for lineno, key, value, line in _key_values(path):
+        if key is None:
+            problems.append(f"{os.path.basename(path)}:{lineno}: not an option: {line}")
+        else:
+            options[key] = value
+    return options, problems
+
+def parse_img_cfg(path):
+    """
+    IMG.CFG as a list of sections, in file order:
+        {"tag": str, "size": int or None, "params": {key: value},
+         "tracks": [{"tracks": spec, key: value, ...}], "line": int}
+    Keys after a 'tracks =' line belong to that track range. Returns (sections, problems).
+    """
+    sections, problems = [], []
+    current = None
+    name = os.path.basename(path)
+    for lineno, key, value, line in _key_values(path):
+        if key is None:
+            m = IMG_SECTION.match(line)
+            if not m:
+                problems.append(f"{name}:{lineno}: not a section or parameter: {line}")
+                continue
+            tag, _, size = m.group(1).partition("::")
+            current = {"tag": tag, "size": None, "params": {}, "tracks": [], "line": lineno}
+            if size:
+                try:
+                    current["size"] = int(size)
+                except ValueError:
+                    problems.append(f"{name}:{lineno}: bad image size '{size}'")
+            sections.append(current)
+        elif current is None:
+            problems.append(f"{name}:{lineno}: parameter outside a [section]: {line}")
+        elif key == "tracks":
+            current["tracks"].append({"tracks": value})
+        elif current["tracks"]:
+            current["tracks"][-1][key] = value
+        else:
+            current["params"][key] = value
+    return sections, problems
+
+def img_section_size(section):
+    """Image size implied by a section's cyls/heads/secs/bps, or None if one is missing."""
+    try:
+        cyls, heads, secs, bps = (int(section["params"][k]) for k in GEOMETRY_KEYS)
+    except (KeyError, ValueError):
+        return None
+    return cyls * heads * secs * bps
+
+def parse_image_a_cfg(path):
+    """IMAGE_A.CFG: the image FlashFloppy selects at startup (first non-empty line), or None."""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if line.strip():
+                return line.strip()
+    return None
+
+def read_diskdef_name(path):
+    """Return the cpmtools diskdef named by a 'DISKDEF:' line in a convert.txt, or None."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.upper().startswith("DISKDEF:"):
+                return line.split(":", 1)[1].strip() or None
+    return None
+
+# ----------------------------
+# Profiles
+# ----------------------------
+class ConfigurationProfile:
+    """
+    One configuration folder. FF.CFG, IMG.CFG, IMAGE_A.CFG and convert.txt
+    are parsed on first access and kept until the folder or one of its
+    files changes. Changes are found by check() (stat only, no reads), which
+    ConfigurationsManager runs once per lookup rather than on every property.
+    """
+
+    def __init__(self, name, path, tools_path=None):
+        self.name = name
+        self.path = path
+        self.tools_path = tools_path
+        self._stamp = None
+        self._parsed = {}
+        self._lock = threading.RLock()   # loaders look up other parsed files
+
+    def _current_stamp(self):
+        """Folder mtime plus (name, size, mtime) of its files; one scandir, no reads."""
+        st = os.stat(self.path)
+        files = []
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.is_file():
+                    est = entry.stat()
+                    files.append((entry.name, est.st_size, est.st_mtime_ns))
+        return st.st_mtime_ns, tuple(sorted(files))
+
+    def check(self):
+        """Drop the parsed files if the folder or one of its files changed since the last check."""
+        stamp = self._current_stamp()
+        with self._lock:
+            if stamp != self._stamp:
+                self._parsed = {"files": [name for name, _, _ in stamp[1]]}
+                self._stamp = stamp
+
+    def _get(self, key, loader):
+        if self._stamp is None:
+            self.check()
+        with self._lock:
+            if key not in self._parsed:
+                self._parsed[key] = loader()
+            return self._parsed[key]
+
+    def _file(self, *names):
+        """Path of the first of names present in the folder (case-insensitive), or None."""
+        present = {n.upper(): n for n in self.files}
+        for name in names:
+            if name.upper() in present:
+                return os.path.join(self.path, present[name.upper()])
+        return None
+
+    # --- Parsed files ---
+    @property
+    def files(self):
+        """File names in the profile folder, sorted."""
+        return self._get("files", lambda: [])
+
+    @property
+    def ff_cfg(self):
+        """(options, problems) from FF.CFG; ({}, []) if there is none."""
+        def load():
+            path = self._file("FF.CFG")
+            return parse_ff_cfg(path) if path else ({}, [])
+        return self._get("ff_cfg", load)
+
+    @property
+    def img_cfg(self):
+        """(sections, problems) from IMG.CFG; ([], []) if there is none."""
+        def load():
+            path = self._file(*IMG_CFG_NAMES)
+            return parse_img_cfg(path) if path else ([], [])
+        return self._get("img_cfg", load)
+
+    @property
+    def startup_image(self):
+        """Image named in IMAGE_A.CFG, or None."""
+        def load():
+            path = self._file("IMAGE_A.CFG")
+            return parse_image_a_cfg(path) if path else None
+        return self._get("image_a", load)
+
+    @property
+    def has_convert(self):
+        return self._file("convert.txt") is not None
+
+    @property
+    def convert(self):
+        """
+        convert.txt as {"final_format", "conversions", "diskdef"} (see
+        utils.parse_convert_file). Shared between callers, do not modify.
+        Raises FileNotFoundError if the folder has no convert.txt.
+        """
+        def load():
+            path = self._file("convert.txt") or os.path.join(self.path, "convert.txt")
+            final_format, conversions = utils.parse_convert_file(path)
+            return {"final_format": final_format, "conversions": conversions,
+                    "diskdef": read_diskdef_name(path)}
+        return self._get("convert", load)
+
+    @property
+    def diskdef_name(self):
+        return self.convert["diskdef"] if self.has_convert else None
+
+    @property
+    def definition(self):
+        """The cpmtools disk definition named by DISKDEF:, or None."""
+        name = self.diskdef_name
+        if not name:
+            return None
+        diskdefs = get_diskdefs(self.tools_path)
+        return diskdefs.get(name) if diskdefs else None
+
+    # --- Views ---
+    def info(self):
+        """Summary dict for the UI: name, path, diskdef, definition, disksize, final_format."""
+        info = {"name": self.name, "path": self.path, "diskdef": self.diskdef_name,
+                "final_format": self.convert["final_format"] if self.has_convert else None}
+        definition = self.definition
+        if definition:
+            info.update({"definition": definition, "disksize": definition["capacity"]})
+        return info
+
+    def validate(self):
+        """Problems found in the profile's files, as a list of strings (empty if none)."""
+        problems = []
+        problems += self.ff_cfg[1]
+        sections, img_problems = self.img_cfg
+        problems += img_problems
+        for section in sections:
+            implied = img_section_size(section)
+            if section["size"] and implied and implied != section["size"]:
+                problems.append(f"IMG.CFG [{section['tag']}::{section['size']}]: geometry gives {implied} bytes")
+        if self.has_convert:
+            if not self.convert["final_format"]:
+                problems.append("convert.txt: FINALFORMAT not defined")
+            if self.diskdef_name and self.definition is None:
+                problems.append(f"convert.txt: diskdef '{self.diskdef_name}' not found")
+        return problems
 
 class ConfigurationsManager:
-    def __init__(self, configurations_path):
+    """Name-keyed index of the configuration profiles under configurations_path."""
+
+    def __init__(self, configurations_path, tools_path=None):
         self.configurations_path = configurations_path
-        self.diskdefs = []
-        if os.path.exists(configurations_path):
-            self._parse_configurations()
-
-            
-    def _parse_configurations(self):
-        """Populate self.diskdefs with subdirectories inside configurations_path."""
-        self.diskdefs = []   # clear previous list
-    
-        configs_dir = self.configurations_path
-    
-        if not os.path.isdir(configs_dir):
-            return  # nothing to load
-    
-        for entry in os.listdir(configs_dir):
-            full_path = os.path.join(configs_dir, entry)
-            if os.path.isdir(full_path):
-                self.diskdefs.append({
-                    "name": entry,
-                    "path": full_path
-                })
+        self.tools_path = tools_path
+        self.profiles = {}
+        self._stamp = None
+        self._lock = threading.Lock()
+        self.refresh()
 
+    def refresh(self):
+        """Rescan the folder list if configurations_path changed; parsed profiles are kept."""
+        try:
+            stamp = os.stat(self.configurations_path).st_mtime_ns
+        except OSError:
+            stamp = None
+        with self._lock:
+            if stamp == self._stamp:
+                return
+            profiles = {}
+            if stamp is not None:
+                with os.scandir(self.configurations_path) as it:
+                    for entry in it:
+                        if entry.is_dir():
+                            profiles[entry.name] = (self.profiles.get(entry.name)
+                                                    or ConfigurationProfile(entry.name, entry.path, self.tools_path))
+            self.profiles, self._stamp = profiles, stamp
 
     def get_disk_names(self):
-        return [d["name"] for d in self.diskdefs]
+        self.refresh()
+        return list(self.profiles)
+
+    def get_profile(self, name):
+        """The profile called name with its files re-checked (see ConfigurationProfile.check), or None."""
+        self.refresh()
+        profile = self.profiles.get(name)
+        if profile is not None:
+            try:
+                profile.check()
+            except OSError as e:
+                logger.debug(f"Configuration {name}: {e}")
+        return profile
 
     def get_disk_info(self, name):
-        for d in self.diskdefs:
-            if d["name"] == name:
-                return d
-        return None
+        profile = self.get_profile(name)
+        if profile is None:
+            return None
+        try:
+            return profile.info()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Configuration {name}: {e}")
+            return {"name": name, "path": profile.path}
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_configurations(configurations_path, tools_path=None):
+    """Return the shared ConfigurationsManager for configurations_path."""
+    key = os.path.abspath(configurations_path)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = ConfigurationsManager(key, tools_path)
+        elif tools_path and not manager.tools_path:
+            manager.tools_path = tools_path
+            for profile in manager.profiles.values():
+                profile.tools_path = tools_path
+        return manager
@@ -0,0 +1,186 @@
+# ffhelper_copy.py
+import os
+import sys
+import shutil
+import tempfile
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ffhelper_cache import hash_file
+from ffhelper_jobs import Job, JobCancelled, format_rate
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK = 8 * 1024 * 1024
+FICLONE = 0x40049409            # Linux ioctl: share extents (btrfs, XFS, bcachefs)
+# FAT and SMB round mtimes, so a copy's mtime may differ from the source by up to 2s
+MTIME_SLACK_NS = 2 * 1000 * 1000 * 1000
+
+# ----------------------------
+# Single file copy
+# ----------------------------
+def _reflink(src_fd, dst_fd):
+    import fcntl
+    fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+def _copy_file_range(src_fd, dst_fd, size):
+    offset = 0
+    while offset < size:
+        n = os.copy_file_range(src_fd, dst_fd, min(COPY_CHUNK, size - offset))
+        if n == 0:
+            break
+        offset += n
+    return offset
+
+def _sendfile(src_fd, dst_fd, size):
+    offset = 0
+    while offset < size:
+        n = os.sendfile(dst_fd, src_fd, offset, min(COPY_CHUNK, size - offset))
+        if n == 0:
+            break
+        offset += n
+    return offset
+
+def _copy_fds(src_fd, dst_fd, size):
+    """
+    Copy file contents kernel side where possible. Returns the method used:
+    'reflink', 'copy_file_range', 'sendfile' or 'read/write'.
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            _reflink(src_fd, dst_fd)
+            return "reflink"
+        except OSError:
+            pass
+        if hasattr(os, "copy_file_range"):
+            try:
+                if _copy_file_range(src_fd, dst_fd, size) == size:
+                    return "copy_file_range"
+            except OSError:
+                pass
+            os.lseek(src_fd, 0, os.SEEK_SET)
+            os.ftruncate(dst_fd, 0)
+            os.lseek(dst_fd, 0, os.SEEK_SET)
+        try:
+            if _sendfile(src_fd, dst_fd, size) == size:
+                return "sendfile"
+        except OSError:
+            pass
+        os.lseek(src_fd, 0, os.SEEK_SET)
+        os.ftruncate(dst_fd, 0)
+        os.lseek(dst_fd, 0, os.SEEK_SET)
+
+    with open(src_fd, "rb", closefd=False) as fsrc, open(dst_fd, "wb", closefd=False) as fdst:
+        shutil.copyfileobj(fsrc, fdst, COPY_CHUNK)
+    return "read/write"
+
+def fast_copy(src_path, dest_path, src_stat=None):
+    """
+    Copy src_path to dest_path (metadata like shutil.copy2) through a hidden
+    temp file in the destination folder, renamed into place when complete.
+    Returns the copy method used (see _copy_fds).
+    """
+    st = src_stat or os.stat(src_path)
+    dest_dir = os.path.dirname(dest_path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=dest_dir, prefix=".ffcopy-")
+    try:
+        if sys.platform == "darwin":
+            os.close(fd)
+            fd = None
+            shutil.copyfile(src_path, tmp_path)  # clonefile/fcopyfile on macOS
+            method = "copyfile"
+        else:
+            with open(src_path, "rb") as fsrc:
+                method = _copy_fds(fsrc.fileno(), fd, st.st_size)
+            os.close(fd)
+            fd = None
+        shutil.copystat(src_path, tmp_path)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if fd is not None:
+            os.close(fd)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return method
+
+def is_identical(src_path, dest_path, src_stat=None, verify_hash=False):
+    """True if dest_path already holds src_path: same size and mtime (within MTIME_SLACK_NS), optionally same hash."""
+    try:
+        dst = os.stat(dest_path)
+    except OSError:
+        return False
+    src = src_stat or os.stat(src_path)
+    if src.st_size != dst.st_size or abs(src.st_mtime_ns - dst.st_mtime_ns) > MTIME_SLACK_NS:
+        return False
+    if verify_hash:
+        return hash_file(src_path) == hash_file(dest_path)
+    return True
+
+# ----------------------------
+# Bulk copy
+# ----------------------------
+def _copy_one(src_path, dest_path, skip_identical, verify_hash, job):
+    job.check()
+    st = os.stat(src_path)
+    if skip_identical and is_identical(src_path, dest_path, st, verify_hash):
+        job.advance(1)
+        return {"file": os.path.basename(src_path), "dest": dest_path, "action": "skip", "bytes": 0}
+    with job.stage("copy"):
+        method = fast_copy(src_path, dest_path, st)
+    job.advance(1, st.st_size)
+    return {"file": os.path.basename(src_path), "dest": dest_path, "action": "copy",
+            "bytes": st.st_size, "method": method}
+
+def bulk_copy(src_folder, files, dest_dir, workers=4, skip_identical=True, verify_hash=False, job=None):
+    """
+    Copy files (names in src_folder) into dest_dir on a bounded thread pool.
+
+    Files whose copy in dest_dir already matches (see is_identical) are skipped.
+    job (ffhelper_jobs.Job) receives progress and is checked for cancellation
+    before each file. Returns a report dict:
+        {"copied": [result], "skipped": [result], "errors": [{"file", "error"}],
+         "cancelled": [names], "bytes": int, "elapsed": float, "rate": bytes/s,
+         "methods": {method: count}, "job": Job.summary()}
+    """
+    files = list(files)
+    job = job or Job("Copy")
+    job.add_totals(files=len(files))
+    os.makedirs(dest_dir, exist_ok=True)
+    report = {"copied": [], "skipped": [], "errors": [], "cancelled": [], "bytes": 0}
+    methods = Counter()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            pool.submit(_copy_one, os.path.join(src_folder, name), os.path.join(dest_dir, name),
+                        skip_identical, verify_hash, job): name
+            for name in files
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except JobCancelled:
+                report["cancelled"].append(name)
+                continue
+            except Exception as e:
+                logger.error(f"Copy of {name} failed: {e}")
+                report["errors"].append({"file": name, "error": str(e)})
+                continue
+            if result["action"] == "skip":
+                report["skipped"].append(result)
+            else:
+                report["copied"].append(result)
+                report["bytes"] += result["bytes"]
+                methods[result["method"]] += 1
+
+    report["job"] = job.finish()
+    elapsed = report["job"]["elapsed"]
+    report["elapsed"] = elapsed
+    report["rate"] = report["bytes"] / elapsed if elapsed > 0 else 0.0
+    report["methods"] = dict(methods)
+    logger.info(f"Bulk copy to {dest_dir}: {len(report['copied'])} copied, {len(report['skipped'])} skipped, "
+                f"{len(report['errors'])} failed, {len(report['cancelled'])} cancelled, "
+                f"{report['bytes']:,} bytes in {elapsed:.2f}s "
+                f"({format_rate(report['rate'])}) {report['methods']}")
+    return report
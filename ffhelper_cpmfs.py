@@ -0,0 +1,318 @@
+# ffhelper_cpmfs.py
+import os
+import re
+import fnmatch
+import hashlib
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from ffhelper_planner import file_format
+from ffhelper_diskimage import decode_edsk
+import ffhelper_imd as imd
+import ffhelper_dmk as dmk
+
+logger = logging.getLogger(__name__)
+
+DIR_ENTRY_SIZE = 32
+RECORD = 128
+EXTENT_RECORDS = 128            # one logical extent maps 16K
+DELETED = 0xE5
+MAX_USER = 15
+LABEL_USER = 0x20               # CP/M 3 directory label
+LIST_WORKERS = 4
+MEMORY_CACHE_SIZE = 2048
+
+DECODERS = {"IMD": imd.decode_imd, "DMK": dmk.decode_dmk, "DSK": decode_edsk, "EDSK": decode_edsk}
+OFFSET_PATTERN = re.compile(r"^\s*(\d+)\s*(trk|sec)?\s*$", re.IGNORECASE)
+
+class CPMError(ValueError):
+    """Raised when an image cannot be read as a CP/M filesystem of the given definition."""
+
+# ----------------------------
+# Geometry
+# ----------------------------
+def skew_table(d):
+    """Logical to physical sector numbers for one track (cpmtools rules: skewtab, else skew)."""
+    sectrk = d["sectrk"]
+    if d.get("skewtab"):
+        table = [int(v) for v in str(d["skewtab"]).split(",")]
+        if len(table) < sectrk or any(not 0 <= v < sectrk for v in table[:sectrk]):
+            raise CPMError(f"Bad skewtab for {d['name']}")
+        return table[:sectrk]
+    skew = d.get("skew") or 0
+    if skew <= 1:
+        return list(range(sectrk))
+    table, used, j = [], set(), 0
+    for _ in range(sectrk):
+        while j in used:
+            j = (j + 1) % sectrk
+        table.append(j)
+        used.add(j)
+        j = (j + skew) % sectrk
+    return table
+
+def offset_sectors(d):
+    """The definition's 'offset' (bytes, or Ntrk / Nsec) in sectors."""
+    value = d.get("offset")
+    if value in (None, ""):
+        return 0
+    m = OFFSET_PATTERN.match(str(value))
+    if not m:
+        raise CPMError(f"Bad offset '{value}' for {d['name']}")
+    n, unit = int(m.group(1)), (m.group(2) or "").lower()
+    if unit == "trk":
+        return n * d["sectrk"]
+    if unit == "sec":
+        return n
+    return n // d["seclen"]
+
+# ----------------------------
+# Filesystem
+# ----------------------------
+class CPMFileSystem:
+    """
+    Read-only view of a CP/M filesystem laid out by a cpmtools definition
+    (see ffhelper_diskdefs). The source is a DiskImage whose sectors are used
+    in cylinder/head/sector ID order, or the bytes of a raw image. Directory
+    entries and file data are memoryview slices of the sector data; nothing is
+    copied until read_file() joins a file's blocks.
+    """
+
+    def __init__(self, source, definition):
+        d = definition
+        self.definition = d
+        self.seclen, self.sectrk = d["seclen"], d["sectrk"]
+        self.blocksize = d["blocksize"]
+        self.skew = skew_table(d)
+        self.first_sector = offset_sectors(d) + d.get("boottrk", 0) * self.sectrk
+        self.wide_pointers = d["total_blocks"] > 256
+        self.sectors = self._sector_views(source)
+
+    def _sector_views(self, source):
+        """One memoryview per physical sector, in image order."""
+        seclen = self.seclen
+        if hasattr(source, "iter_sectors"):
+            sectors = [s.data for s in source.iter_sectors()]
+            if all(len(data) == seclen for data in sectors):
+                return [data if isinstance(data, memoryview) else memoryview(data) for data in sectors]
+            # mixed sector sizes (e.g. a different boot track): address the data as a raw dump
+            source = b"".join(bytes(data) for data in sectors)
+        mv = memoryview(source)
+        return [mv[i:i + seclen] for i in range(0, len(mv) - seclen + 1, seclen)]
+
+    def _sector(self, logical):
+        """Sector view for a logical sector number counted from the first data track."""
+        absolute = self.first_sector + logical
+        track, sector = divmod(absolute, self.sectrk)
+        index = track * self.sectrk + self.skew[sector]
+        if index >= len(self.sectors):
+            raise CPMError(f"Image too short for {self.definition['name']}: no sector {index}")
+        return self.sectors[index]
+
+    def block(self, number):
+        """The sectors of allocation block number, as memoryviews."""
+        per_block = self.blocksize // self.seclen
+        return [self._sector(number * per_block + i) for i in range(per_block)]
+
+    def entries(self):
+        """Directory entries as memoryviews of 32 bytes, maxdir of them."""
+        entries = []
+        per_sector = self.seclen // DIR_ENTRY_SIZE
+        maxdir = self.definition["maxdir"]
+        logical = 0
+        while len(entries) < maxdir:
+            view = self._sector(logical)
+            for i in range(per_sector):
+                entries.append(view[i * DIR_ENTRY_SIZE:(i + 1) * DIR_ENTRY_SIZE])
+            logical += 1
+        return entries[:maxdir]
+
+    def _pointers(self, entry):
+        if self.wide_pointers:
+            return [entry[i] | entry[i + 1] << 8 for i in range(16, 32, 2)]
+        return list(entry[16:32])
+
+    def directory(self):
+        """
+        Parse the directory. Returns (files, label, bad): files is
+        {(user, "NAME.EXT"): {"user", "name", "records", "blocks": [block numbers],
+        "read_only", "system", "archived"}}, label the CP/M 3 label or None,
+        bad the number of entries that are not valid CP/M entries.
+        """
+        files, label, bad = {}, None, 0
+        extents = {}
+        for entry in self.entries():
+            user = entry[0]
+            if user == DELETED:
+                continue
+            if user == LABEL_USER:
+                label = _entry_name(entry)
+                continue
+            if user > MAX_USER:
+                continue        # timestamps and other CP/M 3 / ZSDOS records
+            name = _entry_name(entry)
+            if name is None:
+                bad += 1
+                continue
+            extent = (entry[14] & 0x3F) << 5 | (entry[12] & 0x1F)
+            extents.setdefault((user, name), []).append((extent, entry[15], entry))
+
+        for key, parts in extents.items():
+            parts.sort(key=lambda part: part[0])
+            last_extent, last_rc, _ = parts[-1]
+            blocks = []
+            for _, _, entry in parts:
+                blocks += [b for b in self._pointers(entry) if b]
+            first = parts[0][2]
+            files[key] = {"user": key[0], "name": key[1],
+                          "records": last_extent * EXTENT_RECORDS + min(last_rc, EXTENT_RECORDS),
+                          "blocks": blocks,
+                          "read_only": bool(first[9] & 0x80), "system": bool(first[10] & 0x80),
+                          "archived": bool(first[11] & 0x80)}
+        return files, label, bad
+
+    def listing(self):
+        """
+        Directory listing as a plain dict (cacheable):
+            {"diskdef", "label", "files": [{"user", "name", "size", "blocks",
+             "read_only", "system", "archived"}], "used", "free", "dir_used",
+             "dir_free", "bad_entries"}
+        size is the record count times 128, as CP/M knows it.
+        """
+        d = self.definition
+        files, label, bad = self.directory()
+        out, used_blocks = [], 0
+        for (user, name), f in sorted(files.items(), key=lambda item: (item[0][1], item[0][0])):
+            used_blocks += len(f["blocks"])
+            out.append({"user": user, "name": name, "size": f["records"] * RECORD, "blocks": len(f["blocks"]),
+                        "read_only": f["read_only"], "system": f["system"], "archived": f["archived"]})
+        dir_used = sum(1 for entry in self.entries() if entry[0] <= MAX_USER)
+        used = used_blocks * self.blocksize
+        return {"diskdef": d["name"], "label": label, "files": out,
+                "used": used, "free": max(d["capacity"] - used, 0),
+                "dir_used": dir_used, "dir_free": max(d["maxdir"] - dir_used, 0), "bad_entries": bad}
+
+    def read_file(self, name, user=0):
+        """Contents of a file (bytes, trimmed to its record count). Raises KeyError if not found."""
+        f = self.directory()[0][(user, name.upper())]
+        data = b"".join(view for number in f["blocks"] for view in self.block(number))
+        return data[:f["records"] * RECORD]
+
+def _entry_name(entry):
+    """'NAME.EXT' of a directory entry (attribute bits masked), or None if it holds non-printable bytes."""
+    chars = bytes(b & 0x7F for b in entry[1:12])
+    if any(c < 0x20 or c == 0x7F for c in chars):
+        return None
+    name = chars[:8].decode("ascii").rstrip()
+    ext = chars[8:].decode("ascii").rstrip()
+    if not name:
+        return None
+    return f"{name}.{ext}" if ext else name
+
+# ----------------------------
+# Images
+# ----------------------------
+def open_image(data, fmt):
+    """Source for CPMFileSystem from an image's bytes: a decoded DiskImage, or the bytes of a raw dump."""
+    decoder = DECODERS.get(fmt)
+    if decoder is not None:
+        try:
+            return decoder(data)
+        except ValueError:
+            if fmt != "DSK":
+                raise
+            # a .DSK without a CPC header is a raw dump (cpmtools' default)
+    return data
+
+def definition_key(definition):
+    """
+    Cache key for listings read with definition: its name plus a hash of its
+    parameters, so editing a diskdef does not serve listings of the old one.
+    """
+    params = sorted((k, str(v)) for k, v in definition.items() if k not in ("label", "line"))
+    digest = hashlib.sha1(repr(params).encode("utf-8")).hexdigest()[:12]
+    return f"{definition['name']}@{digest}"
+
+def read_listing(data, definition, fmt):
+    """Listing of the image held in data (bytes) read with definition. Raises ValueError (incl. CPMError)."""
+    return CPMFileSystem(open_image(data, fmt), definition).listing()
+
+_listings = {}
+_listings_lock = threading.Lock()
+
+def _cached(digest, key, catalog):
+    with _listings_lock:
+        listing = _listings.get((digest, key))
+    if listing is None and catalog is not None:
+        listing = catalog.get_cpm_listing(digest, key)
+        if listing is not None:
+            _remember(digest, key, listing)
+    return listing
+
+def _remember(digest, key, listing):
+    with _listings_lock:
+        if len(_listings) >= MEMORY_CACHE_SIZE:
+            _listings.pop(next(iter(_listings)))
+        _listings[(digest, key)] = listing
+
+def cached_listing(path, definition, fmt=None, catalog=None):
+    """
+    Listing of the image at path, cached by the image's sha256 and the
+    definition (see definition_key): in memory, and in the image catalog when one is given
+    (the catalog's sha256 for an unchanged file also saves reading it).
+    An image that cannot be read as CP/M gets {"diskdef", "error", "files": []}.
+    Raises OSError if the file cannot be read.
+    """
+    key = definition_key(definition)
+    if catalog is not None:
+        row = catalog.lookup(path)
+        st = os.stat(path)
+        if row and row["size"] == st.st_size and row["mtime"] == st.st_mtime_ns:
+            fmt = fmt or row["format"]
+            listing = _cached(row["sha256"], key, catalog)
+            if listing is not None:
+                return listing
+
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    listing = _cached(digest, key, catalog)      # same disk seen under another path
+    if listing is None:
+        try:
+            listing = read_listing(data, definition, (fmt or file_format(path)).upper())
+        except ValueError as e:
+            listing = {"diskdef": definition["name"], "error": str(e), "files": []}
+        _remember(digest, key, listing)
+        if catalog is not None:
+            catalog.store_cpm_listing(digest, key, listing)
+    return listing
+
+def list_folder(folder, names, definition, formats=None, catalog=None, workers=None):
+    """cached_listing() for names in folder on a thread pool. Returns {name: listing}."""
+    formats = formats or {}
+
+    def work(name):
+        try:
+            return name, cached_listing(os.path.join(folder, name), definition, formats.get(name), catalog)
+        except OSError as e:
+            return name, {"diskdef": definition["name"], "error": str(e), "files": []}
+
+    names = list(names)
+    if not names:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers or LIST_WORKERS, len(names)))) as pool:
+        return dict(pool.map(work, names))
+
+def find_files(listings, pattern):
+    """
+    [(image name, file entry)] for CP/M files matching pattern (case-insensitive
+    glob like '*.BAS', or a substring) across {image name: listing}.
+    """
+    pattern = pattern.upper()
+    glob = "*" in pattern or "?" in pattern
+    matches = []
+    for image, listing in sorted(listings.items()):
+        for f in listing.get("files", ()):
+            if fnmatch.fnmatchcase(f["name"], pattern) if glob else pattern in f["name"]:
+                matches.append((image, f))
+    return matches
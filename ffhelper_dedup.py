@@ -0,0 +1,163 @@
+# ffhelper_dedup.py
+import os
+import hashlib
+import threading
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from ffhelper_planner import file_format
+from ffhelper_diskimage import decode_edsk
+import ffhelper_imd as imd
+import ffhelper_dmk as dmk
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK = 4 * 1024 * 1024
+PAYLOAD_MAX_BYTES = 16 * 1024 * 1024    # larger files are only hashed as files
+HASH_WORKERS = 4
+
+# Raw sector dumps: the file is its own payload, in track/sector order
+RAW_FORMATS = {"IMG", "IMA", "ST", "ADF", "RAW"}
+PAYLOAD_DECODERS = {"IMD": imd.decode_imd, "DMK": dmk.decode_dmk, "DSK": decode_edsk, "EDSK": decode_edsk}
+
+# ----------------------------
+# Hashing
+# ----------------------------
+def payload_hash(image):
+    """sha256 of the sector data only, in cylinder/head/sector ID order (as in a raw dump)."""
+    h = hashlib.sha256()
+    for sector in image.iter_sectors():
+        h.update(sector.data)
+    return h.hexdigest()
+
+def hash_image(path, fmt=None, decode=True):
+    """
+    {"sha256": file hash, "payload": sector payload hash or None}. The payload
+    hash is the same for one disk stored as IMD, DMK, DSK/EDSK or a raw dump
+    (including a raw dump named .DSK); it is None for formats without a decoder (TD0, HFE) or that fail to decode.
+    With decode False only the file is hashed (payload None unless raw).
+    The file is read once, in READ_CHUNK pieces when it is not decoded.
+    """
+    fmt = (fmt or file_format(path)).upper()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size > PAYLOAD_MAX_BYTES or not decode:
+            h = hashlib.sha256()
+            for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+                h.update(chunk)
+            digest = h.hexdigest()
+            return {"sha256": digest, "payload": digest if fmt in RAW_FORMATS else None}
+        data = f.read()
+
+    digest = hashlib.sha256(data).hexdigest()
+    if fmt in RAW_FORMATS:
+        return {"sha256": digest, "payload": digest}
+    payload = None
+    decoder = PAYLOAD_DECODERS.get(fmt)
+    if decoder:
+        try:
+            image = decoder(data)
+            if image.sector_count():    # an empty decode would match every other empty one
+                payload = payload_hash(image)
+        except ValueError as e:
+            if fmt == "DSK":
+                payload = digest    # a .DSK without a CPC header is a raw dump (as in ffhelper_cpmfs)
+            else:
+                logger.debug(f"hash_image {path}: no payload hash ({e})")
+    return {"sha256": digest, "payload": payload}
+
+_hashes = {}
+_hashes_lock = threading.Lock()
+
+def hash_files(folder, names, formats=None, workers=None, decode=True):
+    """
+    hash_image() for names in folder on a thread pool (hashlib releases the
+    GIL on large buffers). Results are cached by path, size, mtime and decode.
+    Returns ({name: hashes}, [unreadable names]).
+    """
+    formats = formats or {}
+
+    def work(name):
+        path = os.path.join(folder, name)
+        try:
+            st = os.stat(path)
+            fmt = formats.get(name) or file_format(name)
+            key = (path, st.st_size, st.st_mtime_ns, fmt, decode)
+            with _hashes_lock:
+                cached = _hashes.get(key)
+            if cached is None and not decode:
+                with _hashes_lock:
+                    cached = _hashes.get(key[:-1] + (True,))     # a full hash has the file hash too
+            if cached is None:
+                cached = hash_image(path, fmt, decode)
+                with _hashes_lock:
+                    _hashes[key] = cached
+            return name, cached
+        except OSError as e:
+            logger.warning(f"Duplicate check: cannot read {name}: {e}")
+            return name, None
+
+    names = list(names)
+    results, unreadable = {}, []
+    if not names:
+        return results, unreadable
+    with ThreadPoolExecutor(max_workers=max(1, min(workers or HASH_WORKERS, len(names)))) as pool:
+        for name, hashes in pool.map(work, names):
+            if hashes is None:
+                unreadable.append(name)
+            else:
+                results[name] = hashes
+    return results, unreadable
+
+# ----------------------------
+# Duplicate groups
+# ----------------------------
+def find_duplicates(folder, names, formats=None, routes=None, workers=None, decode=True):
+    """
+    Group the staged files that hold the same disk: byte-identical files, and
+    files whose sector payloads match across container formats.
+
+    decode: compare sector payloads (decodes every image). When False only
+        byte-identical files are found, and only files that share their size
+        with another file are read at all.
+
+    formats: {name: FORMAT} (see logic.detect_formats), default by extension.
+    routes: {FORMAT: route} from the planner; the file with the shortest route
+        (a plain copy first) is kept from each group, then the first by name.
+    Returns {"groups": [{"files", "keep", "identical"}], "skip": [names],
+             "unreadable": [names]}.
+    """
+    formats = formats or {}
+    names = list(names)
+    if not decode:
+        sizes = {}
+        for name in names:
+            try:
+                sizes[name] = os.path.getsize(os.path.join(folder, name))
+            except OSError:
+                sizes[name] = None      # hash_files reports it as unreadable
+        counts = Counter(sizes.values())
+        names = [name for name in names if sizes[name] is None or counts[sizes[name]] > 1]
+    hashes, unreadable = hash_files(folder, names, formats, workers, decode)
+
+    by_key = {}
+    for name, h in hashes.items():
+        by_key.setdefault(h["payload"] or h["sha256"], []).append(name)
+
+    def cost(name):
+        route = (routes or {}).get(formats.get(name) or file_format(name))
+        return (len(route) if route is not None else 0, name)
+
+    groups, skip = [], []
+    for files in by_key.values():
+        if len(files) < 2:
+            continue
+        files.sort()
+        keep = min(files, key=cost)
+        groups.append({"files": files, "keep": keep,
+                       "identical": len({hashes[n]["sha256"] for n in files}) == 1})
+        skip += [name for name in files if name != keep]
+    groups.sort(key=lambda g: g["keep"])
+    if groups:
+        logger.info(f"Duplicate check {folder}: {len(groups)} group(s), {len(skip)} redundant file(s)")
+    return {"groups": groups, "skip": sorted(skip), "unreadable": sorted(unreadable)}
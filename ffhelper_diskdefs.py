@@ -0,0 +1,225 @@
+# ffhelper_diskdefs.py
+import os
+import glob
+import hashlib
+import pickle
+import tempfile
+import threading
+import logging
+from ffhelper_utils import get_resource_path
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+DIR_ENTRY_SIZE = 32
+NUMERIC_KEYS = ("seclen", "tracks", "sectrk", "blocksize", "maxdir", "boottrk", "skew", "dirblks")
+
+# ----------------------------
+# Parsing
+# ----------------------------
+def _split_comment(line):
+    """('code', 'comment') for a diskdefs line; '#=' comments are descriptions."""
+    code, _, comment = line.partition("#")
+    return code.strip(), comment.lstrip("=").strip()
+
+def parse_diskdefs(path):
+    """
+    Parse a cpmtools diskdefs file into {name: definition dict}.
+    Numeric keys are ints; anything else is kept as text. Each definition
+    also gets a "label" (its #= description or the comment line above it)
+    and the computed geometry from compute_geometry().
+    """
+    defs = {}
+    current = None
+    last_comment = ""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for lineno, raw in enumerate(f, 1):
+            code, comment = _split_comment(raw)
+            if not code:
+                if comment and current is None:
+                    last_comment = comment
+                elif not raw.strip():
+                    last_comment = ""
+                continue
+            words = code.split(None, 1)
+            key = words[0]
+            value = words[1].strip() if len(words) > 1 else ""
+            if key == "diskdef":
+                current = {"name": value, "label": comment or last_comment, "line": lineno}
+                last_comment = ""
+            elif key == "end":
+                if current is not None:
+                    try:
+                        current.update(compute_geometry(current))
+                    except (KeyError, ValueError, ZeroDivisionError) as e:
+                        logger.debug(f"diskdefs {path}:{current['line']}: skipping {current['name']}: {e}")
+                    else:
+                        defs[current["name"]] = current
+                current = None
+            elif current is not None:
+                if key in NUMERIC_KEYS:
+                    try:
+                        current[key] = int(value)
+                        continue
+                    except ValueError:
+                        pass
+                current[key.lower()] = value
+    return defs
+
+def compute_geometry(d):
+    """
+    Sizes derived from a definition:
+        image_bytes  - raw image size (all tracks)
+        total_blocks - allocation blocks after the boot tracks
+        dir_blocks   - blocks reserved for the directory
+        capacity     - bytes available for file data
+        extent_bytes - bytes one directory entry can map
+    """
+    track_bytes = d["sectrk"] * d["seclen"]
+    data_bytes = (d["tracks"] - d.get("boottrk", 0)) * track_bytes
+    total_blocks = data_bytes // d["blocksize"]
+    dir_blocks = -(-d["maxdir"] * DIR_ENTRY_SIZE // d["blocksize"])
+    return {
+        "image_bytes": d["tracks"] * track_bytes,
+        "total_blocks": total_blocks,
+        "dir_blocks": dir_blocks,
+        "capacity": max(total_blocks - dir_blocks, 0) * d["blocksize"],
+        # 16 one-byte block pointers per entry on small disks, 8 two-byte ones otherwise
+        "extent_bytes": d["blocksize"] * (16 if total_blocks <= 256 else 8),
+    }
+
+# ----------------------------
+# Capacity math
+# ----------------------------
+def file_usage(d, size):
+    """(blocks, directory entries) a file of size bytes takes on a disk of definition d."""
+    blocks = -(-size // d["blocksize"])
+    entries = max(1, -(-size // d["extent_bytes"]))
+    return blocks, entries
+
+def disk_usage(d, sizes):
+    """
+    Space a set of files (byte sizes) takes on a disk of definition d:
+        {"used": bytes incl. block rounding, "free": bytes, "capacity": bytes,
+         "dir_used": entries, "dir_free": entries, "fits": bool}
+    """
+    blocks = entries = 0
+    for size in sizes:
+        b, e = file_usage(d, size)
+        blocks += b
+        entries += e
+    used = blocks * d["blocksize"]
+    return {
+        "used": used,
+        "free": max(d["capacity"] - used, 0),
+        "capacity": d["capacity"],
+        "dir_used": entries,
+        "dir_free": max(d["maxdir"] - entries, 0),
+        "fits": used <= d["capacity"] and entries <= d["maxdir"],
+    }
+
+# ----------------------------
+# Cached lookup
+# ----------------------------
+class DiskDefs:
+    """
+    All definitions of one diskdefs file, with lookups by name and by raw
+    image size. The parse is pickled under cache/ and reused until the
+    file's mtime or size changes.
+    """
+
+    def __init__(self, path, cache_dir=None):
+        self.path = os.path.abspath(path)
+        self.cache_dir = cache_dir or get_resource_path("cache")
+        self.defs = {}
+        self.by_size = {}
+        self._stamp = None
+        self._lock = threading.Lock()
+        self.reload_if_changed()
+
+    def _cache_path(self):
+        digest = hashlib.sha1(self.path.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.cache_dir, f"diskdefs-{digest}.pickle")
+
+    def _load_cache(self, stamp):
+        try:
+            with open(self._cache_path(), "rb") as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.debug(f"Ignoring diskdefs cache: {e}")
+            return None
+        if data.get("version") != CACHE_VERSION or data.get("path") != self.path or data.get("stamp") != stamp:
+            return None
+        return data["defs"]
+
+    def _save_cache(self, stamp, defs):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".diskdefs.", suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump({"version": CACHE_VERSION, "path": self.path, "stamp": stamp, "defs": defs},
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._cache_path())
+        except Exception as e:
+            logger.warning(f"Could not save diskdefs cache: {e}")
+
+    def reload_if_changed(self):
+        """Re-read the definitions if the file changed since the last load. Returns True if it did."""
+        st = os.stat(self.path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if stamp == self._stamp:
+                return False
+            defs = self._load_cache(stamp)
+            if defs is None:
+                defs = parse_diskdefs(self.path)
+                self._save_cache(stamp, defs)
+                logger.info(f"Parsed {len(defs)} disk definitions from {self.path}")
+            by_size = {}
+            for name, d in defs.items():
+                by_size.setdefault(d["image_bytes"], []).append(name)
+            self.defs, self.by_size, self._stamp = defs, by_size, stamp
+        return True
+
+    def names(self):
+        return sorted(self.defs)
+
+    def get(self, name):
+        """Definition dict for name, or None."""
+        return self.defs.get(name)
+
+    def matching_size(self, image_bytes):
+        """Names of definitions whose raw image is exactly image_bytes long."""
+        return list(self.by_size.get(image_bytes, ()))
+
+def find_diskdefs(tools_path=None):
+    """Locate a diskdefs file: in tools_path, then the shipped support/* folders. Returns a path or None."""
+    candidates = []
+    if tools_path:
+        candidates += [os.path.join(tools_path, "libdskcpmtools", "diskdefs"), os.path.join(tools_path, "diskdefs")]
+    candidates += sorted(glob.glob(os.path.join(get_resource_path("support"), "*", "libdskcpmtools", "diskdefs")))
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+    return None
+
+_diskdefs = {}
+_diskdefs_lock = threading.Lock()
+
+def get_diskdefs(tools_path=None):
+    """
+    Return the shared DiskDefs for the diskdefs file found by find_diskdefs(),
+    reloaded if the file changed; None if there is no diskdefs file.
+    """
+    path = find_diskdefs(tools_path)
+    if path is None:
+        return None
+    with _diskdefs_lock:
+        diskdefs = _diskdefs.get(path)
+        if diskdefs is None:
+            diskdefs = _diskdefs[path] = DiskDefs(path)
+            return diskdefs
+    diskdefs.reload_if_changed()
+    return diskdefs
@@ -0,0 +1,286 @@
+# ffhelper_diskimage.py
+import struct
+import logging
+
+logger = logging.getLogger(__name__)
+
+WRITE_BUFFER = 1024 * 1024
+
+class Sector:
+    """One decoded sector. data is bytes or a memoryview slice of the source image."""
+    __slots__ = ("cyl", "head", "sector", "data", "deleted", "bad")
+
+    def __init__(self, cyl, head, sector, data, deleted=False, bad=False):
+        self.cyl = cyl
+        self.head = head
+        self.sector = sector
+        self.data = data
+        self.deleted = deleted
+        self.bad = bad
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    @property
+    def size_code(self):
+        """IBM size code N where size = 128 << N."""
+        return max(len(self.data) >> 7, 1).bit_length() - 1
+
+    def __repr__(self):
+        return f"Sector(c={self.cyl}, h={self.head}, s={self.sector}, {self.size} bytes)"
+
+class Track:
+    """
+    One physical track (cylinder/head) with its sectors in physical order.
+    mfm: True for MFM (double density), False for FM (single density)
+    rate: controller data rate in kbps (250, 300 or 500)
+    """
+    __slots__ = ("cyl", "head", "mfm", "rate", "sectors")
+
+    def __init__(self, cyl, head, mfm=True, rate=250, sectors=None):
+        self.cyl = cyl
+        self.head = head
+        self.mfm = mfm
+        self.rate = rate
+        self.sectors = sectors if sectors is not None else []
+
+    def ordered(self):
+        """Sectors sorted by sector ID (logical order)."""
+        return sorted(self.sectors, key=lambda s: s.sector)
+
+    def __repr__(self):
+        mode = "MFM" if self.mfm else "FM"
+        return f"Track(c={self.cyl}, h={self.head}, {mode} {self.rate}k, {len(self.sectors)} sectors)"
+
+class DiskImage:
+    """Format independent track/sector model shared by the native codecs."""
+
+    def __init__(self, tracks=None, source_format="", comment=""):
+        self.tracks = tracks if tracks is not None else []
+        self.source_format = source_format
+        self.comment = comment
+
+    @property
+    def cylinders(self):
+        return max((t.cyl for t in self.tracks), default=-1) + 1
+
+    @property
+    def heads(self):
+        return max((t.head for t in self.tracks), default=-1) + 1
+
+    def iter_tracks(self):
+        """Tracks in cylinder/head order."""
+        return iter(sorted(self.tracks, key=lambda t: (t.cyl, t.head)))
+
+    def iter_sectors(self):
+        """Sectors in cylinder/head/sector ID order, as laid out in a raw DSK."""
+        for track in self.iter_tracks():
+            yield from track.ordered()
+
+    def get_track(self, cyl, head):
+        for track in self.tracks:
+            if track.cyl == cyl and track.head == head:
+                return track
+        return None
+
+    def sector_count(self):
+        return sum(len(t.sectors) for t in self.tracks)
+
+    def data_size(self):
+        return sum(s.size for t in self.tracks for s in t.sectors)
+
+    def write_raw(self, fileobj):
+        """Stream sector payloads in raw DSK order to an open binary file. Returns bytes written."""
+        written = 0
+        for sector in self.iter_sectors():
+            fileobj.write(sector.data)
+            written += len(sector.data)
+        return written
+
+    def __repr__(self):
+        return (f"DiskImage({self.source_format or '?'}: {self.cylinders} cyls, "
+                f"{self.heads} heads, {self.sector_count()} sectors)")
+
+def write_raw_dsk(image, out_path):
+    """Write a DiskImage as a flat raw sector dump (.DSK/.IMG). Returns out_path."""
+    with open(out_path, "wb", buffering=WRITE_BUFFER) as f:
+        written = image.write_raw(f)
+    logger.debug(f"write_raw_dsk wrote {written:,} bytes to {out_path}")
+    return out_path
+
+# ----------------------------
+# Extended CPC DSK (EDSK)
+# ----------------------------
+EDSK_SIGNATURE = b"EXTENDED CPC DSK File\r\nDisk-Info\r\n"
+EDSK_CREATOR = b"FFHelper"
+EDSK_TRACK_SIGNATURE = b"Track-Info\r\n"
+EDSK_BLOCK = 256
+EDSK_FILLER = 0xE5
+EDSK_GAP3 = 0x4E
+
+ST1_DATA_ERROR = 0x20
+ST2_DATA_ERROR = 0x20
+ST2_CONTROL_MARK = 0x40     # deleted data address mark
+
+def _edsk_track_sizes(track):
+    """(header_size, block_size) of a track's EDSK Track-Info block."""
+    header_size = -(-(0x18 + 8 * len(track.sectors)) // EDSK_BLOCK) * EDSK_BLOCK
+    data_size = sum(s.size for s in track.sectors)
+    return header_size, -(-(header_size + data_size) // EDSK_BLOCK) * EDSK_BLOCK
+
+def edsk_size(image):
+    """Size in bytes of the EDSK file write_edsk() would produce."""
+    return EDSK_BLOCK + sum(_edsk_track_sizes(t)[1] for t in image.tracks if t.sectors)
+
+def _edsk_track_block(track):
+    """Build one EDSK Track-Info block plus its sector data."""
+    sectors = track.sectors
+    header_size, block_size = _edsk_track_sizes(track)
+
+    block = bytearray(block_size)
+    size_code = sectors[0].size_code if sectors else 2
+    rate = 2 if track.rate >= 500 else 1
+    struct.pack_into("<12s4xBBBBBBBB", block, 0, EDSK_TRACK_SIGNATURE,
+                     track.cyl, track.head, rate, 2 if track.mfm else 1,
+                     size_code, len(sectors), EDSK_GAP3, EDSK_FILLER)
+
+    offset = header_size
+    for i, s in enumerate(sectors):
+        st1 = ST1_DATA_ERROR if s.bad else 0
+        st2 = (ST2_DATA_ERROR if s.bad else 0) | (ST2_CONTROL_MARK if s.deleted else 0)
+        struct.pack_into("<BBBBBBH", block, 0x18 + 8 * i,
+                         s.cyl, s.head, s.sector, s.size_code, st1, st2, s.size)
+        block[offset:offset + s.size] = s.data
+        offset += s.size
+    return block
+
+def write_edsk(image, out_path):
+    """Write a DiskImage as an Extended CPC DSK file in one buffered write. Returns out_path."""
+    cyls = image.cylinders
+    heads = image.heads
+    by_pos = {(t.cyl, t.head): t for t in image.tracks}
+
+    blocks = []
+    size_table = bytearray(cyls * heads)
+    for cyl in range(cyls):
+        for head in range(heads):
+            track = by_pos.get((cyl, head))
+            if track is None or not track.sectors:
+                continue  # unformatted track, size 0
+            block = _edsk_track_block(track)
+            size_table[cyl * heads + head] = len(block) // EDSK_BLOCK
+            blocks.append(block)
+
+    header = bytearray(EDSK_BLOCK)
+    struct.pack_into("<34s14sBB", header, 0, EDSK_SIGNATURE, EDSK_CREATOR, cyls, heads)
+    header[0x34:0x34 + len(size_table)] = size_table
+
+    with open(out_path, "wb", buffering=WRITE_BUFFER) as f:
+        f.write(header)
+        f.writelines(blocks)
+    logger.debug(f"write_edsk wrote {cyls} cyls x {heads} heads to {out_path}")
+    return out_path
+
+# ----------------------------
+# Standard CPC DSK ("MV - CPC", libdsk's "dsk" type)
+# ----------------------------
+DSK_SIGNATURE = b"MV - CPC"
+DSK_HEADER = b"MV - CPCEMU Disk-File\r\nDisk-Info\r\n"
+DSK_MAX_SECTORS = 29            # sector infos that fit the fixed 256-byte Track-Info header
+
+def _cpc_track_size(image):
+    """The one Track-Info block size a standard CPC DSK of image needs. Raises ValueError if tracks differ."""
+    by_pos = {(t.cyl, t.head): t for t in image.tracks}
+    sizes = set()
+    for cyl in range(image.cylinders):
+        for head in range(image.heads):
+            track = by_pos.get((cyl, head))
+            if track is None or not track.sectors:
+                raise ValueError(f"Unformatted track {cyl}/{head} cannot be written as a standard CPC DSK")
+            if len(track.sectors) > DSK_MAX_SECTORS or len({s.size for s in track.sectors}) > 1:
+                raise ValueError(f"Track {cyl}/{head} cannot be described by a standard CPC DSK header")
+            sizes.add(_edsk_track_sizes(track)[1])
+    if len(sizes) > 1:
+        raise ValueError("Tracks of different sizes cannot be written as a standard CPC DSK (use -otype edsk)")
+    return sizes.pop() if sizes else 0
+
+def cpc_dsk_size(image):
+    """Size in bytes of the standard CPC DSK file write_cpc_dsk() would produce (ValueError if it cannot)."""
+    return EDSK_BLOCK + _cpc_track_size(image) * image.cylinders * image.heads
+
+def write_cpc_dsk(image, out_path):
+    """
+    Write a DiskImage as a standard CPC DSK (every track the same size).
+    Raises ValueError for images only an EDSK can hold. Returns out_path.
+    """
+    track_size = _cpc_track_size(image)
+    cyls, heads = image.cylinders, image.heads
+    header = bytearray(EDSK_BLOCK)
+    struct.pack_into("<34s14sBBH", header, 0, DSK_HEADER, EDSK_CREATOR, cyls, heads, track_size)
+    with open(out_path, "wb", buffering=WRITE_BUFFER) as f:
+        f.write(header)
+        f.writelines(_edsk_track_block(track) for track in image.iter_tracks())
+    logger.debug(f"write_cpc_dsk wrote {cyls} cyls x {heads} heads to {out_path}")
+    return out_path
+
+# -otype values (libdsk names) the native codecs write for DSK/EDSK targets
+DSK_WRITERS = {"raw": write_raw_dsk, "dsk": write_cpc_dsk, "edsk": write_edsk}
+
+def dsk_size(image, otype):
+    """Size in bytes of image written with DSK_WRITERS[otype], or None for other types."""
+    if otype == "raw":
+        return image.data_size()
+    if otype == "dsk":
+        return cpc_dsk_size(image)
+    if otype == "edsk":
+        return edsk_size(image)
+    return None
+
+
+def decode_edsk(buf):
+    """
+    Decode a CPC DSK or Extended CPC DSK image held in memory (bytes) into a
+    DiskImage. Sector data are memoryview slices of buf; of a weak sector's
+    copies only the first is kept. Raises ValueError if buf is neither.
+    """
+    extended = buf.startswith(EDSK_SIGNATURE[:8])
+    if not extended and not buf.startswith(DSK_SIGNATURE):
+        raise ValueError("Missing CPC DSK signature")
+    if len(buf) < EDSK_BLOCK:
+        raise ValueError("File too short for a DSK header")
+    mv = memoryview(buf)
+    cyls, heads = buf[0x30], buf[0x31]
+    if extended:
+        track_sizes = [size * EDSK_BLOCK for size in buf[0x34:0x34 + cyls * heads]]
+    else:
+        track_sizes = [struct.unpack_from("<H", buf, 0x32)[0]] * (cyls * heads)
+
+    image = DiskImage(source_format="EDSK" if extended else "DSK")
+    offset = EDSK_BLOCK
+    for block_size in track_sizes:
+        if not block_size:
+            continue  # unformatted track
+        if offset + block_size > len(buf) or buf[offset:offset + 10] != EDSK_TRACK_SIGNATURE[:10]:
+            raise ValueError(f"Bad or truncated Track-Info block at offset {offset}")
+        cyl, head, rate, mode, size_code, count = struct.unpack_from("<BBBBBB", buf, offset + 0x10)
+        track = Track(cyl, head, mfm=mode != 1, rate=500 if rate == 2 else 250)
+        data = offset + -(-(0x18 + 8 * count) // EDSK_BLOCK) * EDSK_BLOCK
+        for i in range(count):
+            c, h, r, n, st1, st2, actual = struct.unpack_from("<BBBBBBH", buf, offset + 0x18 + 8 * i)
+            size = 128 << min(n if extended else size_code, 6)
+            stored = actual if extended and actual else size
+            track.sectors.append(Sector(c, h, r, mv[data:data + min(stored, size)],
+                                        deleted=bool(st2 & ST2_CONTROL_MARK),
+                                        bad=bool(st1 & ST1_DATA_ERROR or st2 & ST2_DATA_ERROR)))
+            data += stored
+        image.tracks.append(track)
+        offset += block_size
+
+    logger.debug(f"decode_edsk: {image}")
+    return image
+
+def read_edsk(path):
+    """Read and decode a CPC DSK or EDSK file."""
+    with open(path, "rb") as f:
+        return decode_edsk(f.read())
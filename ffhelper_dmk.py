@@ -0,0 +1,184 @@
+# ffhelper_dmk.py
+import os
+import struct
+import binascii
+import logging
+from ffhelper_diskimage import DiskImage, Track, Sector, DSK_WRITERS, write_raw_dsk
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------
+# DMK layout (David Keil's TRS-80 emulator format)
+# ----------------------------
+HEADER_SIZE = 16
+IDAM_TABLE_SIZE = 128           # 64 little-endian 16-bit IDAM pointers per track
+MAX_IDAMS = IDAM_TABLE_SIZE // 2
+
+FLAG_SINGLE_SIDED = 0x10
+FLAG_SINGLE_DENSITY = 0x40      # FM bytes stored once instead of doubled
+FLAG_IGNORE_DENSITY = 0x80
+
+IDAM_DOUBLE_DENSITY = 0x8000
+IDAM_OFFSET_MASK = 0x3FFF
+
+MFM_SYNC = b"\xa1\xa1\xa1"
+DATA_MARKS = (0xFB, 0xFA, 0xF9, 0xF8)   # F8/F9 = deleted data
+DELETED_MARKS = (0xF8, 0xF9)
+MFM_DAM_WINDOW = 60             # bytes after the ID field to look for the data mark
+FM_DAM_WINDOW = 40
+
+class DMKError(ValueError):
+    """Raised when a file is not a usable DMK image."""
+
+def parse_header(buf, file_size=None):
+    """
+    Parse the 16-byte DMK header.
+    Returns dict with tracks, heads, track_length, single_density, ignore_density, write_protected.
+    """
+    if len(buf) < HEADER_SIZE:
+        raise DMKError("File too short for a DMK header")
+
+    write_protect, tracks, track_length, flags = struct.unpack_from("<BBHB", buf, 0)
+    heads = 1 if flags & FLAG_SINGLE_SIDED else 2
+
+    if write_protect not in (0x00, 0xFF):
+        raise DMKError(f"Bad write-protect byte 0x{write_protect:02X}")
+    if tracks == 0 or track_length <= IDAM_TABLE_SIZE:
+        raise DMKError(f"Bad geometry: {tracks} tracks, track length {track_length}")
+
+    if file_size is not None:
+        needed = HEADER_SIZE + tracks * heads * track_length
+        if file_size < needed:
+            # Some tools write single-sided images without setting the flag
+            if heads == 2 and file_size >= HEADER_SIZE + tracks * track_length:
+                heads = 1
+            else:
+                raise DMKError(f"Truncated DMK: {file_size} bytes, header needs {needed}")
+
+    return {
+        "tracks": tracks,
+        "heads": heads,
+        "track_length": track_length,
+        "single_density": bool(flags & FLAG_SINGLE_DENSITY),
+        "ignore_density": bool(flags & FLAG_IGNORE_DENSITY),
+        "write_protected": write_protect == 0xFF,
+    }
+
+def _find_data_mark(buf, start, end, mfm, step):
+    """Return (offset of first data byte, mark) after an ID field, or (None, None)."""
+    if mfm:
+        pos = buf.find(MFM_SYNC, start, end)
+        while pos != -1:
+            mark = buf[pos + 3]
+            if mark in DATA_MARKS:
+                return pos + 4, mark
+            if mark != 0xA1:
+                pos = buf.find(MFM_SYNC, pos + 1, end)
+            else:
+                pos += 1
+        return None, None
+
+    # FM: data mark follows the zero run of the gap
+    for pos in range(start + step, end, step):
+        mark = buf[pos]
+        if mark in DATA_MARKS and buf[pos - step] == 0x00:
+            return pos + step, mark
+    return None, None
+
+def decode_track(buf, mv, base, header, cyl, head):
+    """Decode one track starting at byte offset base. Returns a Track."""
+    track_length = header["track_length"]
+    end_of_track = base + track_length
+    pointers = struct.unpack_from(f"<{MAX_IDAMS}H", buf, base)
+
+    track = Track(cyl, head, mfm=True, rate=500 if track_length > 8000 else 250)
+    seen = set()
+    fm_sectors = 0
+
+    for ptr in pointers:
+        if ptr == 0:
+            break
+        mfm = bool(ptr & IDAM_DOUBLE_DENSITY)
+        step = 1 if (mfm or header["single_density"] or header["ignore_density"]) else 2
+        idam = base + (ptr & IDAM_OFFSET_MASK)
+        if idam + 7 * step > end_of_track or buf[idam] != 0xFE:
+            logger.debug(f"DMK c{cyl} h{head}: bad IDAM pointer 0x{ptr:04X}")
+            continue
+
+        id_cyl, id_head, id_sec, size_code = (buf[idam + step * i] for i in range(1, 5))
+        if id_sec in seen:
+            continue
+        # WD177x/179x controllers only honour the low two bits of the size code
+        size = 128 << (size_code & 3)
+
+        search_start = idam + 7 * step
+        search_end = min(end_of_track, search_start + (MFM_DAM_WINDOW if mfm else FM_DAM_WINDOW) * step)
+        data_start, mark = _find_data_mark(buf, search_start, search_end, mfm, step)
+        if data_start is None:
+            logger.debug(f"DMK c{cyl} h{head} s{id_sec}: no data mark")
+            continue
+
+        data_end = data_start + size * step
+        if data_end + 2 * step > end_of_track:
+            logger.debug(f"DMK c{cyl} h{head} s{id_sec}: sector runs past end of track")
+            continue
+
+        if step == 1:
+            data = mv[data_start:data_end]
+            stored_crc = buf[data_end] << 8 | buf[data_end + 1]
+        else:
+            data = buf[data_start:data_end:step]
+            stored_crc = buf[data_end] << 8 | buf[data_end + step]
+
+        # CRC-CCITT over sync + mark + data
+        prefix = (MFM_SYNC if mfm else b"") + bytes((mark,))
+        crc = binascii.crc_hqx(data, binascii.crc_hqx(prefix, 0xFFFF))
+
+        seen.add(id_sec)
+        if not mfm:
+            fm_sectors += 1
+        track.sectors.append(Sector(id_cyl, id_head, id_sec, data,
+                                    deleted=mark in DELETED_MARKS, bad=crc != stored_crc))
+
+    if track.sectors and fm_sectors == len(track.sectors):
+        track.mfm = False
+    return track
+
+def decode_dmk(buf):
+    """Decode a whole DMK image held in memory (bytes) into a DiskImage."""
+    header = parse_header(buf, len(buf))
+    mv = memoryview(buf)
+    image = DiskImage(source_format="DMK")
+
+    base = HEADER_SIZE
+    for cyl in range(header["tracks"]):
+        for head in range(header["heads"]):
+            if base + header["track_length"] > len(buf):
+                break
+            image.tracks.append(decode_track(buf, mv, base, header, cyl, head))
+            base += header["track_length"]
+
+    logger.debug(f"decode_dmk: {image}")
+    return image
+
+def read_dmk(path):
+    """Read and decode a DMK file."""
+    with open(path, "rb") as f:
+        return decode_dmk(f.read())
+
+def convert_dmk_to_dsk(in_path, out_path, otype="raw"):
+    """
+    Decode a DMK image and write it as a raw DSK file (or another libdsk
+    output type in DSK_WRITERS: 'dsk', 'edsk'). Returns out_path.
+    """
+    writer = DSK_WRITERS.get((otype or "raw").lower())
+    if writer is None:
+        raise DMKError(f"Unsupported output type '{otype}'")
+    image = read_dmk(in_path)
+    bad = sum(1 for s in image.iter_sectors() if s.bad)
+    if bad:
+        logger.warning(f"{os.path.basename(in_path)}: {bad} sector(s) with CRC errors")
+    try:
+        return writer(image, out_path)
+    except ValueError as e:
+        raise DMKError(str(e)) from e
@@ -0,0 +1,138 @@
+# ffhelper_exec.py
+import os
+import shlex
+import platform
+import threading
+import subprocess
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+IS_WINDOWS = platform.system().lower().startswith("win")
+EXE_SUFFIX = ".exe" if IS_WINDOWS else ""
+OUTPUT_TAIL_LINES = 40   # converter output kept for error messages
+MIN_DEFAULT_CONCURRENCY = 4
+
+class ConverterError(RuntimeError):
+    """A converter exited with a non-zero status. .output holds the tail of its output."""
+
+    def __init__(self, message, returncode=None, output=""):
+        super().__init__(message)
+        self.returncode = returncode
+        self.output = output
+
+class ConverterTimeout(ConverterError):
+    """A converter ran longer than its timeout and was killed."""
+
+class ConverterRunner:
+    """
+    Runs external converters as argument vectors (no shell).
+
+    Tool paths, split command templates and environments are cached per tool
+    directory; output is streamed line by line into the log; at most
+    max_concurrent converters run at once and each gets a timeout (None = none).
+    """
+
+    def __init__(self, max_concurrent=None, timeout=None, resolver=None):
+        # Converters also wait on disk, so allow a few even on small machines
+        self.max_concurrent = max(1, max_concurrent or max(os.cpu_count() or 1, MIN_DEFAULT_CONCURRENCY))
+        self.timeout = timeout or None
+        self.resolver = resolver    # resolver(tools_path, exe_name) -> path, e.g. a ToolRegistry lookup
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+        self._tools = {}
+        self._templates = {}
+        self._envs = {}
+
+    # ----------------------------
+    # Caches
+    # ----------------------------
+    def resolve_tool(self, tools_path, exe_name):
+        """Return the full path of exe_name under tools_path (cached), or raise FileNotFoundError."""
+        if self.resolver is not None:
+            return self.resolver(tools_path, exe_name)
+        key = (tools_path, exe_name)
+        path = self._tools.get(key)
+        if path is None:
+            path = os.path.join(tools_path, exe_name + EXE_SUFFIX)
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"Converter executable not found: {path}")
+            with self._lock:
+                self._tools[key] = path
+        return path
+
+    def split_template(self, cmd_template):
+        """shlex-split a command template once; placeholders are filled per word later."""
+        words = self._templates.get(cmd_template)
+        if words is None:
+            words = tuple(shlex.split(cmd_template, posix=not IS_WINDOWS))
+            with self._lock:
+                self._templates[cmd_template] = words
+        return words
+
+    def environment(self, tools_path, cpmtools=None):
+        """Process environment for tools in tools_path (shared dict, do not modify)."""
+        key = (tools_path, cpmtools)
+        env = self._envs.get(key)
+        if env is None:
+            env = os.environ.copy()
+            if cpmtools:
+                env["CPMTOOLS"] = cpmtools
+            with self._lock:
+                self._envs[key] = env
+        return env
+
+    def build_argv(self, cmd_template, tools_path, infile, outfile):
+        """Argument vector for a template like 'dskdump -itype imd {infile} {outfile}'."""
+        words = self.split_template(cmd_template)
+        argv = [self.resolve_tool(tools_path, words[0])]
+        argv += [w.format(infile=infile, outfile=outfile) if "{" in w else w for w in words[1:]]
+        return argv
+
+    # ----------------------------
+    # Execution
+    # ----------------------------
+    def run(self, argv, env=None, cwd=None, timeout=None, label=None):
+        """
+        Run argv, streaming its combined stdout/stderr into the log.
+        Returns the output tail (str). Raises ConverterError on a non-zero exit
+        and ConverterTimeout when it runs past timeout (default self.timeout).
+        """
+        label = label or os.path.basename(argv[0])
+        timeout = timeout if timeout is not None else self.timeout
+        tail = deque(maxlen=OUTPUT_TAIL_LINES)
+
+        with self._slots:
+            logger.debug(f"exec {argv} in {cwd}")
+            proc = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                    stdin=subprocess.DEVNULL, cwd=cwd, env=env,
+                                    text=True, errors="replace", bufsize=1)
+            timed_out = threading.Event()
+
+            def kill():
+                timed_out.set()
+                proc.kill()
+
+            timer = threading.Timer(timeout, kill) if timeout else None
+            if timer:
+                timer.daemon = True
+                timer.start()
+            try:
+                for line in proc.stdout:
+                    line = line.rstrip()
+                    if line:
+                        tail.append(line)
+                        logger.debug(f"[{label}] {line}")
+                returncode = proc.wait()
+            finally:
+                if timer:
+                    timer.cancel()
+                proc.stdout.close()
+
+        output = "\n".join(tail)
+        if timed_out.is_set():
+            raise ConverterTimeout(f"{label} timed out after {timeout}s", returncode, output)
+        if returncode != 0:
+            raise ConverterError(f"{label} exited with status {returncode}\n{output}", returncode, output)
+        return output
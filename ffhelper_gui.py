@@ -0,0 +1,1026 @@
+# ffhelper_gui.py
+import os
+import tkinter as tk
+import threading
+import bisect
+import fnmatch
+import re
+import ffhelper_prefs as prefs
+import ffhelper_utils as utils
+import logging
+import platform
+from tkinter import ttk, filedialog, messagebox, scrolledtext
+from diskmanager import DiskImageManager
+from ffhelper_configurations import get_configurations
+from ffhelper_planner import ConversionPlanner, NoConversionRoute, file_format
+from ffhelper_index import get_index
+from ffhelper_diskdefs import disk_usage, get_diskdefs
+from ffhelper_cpmfs import cached_listing, find_files, list_folder
+from ffhelper_watcher import FolderWatcher
+from ffhelper_jobs import Job, format_rate
+from ffhelper_utils import get_resource_path, StartupProfile
+from ffhelper_logging import setup_logging, LogTail
+
+LOGFILE = None  # set by main()
+LOG_VIEW_TAIL = 512 * 1024      # bytes of history shown when the log viewer opens
+LOG_VIEW_MAX_LINES = 20000      # older lines are dropped from the viewer beyond this
+LOG_VIEW_POLL_MS = 500
+logger = logging.getLogger(__name__)
+VERSION = "1.0.0"
+base_title = f"Flash Floppy Helper {VERSION}"
+TREE_BATCH = 500  # rows inserted per event-loop turn
+FORMAT_FILTER = re.compile(r"(?:^|\s)(?:fmt|format):(\w+)", re.IGNORECASE)
+CPM_FILTER = re.compile(r"(?:^|\s)cpm:(\S+)", re.IGNORECASE)
+
+
+# ----------------------------
+# Tooltip Helper
+# ----------------------------
+# ----------------------------
+# Tooltip Helper (cross-platform safe)
+# ----------------------------
+def create_tooltip(widget, text):
+    tooltip = tk.Toplevel(widget)
+    tooltip.withdraw()
+    tooltip.overrideredirect(True)
+
+    label = tk.Label(
+        tooltip,
+        text=text,
+        background="#ffffe0",   # light yellow background
+        foreground="#000000",   # black text
+        relief="solid",
+        borderwidth=1,
+        justify="left",
+        wraplength=200,
+        padx=4,
+        pady=2
+    )
+    label.pack(ipadx=1)
+
+    def show_tooltip(event):
+        tooltip.geometry(f"+{event.x_root + 10}+{event.y_root + 10}")
+        tooltip.deiconify()
+
+    def hide_tooltip(event):
+        tooltip.withdraw()
+
+    widget.bind("<Enter>", show_tooltip)
+    widget.bind("<Leave>", hide_tooltip)
+
+
+def sort_filter_rows(files, sort="name", reverse=False, pattern=""):
+    """
+    Sort/filter [(filename, size), ...] for display.
+    pattern is a case-insensitive substring, or a glob if it contains * or ?.
+    """
+    if pattern:
+        pattern = pattern.lower()
+        if "*" in pattern or "?" in pattern:
+            files = [row for row in files if fnmatch.fnmatchcase(row[0].lower(), pattern)]
+        else:
+            files = [row for row in files if pattern in row[0].lower()]
+    if sort == "size":
+        return sorted(files, key=lambda row: (row[1], row[0]), reverse=reverse)
+    return sorted(files, reverse=reverse)
+
+
+def split_format_filter(text):
+    """('rest of the filter', FORMAT or None) for filter text such as 'fmt:imd zork'."""
+    m = FORMAT_FILTER.search(text or "")
+    if not m:
+        return text, None
+    return (text[:m.start()] + " " + text[m.end():]).strip(), m.group(1).upper()
+
+
+def split_cpm_filter(text):
+    """('rest of the filter', PATTERN or None) for filter text such as 'cpm:*.BAS zork'."""
+    m = CPM_FILTER.search(text or "")
+    if not m:
+        return text, None
+    return (text[:m.start()] + " " + text[m.end():]).strip(), m.group(1).upper()
+
+
+class FlashFloppyHelper(tk.Tk):
+    def __init__(self, profile=None):
+        logger.debug("Initizing Application")
+        self.profile = profile or StartupProfile(enabled=False)
+        super().__init__()
+        self.profile.mark("Tk root created")
+        self.title(base_title)
+        self.geometry("1100x600")
+        self.minsize(800, 500)
+           
+        logger.debug("Getting Preferences")
+        # Preferences
+        self.teledisk_command = prefs.get_pref("tele.convparams", "")
+        self.imagedisk_command = prefs.get_pref("imd.convparams", "")
+        self.dsk_command = prefs.get_pref("dsk.convparams", "")
+        self.conversion_tools_path = get_resource_path(prefs.get_pref("conversion_tools_path", ""))
+        self.configurations_path = get_resource_path(prefs.get_pref("configurations_path", ""))
+        
+        # Make prefs available on self
+        self.prefs = prefs  # <-- Add this line        
+        self.profile.mark("preferences read")
+
+        # Tree view state: index shown, sort/filter, and batched fill generation
+        self._tree_index = {}
+        self._staging_index = None
+        self._tree_view = {}
+        self._tree_generation = {}
+        self._tree_filling = {}
+        self._filter_after_id = None
+        self.export_job = None
+        self._export_preparing = False  # summary being computed off the Tk thread
+        self.catalog_crawler = None  # started off the Tk thread by load_last_folders
+
+        # Folder watcher keeps both panes in sync with changes made outside the app
+        self.watcher = None
+        if prefs.get_pref("watch_folders", True):
+            self.watcher = FolderWatcher(self.on_folder_changed,
+                                         poll_interval=float(prefs.get_pref("watch_interval", 2.0)),
+                                         force_poll_every=int(prefs.get_pref("watch_rescan_every", 0)))
+            logger.debug(f"Folder watcher running ({self.watcher.mode})")
+        
+        logger.debug(f"Getting Configurations from {self.configurations_path}")
+        # Diskdefs Manager: scanned in the background, the format list fills in when ready
+        self.configurations_manager = None
+        self.profile.begin("configurations scanned")
+        threading.Thread(target=self.load_configurations, daemon=True).start()
+    
+        logger.debug("Settting up Disk Image Manager")
+        # Disk manager
+        self.disk_manager = DiskImageManager(self.conversion_tools_path,  self.prefs, status_callback=self.status_callback)
+        self.disk_manager.set_current_staging_path(self.prefs.get_pref("staging_folder"))
+    
+        logger.debug("Settting up User Interface")
+        # UI
+        self.create_toolbar()
+        self.create_main_panes()
+        self.create_statusbar()
+        self.bind_events()
+        self.profile.mark("widgets built")
+    
+        # Schedule final window setup after idle      
+        if platform.system() == "Windows":
+            self.after(50, self.finish_setup)  # 50ms delay
+        else:
+            self.after_idle(self.finish_setup)
+                           
+    def open_staging_from_path(self, image_path):
+        if not os.path.exists(image_path):
+            return
+        self._current_image_path = image_path
+        self.update_title(image_path)  # show filename in title
+        prefs.set_pref("staging_folder", image_path)  # ShaZam! — remember exact file                
+        threading.Thread(target=self.populate_staging_folder, args=(image_path,), daemon=True).start()                            
+        self.update_watched_folders()
+        
+    def finish_setup(self):
+        # Center window
+        self.update_idletasks()
+        w = self.winfo_width()
+        h = self.winfo_height()
+        ws = self.winfo_screenwidth()
+        hs = self.winfo_screenheight()
+        x = (ws // 2) - (w // 2)
+        y = (hs // 2) - (h // 2)
+        self.geometry(f"{w}x{h}+{x}+{y}")
+    
+        # Deiconify and bring to front
+        self.deiconify()
+        self.lift()
+        self.focus_force()
+        self.profile.mark("window shown")
+
+        # Last folders may live on slow or network volumes: check them off the Tk thread
+        self.profile.begin("last folders checked")
+        threading.Thread(target=self.load_last_folders, daemon=True).start()
+        self.profile.set_ready()
+
+    def load_last_folders(self):
+        if prefs.get_pref("catalog", True):
+            from ffhelper_catalog import CatalogCrawler, get_catalog
+            self.catalog_crawler = CatalogCrawler(get_catalog(), on_done=self.on_catalog_done)
+
+        # Load last host folder if available
+        last_host = prefs.get_pref("last_host_folder", None)
+        if last_host and os.path.exists(last_host):
+            self.profile.begin("source folder loaded")
+            self.after(0, self.open_host_folder, last_host)
+                        
+        # ShaZam! — load last disk image if available
+        last_image = prefs.get_pref("staging_folder", None)
+        if last_image and os.path.exists(last_image):
+            self.profile.begin("staging folder loaded")
+            self.after(0, self.open_staging_from_path, last_image)
+        self.profile.end("last folders checked")
+
+    def load_configurations(self):
+        manager = None
+        if self.configurations_path and os.path.exists(self.configurations_path):
+            manager = get_configurations(self.configurations_path, self.conversion_tools_path)
+            get_diskdefs(self.conversion_tools_path)  # parse or load the cached definitions off the Tk thread
+        self.after(0, self.set_disk_formats, manager)
+
+    def set_disk_formats(self, manager):
+        """Fill the disk format dropdown once the configurations scan is done."""
+        self.configurations_manager = manager
+        disk_formats = []
+        if manager:
+            disk_formats = sorted(manager.get_disk_names(), key=str.lower)
+        self.disk_format_combo.configure(values=disk_formats)
+
+        # Get saved disk format from prefs
+        saved_format = self.prefs.get_pref("disk_format", "")
+        if saved_format and saved_format in disk_formats:
+            self.disk_format_combo.set(saved_format)
+        self.update_disk_info()
+        self.profile.end("configurations scanned")
+        
+
+    # ----------------------------
+    # Toolbar
+    # ----------------------------
+    def create_toolbar(self):
+        toolbar = ttk.Frame(self, padding=4)
+        ttk.Button(toolbar, text="Open Source", command=self.open_host_folder).pack(side=tk.LEFT, padx=2)
+        ttk.Button(toolbar, text="Open Staging", command=self.open_staging_folder).pack(side=tk.LEFT, padx=2)
+        ttk.Button(toolbar, text="Insert", command=self.insert_file).pack(side=tk.LEFT, padx=2)
+        ttk.Button(toolbar, text="Delete", command=self.delete_file).pack(side=tk.LEFT, padx=2)
+    
+        # --- Disk Format Dropdown (values filled by set_disk_formats) ---
+        self.disk_format_var = tk.StringVar()
+        self.disk_format_combo = ttk.Combobox(
+            toolbar,
+            textvariable=self.disk_format_var,
+            values=[],
+            state="readonly",
+            width=20
+        )
+        self.disk_format_combo.set("Choose Disk Format")        
+        
+        self.disk_format_combo.pack(side=tk.LEFT, padx=6)
+        create_tooltip(self.disk_format_combo, "Select the type of Computer")
+    
+        self.disk_format_combo.bind("<<ComboboxSelected>>", self.on_disk_format_selected)
+        # ----------------------------
+        
+        # --- Export Button ---
+        export_btn = ttk.Button(toolbar, text="Export", command=self.export_files_dialog)
+        export_btn.pack(side=tk.LEFT, padx=2)
+        create_tooltip(export_btn, "Export Files and Configs")
+
+        # --- Stop Button ---
+        stop_btn = ttk.Button(toolbar, text="Stop", command=self.cancel_jobs)
+        stop_btn.pack(side=tk.LEFT, padx=2)
+        create_tooltip(stop_btn, "Stop the running insert, delete or export after the files in progress")
+        
+        
+        # --- View Log Button (new) ---
+        log_btn = ttk.Button(toolbar, text="View Log",
+                             command=self.open_log_window)
+        log_btn.pack(side=tk.RIGHT, padx=2)
+        create_tooltip(log_btn, "View application log file")
+    
+        settings_btn = ttk.Button(toolbar, text="Preferences",
+                                  command=lambda: prefs.open_prefs_dialog(self))
+        
+        settings_btn.pack(side=tk.RIGHT, padx=2)
+        create_tooltip(settings_btn, "Preferences for paths and other things")
+    
+        toolbar.pack(side=tk.TOP, fill=tk.X)
+
+    # ----------------------------
+    # Main Panes
+    # ----------------------------
+    def create_main_panes(self):
+        main_frame = ttk.Frame(self)
+        main_frame.pack(fill=tk.BOTH, expand=True, padx=4, pady=4)
+
+        self.paned = ttk.Panedwindow(main_frame, orient=tk.HORIZONTAL)
+        self.paned.pack(fill=tk.BOTH, expand=True)
+
+        # Left: Host Folder
+        left_frame = ttk.Frame(self.paned, padding=2)
+        ttk.Label(left_frame, text="Source Folder", font=("TkDefaultFont", 10, "bold")).pack(anchor="w")
+        filter_frame = ttk.Frame(left_frame)
+        ttk.Label(filter_frame, text="Filter:").pack(side=tk.LEFT)
+        self.filter_var = tk.StringVar()
+        filter_entry = ttk.Entry(filter_frame, textvariable=self.filter_var)
+        filter_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(4, 0))
+        create_tooltip(filter_entry, "Show only files containing this text (wildcards * and ? allowed);\n"
+                                     "fmt:IMD shows only images whose contents are IMD;\n"
+                                     "cpm:*.BAS shows only images holding matching CP/M files\n"
+                                     "(read with the selected format's disk definition).\n"
+                                     "Double-click an image to list its CP/M files.")
+        self.filter_var.trace_add("write", self.on_filter_changed)
+        filter_frame.pack(fill=tk.X, pady=(2, 2))
+        self.folder_tree = self.create_treeview(left_frame)
+        self.folder_tree.pack(fill=tk.BOTH, expand=True)
+        self.folder_tree.bind("<Double-1>", self.on_source_double_click)
+        # Label to show current folder under the treeview
+        self.host_folder_var = tk.StringVar(value="Folder: N/A")
+        ttk.Label(left_frame, textvariable=self.host_folder_var).pack(anchor="w", pady=(2,0))        
+        self.paned.add(left_frame, weight=1)
+
+        # Right: Flash Floppy Folder
+        right_frame = ttk.Frame(self.paned, padding=2)
+        ttk.Label(right_frame, text="Flash Floppy Folder", font=("TkDefaultFont", 10, "bold")).pack(anchor="w")
+        self.image_tree = self.create_treeview(right_frame)
+        self.image_tree.pack(fill=tk.BOTH, expand=True)
+        # Disk info labels
+        self.disk_info_var = tk.StringVar(value="Disk Size: N/A   Free Space: N/A")
+        ttk.Label(right_frame, textvariable=self.disk_info_var).pack(anchor="w", pady=(2,0))       
+        
+        self.paned.add(right_frame, weight=1)        
+
+    def create_treeview(self, parent):
+        tree = ttk.Treeview(parent, columns=("name", "size"), show="headings")
+        tree.heading("name", text="Filename", command=lambda: self.sort_tree(tree, "name"))
+        tree.heading("size", text="Size Bytes", command=lambda: self.sort_tree(tree, "size"))
+        self._tree_view[tree] = {"sort": "name", "reverse": False, "filter": ""}
+        tree.column("name", width=300, anchor="w")
+        tree.column("size", width=50, anchor="e")
+
+        yscroll = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=yscroll.set)
+        yscroll.pack(side=tk.RIGHT, fill=tk.Y)
+        return tree
+
+    # ----------------------------
+    # Status Bar
+    # ----------------------------
+    def create_statusbar(self):
+        self.status_var = tk.StringVar()
+        self.status_bar = ttk.Label(self, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
+        self.status_bar.pack(fill=tk.X)
+
+    def status_callback(self, msg):
+        """Safe to call from worker threads: the update runs on the Tk thread."""
+        self.after(0, self.status_var.set, msg)
+
+    def cancel_jobs(self):
+        self.disk_manager.cancel()
+        if self.export_job is not None:
+            self.export_job.cancel()
+        self.status_var.set("Stopping...")
+        
+
+    # ----------------------------
+    # Open Log File Window
+    # ----------------------------
+    def open_log_window(self):
+        """Open a window that shows the end of LOGFILE and follows it as it grows."""
+    
+        if not LOGFILE or not os.path.exists(LOGFILE):
+            messagebox.showerror(
+                "Log File Missing",
+                f"Log file does not exist:\n{LOGFILE}",
+                parent=self
+            )
+            return
+    
+        win = tk.Toplevel(self)
+        win.title("Log Viewer")
+        win.geometry("800x500")
+    
+        text = scrolledtext.ScrolledText(win, wrap="none", font=("Courier", 17))
+        text.pack(fill="both", expand=True)
+
+        tail = LogTail(LOGFILE)
+        try:
+            content, skipped = tail.read_tail(LOG_VIEW_TAIL)
+            if skipped:
+                content = f"... {skipped:,} earlier bytes not shown ...\n" + content
+        except Exception as e:
+            content = f"Error reading log:\n{e}"
+    
+        text.insert("1.0", content)
+        text.see(tk.END)
+        text.config(state="disabled")
+
+        def poll():
+            if not win.winfo_exists():
+                return
+            try:
+                new = tail.read_new()
+            except OSError as e:
+                logger.debug(f"Log viewer: {e}")
+                new = ""
+            if new:
+                at_end = text.yview()[1] >= 0.999
+                text.config(state="normal")
+                text.insert(tk.END, new)
+                excess = int(text.index("end-1c").split(".")[0]) - LOG_VIEW_MAX_LINES
+                if excess > 0:
+                    text.delete("1.0", f"{excess + 1}.0")
+                text.config(state="disabled")
+                if at_end:
+                    text.see(tk.END)
+            # Read again straight away while a backlog is being caught up on
+            win.after(1 if len(new) >= tail.chunk_size // 2 else LOG_VIEW_POLL_MS, poll)
+
+        def on_close():
+            tail.close()
+            win.destroy()
+
+        win.protocol("WM_DELETE_WINDOW", on_close)
+        win.after(LOG_VIEW_POLL_MS, poll)
+
+    # ----------------------------
+    # Event Bindings
+    # ----------------------------
+    def bind_events(self):
+        # Drag-and-drop can be implemented later
+        pass
+    
+    def export_files_dialog(self):
+        """Prompt user for output folder, show conversion summary, and export all staging/config files automatically."""
+        import ffhelper_logic as logic  # conversion stack loads on first export, not at startup
+        try:
+            # ----------------------------
+            # Get staging folder
+            # ----------------------------
+            staging_path = self.disk_manager.get_current_staging_path()
+            if not staging_path:
+                messagebox.showerror("Error", "No staging folder loaded.", parent=self)
+                return
+    
+            # ----------------------------
+            # Get selected disk format
+            # ----------------------------
+            selected_format = self.disk_format_combo.get()
+            if not selected_format:
+                messagebox.showerror("Error", "No disk format selected.", parent=self)
+                return
+    
+            # ----------------------------
+            # Parse convert.txt
+            # ----------------------------
+            try:
+                config_dir, final_format, conversions = logic.load_export_profile(
+                    self.configurations_path, selected_format)
+            except (FileNotFoundError, ValueError) as e:
+                messagebox.showerror("Error", str(e), parent=self)
+                return
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to read convert.txt:\n{e}", parent=self)
+                return
+    
+            target_ext = "." + final_format.lower()
+            if self.export_job is not None or self._export_preparing:
+                messagebox.showwarning("Export", "An export is already running.", parent=self)
+                return
+
+            # ----------------------------
+            # Scan, sniff and plan the staged files (background thread)
+            # ----------------------------
+            self.status_var.set(f"Checking staged images in {staging_path}...")
+            self._export_preparing = True
+
+            def prepare():
+                try:
+                    plan = self.prepare_export(staging_path, conversions, final_format)
+                except NoConversionRoute as e:
+                    self.after(0, self.show_export_problem, "No Conversion Route", str(e))
+                    return
+                except Exception as e:
+                    logger.exception("Export preparation failed")
+                    self.after(0, self.show_export_problem, "Export Error", str(e))
+                    return
+                self.after(0, self.confirm_export, staging_path, config_dir, target_ext, conversions, plan)
+
+            threading.Thread(target=prepare, daemon=True).start()
+
+        except Exception as e:
+            messagebox.showerror("Export Error", str(e), parent=self)
+
+    def prepare_export(self, staging_path, conversions, final_format):
+        """
+        Worker thread: list, sniff and plan the staged files, look for duplicate
+        disks and predict exported sizes (decodes images) for the summary.
+        Returns {"staged", "formats", "routes", "duplicates", "predictions", "summary": [lines]};
+        raises NoConversionRoute.
+        """
+        import ffhelper_logic as logic
+        import ffhelper_packing as packing
+        planner = ConversionPlanner(conversions, final_format)
+        staged = [f for f, _ in utils.list_files(staging_path)]
+        formats = logic.detect_formats(staging_path, staged)
+        routes = planner.plan_files(staged, formats)
+
+        summary_lines = [f"FINALFORMAT: {final_format}", "Conversions:"]
+        for fmt, route in sorted(routes.items()):
+            summary_lines.append(f"{fmt or '(none)'}: {planner.describe(route)}")
+        misnamed = sorted(name for name, fmt in formats.items() if fmt != file_format(name))
+        if misnamed:
+            summary_lines.append(f"Planned by contents, not extension: {', '.join(misnamed[:5])}"
+                                 f"{' ...' if len(misnamed) > 5 else ''}")
+        # Identical files are cheap to find (only same-size files are hashed); matching
+        # disks across formats decodes every image, so only when the user opted in
+        duplicates = logic.find_duplicates(staging_path, staged, formats, routes,
+                                           decode=bool(self.prefs.get_pref("skip_duplicates", False)))
+        if duplicates["groups"]:
+            summary_lines.append(f"Same disk staged more than once: {len(duplicates['groups'])} group(s), "
+                                 f"{len(duplicates['skip'])} redundant file(s)")
+        predictions = packing.predict_staging(staging_path, routes, formats=formats)
+        predicted = sum(p["predicted"] for p in predictions)
+        summary_lines.append(f"Predicted output: {predicted / (1024 * 1024):.1f} MB"
+                             f"{'' if all(p['exact'] for p in predictions) else ' (estimated)'}")
+        return {"staged": staged, "formats": formats, "routes": routes, "duplicates": duplicates,
+                "predictions": predictions, "summary": summary_lines}
+
+    def confirm_export(self, staging_path, config_dir, target_ext, conversions, plan):
+        """Show the conversion summary, ask for the output folder and start the export job."""
+        import ffhelper_logic as logic
+        import ffhelper_packing as packing
+        self._export_preparing = False
+        self.status_var.set("")
+        formats, duplicates, predictions = plan["formats"], plan["duplicates"], plan["predictions"]
+        try:
+            summary_text = "\n".join(plan["summary"])
+    
+            top = utils.create_modal_toplevel(self, width=400, height=200, title="Conversion Summary")
+            tk.Label(top, text="The following conversions will be applied:", font=("TkDefaultFont", 10, "bold")).pack(pady=5)
+            text_widget = tk.Text(top, width=50, height=10, wrap="none")
+            text_widget.insert("1.0", summary_text)
+            text_widget.config(state="disabled")
+            text_widget.pack(padx=10, pady=5, fill="both", expand=True)
+    
+            ok_pressed = tk.BooleanVar(value=False)
+    
+            def on_ok():
+                ok_pressed.set(True)
+                top.destroy()
+    
+            tk.Button(top, text="OK", command=on_ok).pack(pady=10)
+            self.wait_window(top)
+    
+            if not ok_pressed.get():
+                return  # user closed the window without pressing OK
+
+            skip_duplicates = False
+            if duplicates["groups"]:
+                sample = "\n".join(f"{g['keep']} = {', '.join(n for n in g['files'] if n != g['keep'])}"
+                                   for g in duplicates["groups"][:8])
+                skip_duplicates = messagebox.askyesno(
+                    "Duplicate Disks",
+                    f"{len(duplicates['skip'])} staged image(s) hold the same disk as another:\n\n{sample}"
+                    f"{chr(10) + '...' if len(duplicates['groups']) > 8 else ''}\n\n"
+                    f"Export only the first file of each line?", parent=self)
+                if skip_duplicates:
+                    skipped = set(duplicates["skip"])
+                    predictions = [p for p in predictions if p["file"] not in skipped]
+    
+            # ----------------------------
+            # Select output folder
+            # ----------------------------
+            out_folder = filedialog.askdirectory(parent=self, title="Select Output Folder")
+            if not out_folder:
+                return
+            fit = packing.check_fit(predictions, out_folder)
+            if not fit["fits"] and not messagebox.askyesno(
+                    "Not Enough Space",
+                    f"The export needs about {fit['needed'] / (1024 * 1024):.1f} MB but "
+                    f"{out_folder} has {fit['free'] / (1024 * 1024):.1f} MB free.\n"
+                    f"'ffhelper pack' can split the staging folder across several sticks.\n\n"
+                    f"Export anyway?", parent=self):
+                return
+    
+            # ----------------------------
+            # Call export logic (background thread, progress in the status bar)
+            # ----------------------------
+            if self.export_job is not None:
+                messagebox.showwarning("Export", "An export is already running.", parent=self)
+                return
+            job = Job("Export", status_callback=self.status_callback)
+            self.export_job = job
+
+            def run():
+                try:
+                    report = logic.export_files(
+                        staging_path=staging_path,
+                        configurations_path=config_dir,
+                        out_folder=out_folder,
+                        target_ext=target_ext,
+                        conversions=conversions,
+                        prefs=self.prefs,
+                        job=job,
+                        formats=formats,
+                        skip_duplicates=skip_duplicates,
+                        duplicates=duplicates,
+                    )
+                except Exception as e:
+                    self.after(0, self.show_export_error, str(e))
+                    return
+                self.after(0, self.show_export_report, report)
+
+            threading.Thread(target=run, daemon=True).start()
+    
+        except Exception as e:
+            messagebox.showerror("Export Error", str(e), parent=self)    
+
+    def show_export_problem(self, title, message):
+        self._export_preparing = False
+        self.status_var.set("")
+        messagebox.showerror(title, message, parent=self)
+
+    def show_export_error(self, message):
+        self.export_job = None
+        messagebox.showerror("Export Error", message, parent=self)
+
+    def show_export_report(self, report):
+        self.export_job = None
+        out_folder = report["out_folder"]
+        summary = report["job"]
+        stats = (f"{format_rate(summary['bytes_per_sec'])}, {summary['files_per_sec']:.1f} files/s, "
+                 f"{summary['elapsed']:.1f}s")
+        if report.get("duplicates") and report["duplicates"]["skip"]:
+            stats += f", {len(report['duplicates']['skip'])} duplicate(s) skipped"
+        if report["errors"] or report["cancelled"]:
+            failed = "\n".join(f"{e['file']}: {e['error']}" for e in report["errors"][:20])
+            more = len(report["errors"]) - 20
+            if more > 0:
+                failed += f"\n... and {more} more (see log)"
+            title = "Export Cancelled" if report["cancelled"] else "Export Finished With Errors"
+            messagebox.showwarning(
+                title,
+                f"Exported {len(report['results'])} file(s) to:\n{out_folder}\n({stats})\n\n"
+                f"{len(report['errors'])} failed, {len(report['cancelled'])} not started\n{failed}",
+                parent=self
+            )
+        else:
+            messagebox.showinfo("Export Complete",
+                                f"Exported {len(report['results'])} file(s) to:\n{out_folder}\n({stats})",
+                                parent=self)
+    
+    
+    # ----------------------------
+    # Disk Format Selection
+    # ----------------------------
+    def on_disk_format_selected(self, event):
+        selected = self.disk_format_var.get()
+        if not selected or not self.configurations_manager:
+            return
+    
+        # Save to prefs
+        self.prefs.set_pref("disk_format", selected)
+    
+        # Optional info popup
+        info = self.configurations_manager.get_disk_info(selected)
+        if info:
+            disksize = info.get("disksize", 0)
+            size_kb = disksize / 1024
+            definition = info.get("definition")
+            if definition:
+                detail = (f"Disk definition: {definition['name']}"
+                          f"{' (' + definition['label'] + ')' if definition['label'] else ''}\n"
+                          f"Directory entries: {definition['maxdir']}, block size: {definition['blocksize']}")
+            else:
+                detail = "No disk definition (add DISKDEF:<name> to convert.txt)"
+            problems = self.configurations_manager.get_profile(selected).validate()
+            if problems:
+                detail += "\n\nProblems:\n" + "\n".join(problems[:10])
+            messagebox.showinfo(
+                "Disk Format Selected",
+                f"Selected: {selected}\nCalculated Size: {size_kb:.1f} KB\n{detail}"
+            )
+        self.update_disk_info()
+        if split_cpm_filter(self._tree_view[self.folder_tree]["filter"])[1]:
+            self._apply_source_filter()  # cpm: matches depend on the disk definition
+
+    # ----------------------------
+    # Host Folder
+    # ----------------------------
+    def open_host_folder(self, folder=None):
+        last_folder = prefs.get_pref("last_host_folder", os.path.expanduser("~"))
+        if folder is None:
+            folder = filedialog.askdirectory(title="Select Host Folder", initialdir=last_folder, parent=self)
+        
+        if folder:
+            prefs.set_pref("last_host_folder", folder)
+            self.status_var.set(f"Loading folder: {folder}")
+            self.host_folder_var.set(f"Folder: {folder}")
+            threading.Thread(target=self.populate_host_folder, args=(folder,), daemon=True).start()
+            self.update_watched_folders()
+            if self.catalog_crawler is not None:
+                # Only the opened folder: a whole tree (e.g. ~ or a NAS root) is opt-in
+                self.catalog_crawler.request(folder, recursive=bool(prefs.get_pref("catalog_recursive", False)))
+
+    def populate_host_folder(self, folder):
+        """Refresh the source folder index off the Tk thread, then update the tree."""
+        index = get_index(folder)
+        diff = index.refresh()
+        self.folder_tree.after(0, self.populate_host_tree, index, diff)
+
+    def populate_host_tree(self, index, diff):
+        if self._tree_index.get(self.folder_tree) is index:
+            self.apply_tree_diff(self.folder_tree, index, diff)
+        else:
+            self.show_index(self.folder_tree, index)
+        self.status_var.set(f"Loaded folder: {index.folder} ({len(index.entries):,} files)")
+        self.profile.end("source folder loaded")
+
+    def on_catalog_done(self, stats):
+        """Crawler thread: report the crawl and re-apply a format filter that may now match more rows."""
+        self.status_callback(f"Catalog: {stats['images']:,} images under {stats['root']} "
+                             f"(+{stats['added']} ~{stats['changed']} -{stats['removed']})")
+        if split_format_filter(self._tree_view[self.folder_tree]["filter"])[1]:
+            self.after(0, self._apply_source_filter)
+
+    def folder_names_of_format(self, index, fmt):
+        """Names in index's folder whose contents are fmt: from the image catalog, else the index."""
+        if self.catalog_crawler is not None:
+            rows = self.catalog_crawler.catalog.query(folder=index.folder, fmt=fmt)
+            return {row["name"] for row in rows}
+        return {name for name, f in index.formats().items() if f == fmt}
+
+    def selected_definition(self):
+        """The cpmtools disk definition of the selected format, or None."""
+        if not self.configurations_manager or not self.disk_format_var.get():
+            return None
+        info = self.configurations_manager.get_disk_info(self.disk_format_var.get())
+        return info.get("definition") if info else None
+
+    def _cpm_catalog(self):
+        return self.catalog_crawler.catalog if self.catalog_crawler is not None else None
+
+    def folder_names_with_cpm_file(self, index, names, pattern, definition):
+        """
+        Worker thread: names of images in index's folder holding CP/M files
+        matching pattern, read with definition (see selected_definition).
+        """
+        if definition is None:
+            self.status_callback("cpm: filter needs a format with a disk definition (DISKDEF: in convert.txt)")
+            return set()
+        self.status_callback(f"Reading CP/M directories of {len(names):,} images ({definition['name']})...")
+        listings = list_folder(index.folder, names, definition, index.formats(names), self._cpm_catalog())
+        matches = find_files(listings, pattern)
+        found = {image for image, _ in matches}
+        self.status_callback(f"cpm:{pattern}: {len(matches):,} files in {len(found):,} of {len(names):,} images")
+        return found
+
+    def on_source_double_click(self, event):
+        """List the CP/M files inside the double-clicked source image."""
+        name = self.folder_tree.identify_row(event.y)
+        index = self._tree_index.get(self.folder_tree)
+        if not name or index is None:
+            return
+        definition = self.selected_definition()
+        if definition is None:
+            messagebox.showinfo("CP/M Directory",
+                                "Select a format with a disk definition (DISKDEF: in convert.txt) "
+                                "to list the files inside images.", parent=self)
+            return
+
+        def work():
+            try:
+                listing = cached_listing(os.path.join(index.folder, name), definition,
+                                         index.formats([name]).get(name), self._cpm_catalog())
+            except OSError as e:
+                listing = {"diskdef": definition["name"], "error": str(e), "files": []}
+            self.after(0, self.show_cpm_listing, name, listing)
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def show_cpm_listing(self, name, listing):
+        win = tk.Toplevel(self)
+        win.title(f"CP/M Directory - {name}")
+        win.geometry("520x420")
+        text = scrolledtext.ScrolledText(win, wrap="none", font=("Courier", 12))
+        text.pack(fill="both", expand=True)
+
+        lines = [f"{name}  (diskdef {listing['diskdef']})"]
+        if listing.get("label"):
+            lines.append(f"Label: {listing['label']}")
+        if listing.get("error"):
+            lines.append(f"Not readable as CP/M: {listing['error']}")
+        else:
+            lines.append("")
+            for f in listing["files"]:
+                flags = ("R/O " if f["read_only"] else "") + ("SYS" if f["system"] else "")
+                lines.append(f"{f['user']:>2}: {f['name']:<12} {f['size']:>8,}  {flags}")
+            lines.append("")
+            lines.append(f"{len(listing['files'])} files, {listing['used']:,} bytes used, "
+                         f"{listing['free']:,} free, {listing['dir_free']} directory entries free")
+            if listing.get("bad_entries"):
+                lines.append(f"{listing['bad_entries']} unreadable directory entries")
+        text.insert("1.0", "\n".join(lines))
+        text.config(state="disabled")
+
+    # ----------------------------
+    # Open Staging Folder
+    # ----------------------------
+    def open_staging_folder(self):
+        last_folder = prefs.get_pref("staging_folder", os.path.expanduser("~"))
+        staging_path = filedialog.askdirectory(title="Select Staging Folder", initialdir=last_folder, parent=self)
+        if staging_path:
+            prefs.set_pref("staging_folder", os.path.dirname(staging_path))
+            self._current_image_path = staging_path
+            self.update_title(staging_path)  # ShaZam! — update title bar with filename
+            prefs.set_pref("staging_folder", staging_path)  # ShaZam! — remember exact file        
+            threading.Thread(target=self.populate_staging_folder, args=(staging_path,), daemon=True).start()
+            self.update_watched_folders()
+            
+    def populate_staging_folder(self, staging_folder, force=False):
+        index = get_index(staging_folder)
+        diff = index.refresh(force=force)
+        self.image_tree.after(0, self.populate_staging_tree, index, diff)
+
+    def populate_staging_tree(self, index, diff):
+        if self._tree_index.get(self.image_tree) is index:
+            self.apply_tree_diff(self.image_tree, index, diff)
+        else:
+            self.show_index(self.image_tree, index)
+        self.profile.end("staging folder loaded")
+        self._staging_index = index
+        self.update_disk_info()
+
+    def update_disk_info(self):
+        """Show the staged files against the selected format's capacity (block-rounded, see ffhelper_diskdefs)."""
+        index = self._staging_index
+        if index is None:
+            return
+        used_size = index.total_size()
+        info = None
+        if self.configurations_manager and self.disk_format_var.get():
+            info = self.configurations_manager.get_disk_info(self.disk_format_var.get())
+        definition = info.get("definition") if info else None
+
+        if definition:
+            usage = disk_usage(definition, (size for _, size in index.files()))
+            text = f"Disk Size: {usage['capacity']:,} bytes   Free Space: {usage['free']:,} bytes"
+            if not usage["fits"]:
+                text += "   (files do not fit)"
+            self.disk_info_var.set(text)
+        else:
+            self.disk_info_var.set(
+                f"Disk Size: {used_size:,} bytes"
+                if used_size else "Disk Size: N/A   Free Space: N/A"
+            )
+
+    # ----------------------------
+    # Folder watcher
+    # ----------------------------
+    def update_watched_folders(self):
+        """Point the watcher at the current source and staging folders."""
+        if self.watcher is None:
+            return
+        folders = [prefs.get_pref("last_host_folder", None), prefs.get_pref("staging_folder", None)]
+        self.watcher.set_folders([f for f in folders if f and os.path.isdir(f)])
+
+    def on_folder_changed(self, folder, names):
+        """Watcher thread: update the folder index and push the diff to whichever pane shows it."""
+        index = get_index(folder)
+        diff = index.update_entries(names) if names is not None else index.refresh(force=True)
+        if not any(diff.values()):
+            return
+        logger.debug(f"Watcher update {folder}: +{len(diff['added'])} "
+                     f"-{len(diff['removed'])} ~{len(diff['changed'])}")
+        if self._tree_index.get(self.image_tree) is index:
+            self.image_tree.after(0, self.populate_staging_tree, index, diff)
+        if self._tree_index.get(self.folder_tree) is index:
+            self.folder_tree.after(0, self.populate_host_tree, index, diff)
+
+    # ----------------------------
+    # Tree updates (rows use the filename as item id)
+    # ----------------------------
+    def show_index(self, tree, index):
+        """Build the sorted/filtered row list in the background, then fill the tree in batches."""
+        self._tree_index[tree] = index
+        view = dict(self._tree_view[tree])
+        # A newer build supersedes this one even if it finishes first
+        generation = self._tree_generation.get(tree, 0) + 1
+        self._tree_generation[tree] = generation
+        self._tree_filling[tree] = True     # apply_tree_diff rebuilds instead of patching meanwhile
+        pattern, fmt = split_format_filter(view["filter"])
+        pattern, cpm = split_cpm_filter(pattern)
+        definition = self.selected_definition() if cpm else None    # Tk variable: read here, not in build
+
+        def build():
+            rows = index.files()
+            if fmt:
+                names = self.folder_names_of_format(index, fmt)
+                rows = [row for row in rows if row[0] in names]
+            if cpm:
+                names = self.folder_names_with_cpm_file(index, [row[0] for row in rows], cpm, definition)
+                rows = [row for row in rows if row[0] in names]
+            rows = sort_filter_rows(rows, view["sort"], view["reverse"], pattern)
+            tree.after(0, self.fill_tree, tree, rows, generation)
+
+        threading.Thread(target=build, daemon=True).start()
+
+    def fill_tree(self, tree, files, generation):
+        """
+        Replace all rows, inserting TREE_BATCH rows per event-loop turn so the UI
+        stays live. Rows from a build that show_index has since superseded are dropped.
+        """
+        if self._tree_generation.get(tree) != generation:
+            return
+        tree.delete(*tree.get_children())
+        self._insert_tree_batch(tree, files, 0, generation)
+
+    def _insert_tree_batch(self, tree, files, start, generation):
+        if self._tree_generation.get(tree) != generation:
+            return  # superseded by a newer build
+        end = min(start + TREE_BATCH, len(files))
+        for f, size in files[start:end]:
+            tree.insert("", "end", iid=f, values=(f, f"{size:,}"))
+        if end < len(files):
+            tree.after(1, self._insert_tree_batch, tree, files, end, generation)
+        else:
+            self._tree_filling[tree] = False
+
+    def apply_tree_diff(self, tree, index, diff):
+        """Apply an index diff (added/removed/changed names) without rebuilding the tree."""
+        if not any(diff.values()):
+            return
+        view = self._tree_view[tree]
+        if (self._tree_filling.get(tree) or view["filter"]
+                or view["sort"] != "name" or view["reverse"]):
+            # A batched fill is still running, or rows are not in plain name order
+            self.show_index(tree, index)
+            return
+        for name in diff["removed"]:
+            if tree.exists(name):
+                tree.delete(name)
+        for name in diff["changed"]:
+            info = index.get(name)
+            if info and tree.exists(name):
+                tree.item(name, values=(name, f"{info['size']:,}"))
+        children = list(tree.get_children())
+        for name in sorted(diff["added"]):
+            info = index.get(name)
+            if not info or tree.exists(name):
+                continue
+            pos = bisect.bisect(children, name)
+            tree.insert("", pos, iid=name, values=(name, f"{info['size']:,}"))
+            children.insert(pos, name)
+
+    def sort_tree(self, tree, column):
+        """Heading click: sort by column, clicking again reverses."""
+        view = self._tree_view[tree]
+        if view["sort"] == column:
+            view["reverse"] = not view["reverse"]
+        else:
+            view["sort"], view["reverse"] = column, False
+        index = self._tree_index.get(tree)
+        if index:
+            self.show_index(tree, index)
+
+    def on_filter_changed(self, *args):
+        """Debounce typing in the source filter box."""
+        if self._filter_after_id:
+            self.after_cancel(self._filter_after_id)
+        self._filter_after_id = self.after(250, self._apply_source_filter)
+
+    def _apply_source_filter(self):
+        self._filter_after_id = None
+        self._tree_view[self.folder_tree]["filter"] = self.filter_var.get().strip()
+        index = self._tree_index.get(self.folder_tree)
+        if index:
+            self.show_index(self.folder_tree, index)
+            
+    def update_title(self, filename=None):
+        if filename:
+            # ShaZam! — show the filename in brackets in the title
+            self.title(f"{base_title} - [{os.path.basename(filename)}]")
+        else:
+            self.title(base_title)
+
+    # ----------------------------
+    # Insert / Extract / Delete
+    # ----------------------------
+    def insert_file(self):
+        selection = self.folder_tree.selection()
+        if not selection:
+            messagebox.showwarning("Insert", "No files selected in folder.")
+            return
+        files = list(selection)  # item ids are the filenames
+        host_folder = prefs.get_pref("last_host_folder", "")
+        self.disk_manager.insert_files(host_folder, files, callback=lambda:self.populate_staging_folder(self.disk_manager.get_current_staging_path(), force=True))
+
+
+    def delete_file(self):
+        selection = self.image_tree.selection()
+        if not selection:
+            messagebox.showwarning("Delete", "No files selected in disk image.")
+            return
+        files = list(selection)  # item ids are the filenames
+        if messagebox.askyesno("Delete", f"Delete {len(files)} file(s) from Staging?", parent=self):
+            self.disk_manager.delete_files(files, callback=lambda:self.populate_staging_folder(self.disk_manager.get_current_staging_path(), force=True))
+
+# ----------------------------
+# Run App
+# ----------------------------
+def main(profile=None):
+    global LOGFILE
+    profile = profile or StartupProfile(enabled=False)
+    LOGFILE = setup_logging()
+    profile.mark("logging ready")
+    app = FlashFloppyHelper(profile=profile)
+    app.mainloop()
+
+if __name__ == "__main__":
+    main()
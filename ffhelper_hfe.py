@@ -0,0 +1,261 @@
+# ffhelper_hfe.py
+import struct
+import binascii
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------
+# HFE v1 layout (HxC Floppy Emulator)
+# ----------------------------
+# Block 0: header, block 1+: track list (offset in blocks, length in bytes),
+# then per track 512-byte blocks holding 256 bytes of side 0 followed by
+# 256 bytes of side 1. Bitcells are stored least significant bit first.
+BLOCK = 512
+HALF_BLOCK = BLOCK // 2
+SIGNATURE = b"HXCPICFE"
+
+ENC_ISOIBM_MFM = 0x00
+ENC_ISOIBM_FM = 0x02
+GENERIC_SHUGART_DD = 0x07
+
+class HFEError(ValueError):
+    """Raised when an image cannot be laid out as an HFE track stream."""
+
+# ----------------------------
+# Bit manipulation tables
+# ----------------------------
+def _spread(nibble, shift):
+    """Place the 4 bits of nibble at every other bit position of a byte."""
+    out = 0
+    for i in range(4):
+        if nibble & (1 << i):
+            out |= 1 << (2 * i + shift)
+    return out
+
+# Clock bits take the even cell of each pair (sent first), data bits the odd one
+SPREAD_CLOCK_HI = bytes(_spread(b >> 4, 1) for b in range(256))
+SPREAD_CLOCK_LO = bytes(_spread(b & 0x0F, 1) for b in range(256))
+SPREAD_DATA_HI = bytes(_spread(b >> 4, 0) for b in range(256))
+SPREAD_DATA_LO = bytes(_spread(b & 0x0F, 0) for b in range(256))
+DOUBLE_HI = bytes(_spread(b >> 4, 1) | _spread(b >> 4, 0) for b in range(256))
+DOUBLE_LO = bytes(_spread(b & 0x0F, 1) | _spread(b & 0x0F, 0) for b in range(256))
+REVERSE_BITS = bytes(int(f"{b:08b}"[::-1], 2) for b in range(256))
+
+def _or_bytes(a, b):
+    """Bitwise OR of two equal-length byte strings."""
+    return (int.from_bytes(a, "big") | int.from_bytes(b, "big")).to_bytes(len(a), "big")
+
+def _and_bytes(a, b):
+    return (int.from_bytes(a, "big") & int.from_bytes(b, "big")).to_bytes(len(a), "big")
+
+def _interleave(clock, data):
+    """Merge clock and data bytes into cell bytes (c7 d7 c6 d6 ... c0 d0)."""
+    out = bytearray(2 * len(data))
+    out[0::2] = _or_bytes(clock.translate(SPREAD_CLOCK_HI), data.translate(SPREAD_DATA_HI))
+    out[1::2] = _or_bytes(clock.translate(SPREAD_CLOCK_LO), data.translate(SPREAD_DATA_LO))
+    return out
+
+def _double_cells(cells):
+    """Repeat every cell twice (FM written at twice its data rate)."""
+    cells = bytes(cells)
+    out = bytearray(2 * len(cells))
+    out[0::2] = cells.translate(DOUBLE_HI)
+    out[1::2] = cells.translate(DOUBLE_LO)
+    return out
+
+def mfm_encode(data, clock_mask):
+    """
+    MFM encode data bytes. A clock bit is 1 only between two 0 data bits;
+    clock_mask clears clock bits for missing-clock sync marks (A1/C2).
+    """
+    n = len(data) * 8
+    d = int.from_bytes(data, "big")
+    previous = d >> 1          # data bit sent just before each bit (0 before the first)
+    clock = ~(d | previous) & ((1 << n) - 1)
+    clock_bytes = clock.to_bytes(len(data), "big")
+    return _interleave(_and_bytes(clock_bytes, clock_mask), bytes(data))
+
+def fm_encode(data, clock):
+    """FM encode data bytes with explicit clock bytes (0xFF, or C7/D7 for marks)."""
+    return _interleave(bytes(clock), bytes(data))
+
+# ----------------------------
+# IBM System 34 track layout
+# ----------------------------
+MFM_SYNC_CLOCK_A1 = 0xFB   # A1 with missing clock -> 0x4489
+MFM_SYNC_CLOCK_C2 = 0xF7   # C2 with missing clock -> 0x5224
+FM_CLOCK_MARK = 0xC7       # IDAM / DAM clock pattern
+FM_CLOCK_IAM = 0xD7
+
+MFM_LAYOUT = {"gap4a": 80, "sync": 12, "gap1": 50, "gap2": 22, "gap3": 84, "fill": 0x4E, "min_gap3": 8}
+FM_LAYOUT = {"gap4a": 40, "sync": 6, "gap1": 26, "gap2": 11, "gap3": 27, "fill": 0xFF, "min_gap3": 6}
+
+class _TrackBuilder:
+    """Accumulates track bytes plus a parallel clock array (mask for MFM, clock for FM)."""
+
+    def __init__(self, mfm, capacity):
+        self.mfm = mfm
+        self.capacity = capacity
+        self.data = bytearray()
+        self.clock = bytearray()
+
+    def put(self, payload, clock=0xFF):
+        self.data += payload
+        self.clock += bytes((clock,)) * len(payload)
+
+    def fill(self, byte, count):
+        self.put(bytes((byte,)) * count)
+
+    def mark(self, mark, sync_byte, sync_clock, fm_clock):
+        """Emit an address mark; returns the bytes covered by the CRC."""
+        if self.mfm:
+            self.put(bytes((sync_byte,)) * 3, sync_clock)
+            self.put(bytes((mark,)))
+            return bytes((sync_byte,)) * 3 + bytes((mark,))
+        self.put(bytes((mark,)), fm_clock)
+        return bytes((mark,))
+
+    def finish(self, fill):
+        if len(self.data) > self.capacity:
+            raise HFEError(f"Track layout needs {len(self.data)} bytes, only {self.capacity} fit")
+        self.fill(fill, self.capacity - len(self.data))
+        if self.mfm:
+            return mfm_encode(self.data, self.clock)
+        return fm_encode(self.data, self.clock)
+
+def _sector_overhead(layout, mfm):
+    sync_marks = 4 if mfm else 1
+    return 2 * (layout["sync"] + sync_marks) + 4 + 2 + layout["gap2"] + 2
+
+def layout_track(track, capacity):
+    """Lay out one Track as IBM-format bytes and encode it to cells (MSB first)."""
+    mfm = track.mfm
+    layout = MFM_LAYOUT if mfm else FM_LAYOUT
+    builder = _TrackBuilder(mfm, capacity)
+    sectors = track.sectors
+
+    preamble = layout["gap4a"] + layout["sync"] + (4 if mfm else 1) + layout["gap1"]
+    used = preamble + sum(_sector_overhead(layout, mfm) + s.size for s in sectors)
+    gap3 = layout["gap3"]
+    if sectors:
+        gap3 = min(gap3, (capacity - used) // len(sectors))
+        if gap3 < layout["min_gap3"]:
+            raise HFEError(f"Track c{track.cyl} h{track.head}: {len(sectors)} sectors do not fit")
+
+    fill = layout["fill"]
+    builder.fill(fill, layout["gap4a"])
+    builder.fill(0x00, layout["sync"])
+    builder.mark(0xFC, 0xC2, MFM_SYNC_CLOCK_C2, FM_CLOCK_IAM)
+    builder.fill(fill, layout["gap1"])
+
+    for s in sectors:
+        builder.fill(0x00, layout["sync"])
+        crc_prefix = builder.mark(0xFE, 0xA1, MFM_SYNC_CLOCK_A1, FM_CLOCK_MARK)
+        id_field = bytes((s.cyl, s.head, s.sector, s.size_code))
+        builder.put(id_field)
+        builder.put(struct.pack(">H", binascii.crc_hqx(id_field, binascii.crc_hqx(crc_prefix, 0xFFFF))))
+        builder.fill(fill, layout["gap2"])
+
+        builder.fill(0x00, layout["sync"])
+        crc_prefix = builder.mark(0xF8 if s.deleted else 0xFB, 0xA1, MFM_SYNC_CLOCK_A1, FM_CLOCK_MARK)
+        builder.put(s.data)
+        crc = binascii.crc_hqx(s.data, binascii.crc_hqx(crc_prefix, 0xFFFF))
+        if s.bad:
+            crc ^= 0xFFFF  # keep the read error visible to the host
+        builder.put(struct.pack(">H", crc))
+        builder.fill(fill, gap3)
+
+    return builder.finish(fill)
+
+# ----------------------------
+# HFE file
+# ----------------------------
+def _rpm_for_rate(rate):
+    return 360 if rate == 300 else 300
+
+def hfe_layout(cyls, rate):
+    """(side_bytes, track_blocks, first_track_block, total_bytes) of an HFE v1 file."""
+    rpm = _rpm_for_rate(rate)
+    # Stream bits per side: two cells per MFM data bit at the disk data rate
+    side_bytes = rate * 1000 * 2 * 60 // rpm // 8
+    side_padded = -(-side_bytes // HALF_BLOCK) * HALF_BLOCK
+    track_blocks = side_padded // HALF_BLOCK
+    list_blocks = -(-cyls * 4 // BLOCK)
+    first_track_block = 1 + list_blocks
+    return side_bytes, track_blocks, first_track_block, (first_track_block + cyls * track_blocks) * BLOCK
+
+def hfe_size(image):
+    """Size in bytes of the HFE file encode_hfe() would produce, without encoding."""
+    if not image.tracks:
+        raise HFEError("Image has no tracks")
+    return hfe_layout(image.cylinders, max(t.rate for t in image.tracks))[3]
+
+def encode_hfe(image):
+    """Encode a DiskImage to HFE v1 bytes (bytearray)."""
+    if not image.tracks:
+        raise HFEError("Image has no tracks")
+
+    cyls = image.cylinders
+    heads = image.heads
+    rate = max(t.rate for t in image.tracks)
+    rpm = _rpm_for_rate(rate)
+    side_bytes, track_blocks, first_track_block, total = hfe_layout(cyls, rate)
+
+    out = bytearray(b"\xff") * total
+
+    all_mfm = all(t.mfm for t in image.tracks if t.sectors)
+    track0_fm = [(t.head, not t.mfm) for t in image.tracks if t.cyl == 0 and t.sectors]
+    encoding = ENC_ISOIBM_MFM if all_mfm or any(t.mfm for t in image.tracks if t.cyl > 0) else ENC_ISOIBM_FM
+
+    struct.pack_into("<8sBBBBHHBBHBB", out, 0, SIGNATURE, 0, cyls, heads, encoding,
+                     rate, rpm, GENERIC_SHUGART_DD, 1, 1, 0xFF, 0xFF)
+    for head, is_fm in track0_fm:
+        if is_fm != (encoding == ENC_ISOIBM_FM):
+            # Alternate encoding for track 0 (e.g. FM boot track on an MFM disk)
+            alt_enc = ENC_ISOIBM_FM if is_fm else ENC_ISOIBM_MFM
+            struct.pack_into("BB", out, 0x16 + 2 * head, 0x00, alt_enc)
+
+    by_pos = {(t.cyl, t.head): t for t in image.tracks}
+    empty_side = None
+    for cyl in range(cyls):
+        offset_block = first_track_block + cyl * track_blocks
+        struct.pack_into("<HH", out, BLOCK + cyl * 4, offset_block, 2 * side_bytes)
+        base = offset_block * BLOCK
+
+        for head in range(2):
+            track = by_pos.get((cyl, head)) if head < heads else None
+            if track is None or not track.sectors:
+                if empty_side is None:
+                    empty_side = mfm_encode(bytes((0x4E,)) * (side_bytes // 2),
+                                            bytes((0xFF,)) * (side_bytes // 2)).translate(REVERSE_BITS)
+                cells = empty_side
+            else:
+                # Stream cells per track cell: FM and slower tracks are stretched
+                if rate % track.rate:
+                    raise HFEError(f"Track c{cyl} h{head}: {track.rate} kbps cannot be mixed with {rate} kbps")
+                ratio = (rate // track.rate) * (1 if track.mfm else 2)
+                if ratio & (ratio - 1):
+                    raise HFEError(f"Track c{cyl} h{head}: unsupported rate ratio {ratio}")
+                capacity = side_bytes // (2 * ratio)
+                cells = layout_track(track, capacity)
+                while ratio > 1:
+                    cells = _double_cells(cells)
+                    ratio //= 2
+                cells = bytes(cells).translate(REVERSE_BITS)
+
+            view = memoryview(cells)
+            for block in range(track_blocks):
+                chunk = view[block * HALF_BLOCK:(block + 1) * HALF_BLOCK]
+                start = base + block * BLOCK + head * HALF_BLOCK
+                out[start:start + len(chunk)] = chunk
+
+    return out
+
+def write_hfe(image, out_path):
+    """Encode a DiskImage and write it as an HFE file in one buffered call. Returns out_path."""
+    data = encode_hfe(image)
+    with open(out_path, "wb") as f:
+        f.write(data)
+    logger.debug(f"write_hfe wrote {len(data):,} bytes to {out_path}")
+    return out_path
@@ -0,0 +1,156 @@
+# ffhelper_imd.py
+import struct
+import logging
+from ffhelper_diskimage import DiskImage, Track, Sector, DSK_WRITERS
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------
+# ImageDisk (.IMD) layout
+# ----------------------------
+# "IMD v.vv: dd/mm/yyyy hh:mm:ss" + comment, terminated by 0x1A, then per track:
+#   mode, cylinder, head (+flags), sector count, size code,
+#   sector numbering map, [cylinder map], [head map], [size table], sector records
+SIGNATURE = b"IMD "
+COMMENT_END = 0x1A
+
+HEAD_MASK = 0x0F
+HEAD_HAS_CYL_MAP = 0x80
+HEAD_HAS_HEAD_MAP = 0x40
+SIZE_TABLE = 0xFF
+
+# mode -> (data rate kbps, mfm)
+MODES = {
+    0: (500, False),
+    1: (300, False),
+    2: (250, False),
+    3: (500, True),
+    4: (300, True),
+    5: (250, True),
+}
+
+# Sector record types
+REC_UNAVAILABLE = 0x00
+# type -> (compressed, deleted, data error)
+RECORD_TYPES = {
+    0x01: (False, False, False),
+    0x02: (True, False, False),
+    0x03: (False, True, False),
+    0x04: (True, True, False),
+    0x05: (False, False, True),
+    0x06: (True, False, True),
+    0x07: (False, True, True),
+    0x08: (True, True, True),
+}
+
+MISSING_FILL = 0xE5
+
+class IMDError(ValueError):
+    """Raised when a file is not a usable ImageDisk image."""
+
+def decode_imd(buf):
+    """Decode an ImageDisk image held in memory (bytes) into a DiskImage."""
+    if not buf.startswith(SIGNATURE):
+        raise IMDError("Missing 'IMD ' signature")
+    end = buf.find(bytes((COMMENT_END,)))
+    if end == -1:
+        raise IMDError("Missing header terminator (0x1A)")
+
+    comment = buf[:end].decode("latin-1")
+    image = DiskImage(source_format="IMD", comment=comment)
+    mv = memoryview(buf)
+    pos = end + 1
+    size = len(buf)
+
+    try:
+        while pos < size:
+            mode, cyl, head_flags, nsec, size_code = struct.unpack_from("5B", buf, pos)
+            pos += 5
+            if mode not in MODES:
+                raise IMDError(f"Unknown track mode {mode} at offset {pos - 5}")
+            rate, mfm = MODES[mode]
+            head = head_flags & HEAD_MASK
+
+            sec_map = buf[pos:pos + nsec]
+            pos += nsec
+            cyl_map = head_map = None
+            if head_flags & HEAD_HAS_CYL_MAP:
+                cyl_map = buf[pos:pos + nsec]
+                pos += nsec
+            if head_flags & HEAD_HAS_HEAD_MAP:
+                head_map = buf[pos:pos + nsec]
+                pos += nsec
+            if size_code == SIZE_TABLE:
+                sizes = struct.unpack_from(f"<{nsec}H", buf, pos)
+                pos += 2 * nsec
+            else:
+                sizes = (128 << size_code,) * nsec
+
+            track = Track(cyl, head, mfm=mfm, rate=rate)
+            for i in range(nsec):
+                rec = buf[pos]
+                pos += 1
+                sec_size = sizes[i]
+                sec_cyl = cyl_map[i] if cyl_map is not None else cyl
+                sec_head = head_map[i] if head_map is not None else head
+
+                if rec == REC_UNAVAILABLE:
+                    data = bytes((MISSING_FILL,)) * sec_size
+                    deleted, bad = False, True
+                elif rec in RECORD_TYPES:
+                    compressed, deleted, bad = RECORD_TYPES[rec]
+                    if compressed:
+                        data = bytes((buf[pos],)) * sec_size
+                        pos += 1
+                    else:
+                        if pos + sec_size > size:
+                            raise IMDError(f"Sector data runs past end of file (c{cyl} h{head} s{sec_map[i]})")
+                        data = mv[pos:pos + sec_size]
+                        pos += sec_size
+                else:
+                    raise IMDError(f"Unknown sector record type 0x{rec:02X} at offset {pos - 1}")
+
+                track.sectors.append(Sector(sec_cyl, sec_head, sec_map[i], data, deleted=deleted, bad=bad))
+            image.tracks.append(track)
+    except (struct.error, IndexError):
+        raise IMDError(f"Truncated IMD at offset {pos}")
+
+    logger.debug(f"decode_imd: {image}")
+    return image
+
+def read_imd(path):
+    """Read and decode an IMD file."""
+    with open(path, "rb") as f:
+        return decode_imd(f.read())
+
+def is_raw_compatible(image):
+    """True if every track has the same sector count and size (a flat DSK can represent it)."""
+    shape = None
+    for track in image.tracks:
+        sizes = {s.size for s in track.sectors}
+        if len(sizes) > 1:
+            return False
+        this = (len(track.sectors), sizes.pop() if sizes else 0)
+        if shape is None:
+            shape = this
+        elif this != shape:
+            return False
+    return True
+
+def convert_imd(in_path, out_path, otype="dsk"):
+    """
+    Convert an IMD image in-process to a libdsk output type: 'dsk' (standard
+    CPC DSK), 'edsk' (Extended CPC DSK) or 'raw' (flat sector dump).
+    Raises IMDError for images or output types this codec cannot represent.
+    """
+    otype = (otype or "dsk").lower()
+    writer = DSK_WRITERS.get(otype)
+    if writer is None:
+        raise IMDError(f"Unsupported output type '{otype}'")
+    image = read_imd(in_path)
+    if otype == "raw" and not is_raw_compatible(image):
+        raise IMDError("Mixed track geometry cannot be written as a raw DSK")
+    try:
+        return writer(image, out_path)
+    except ValueError as e:
+        raise IMDError(str(e)) from e
@@ -0,0 +1,249 @@
+# ffhelper_index.py
+import os
+import json
+import stat
+import time
+import hashlib
+import tempfile
+import threading
+import logging
+from ffhelper_utils import get_resource_path
+from ffhelper_planner import file_format
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+# Folder mtimes this close to the last scan may hide later changes
+# (coarse timestamps on FAT/HFS+/SMB), so such folders are rescanned.
+RACY_WINDOW_NS = 2 * 1000 * 1000 * 1000
+
+def get_index_folder():
+    """Return path to the persistent index folder, create if missing."""
+    index_dir = get_resource_path(os.path.join("cache", "index"))
+    os.makedirs(index_dir, exist_ok=True)
+    return index_dir
+
+def scan_folder(folder_path):
+    """
+    One pass over a folder with os.scandir.
+    Output: {filename: {"size": int, "mtime": int (ns), "format": str}}
+    """
+    entries = {}
+    with os.scandir(folder_path) as it:
+        for entry in it:
+            try:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            entries[entry.name] = {
+                "size": st.st_size,
+                "mtime": st.st_mtime_ns,
+                "format": file_format(entry.name),
+            }
+    return entries
+
+class DirectoryIndex:
+    """
+    Cached listing of one folder, persisted between runs.
+
+    refresh() costs a single stat of the folder while its mtime is unchanged;
+    otherwise it rescans with os.scandir and returns what was added, removed
+    or changed so views can update incrementally.
+    """
+
+    def __init__(self, folder, index_dir=None):
+        self.folder = os.path.abspath(folder)
+        self.index_dir = index_dir
+        self.entries = {}
+        self.dir_mtime = None
+        self.scanned_at = 0
+        self._lock = threading.RLock()
+        self._load()
+
+    # ----------------------------
+    # Persistence
+    # ----------------------------
+    def _index_path(self):
+        index_dir = self.index_dir or get_index_folder()
+        key = hashlib.sha1(self.folder.encode("utf-8")).hexdigest()
+        return os.path.join(index_dir, key + ".json")
+
+    def _load(self):
+        path = self._index_path()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable index {path}: {e}")
+            return
+        if data.get("version") != INDEX_VERSION or data.get("folder") != self.folder:
+            return
+        self.entries = data.get("entries", {})
+        self.dir_mtime = data.get("dir_mtime")
+        self.scanned_at = data.get("scanned_at", 0)
+        logger.debug(f"Loaded index for {self.folder}: {len(self.entries)} entries")
+
+    def save(self):
+        """Write the index atomically."""
+        path = self._index_path()
+        with self._lock:
+            data = {"version": INDEX_VERSION, "folder": self.folder,
+                    "dir_mtime": self.dir_mtime, "scanned_at": self.scanned_at,
+                    "entries": self.entries}
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".index.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not save index {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    # ----------------------------
+    # Refresh
+    # ----------------------------
+    def refresh(self, force=False):
+        """
+        Bring the index up to date.
+
+        Returns a diff dict {"added": [name], "removed": [name], "changed": [name]}.
+        The folder is only rescanned when its mtime changed, was too close to
+        the last scan to trust (RACY_WINDOW_NS), or force is True (use force to
+        catch files rewritten in place, which do not touch the folder mtime).
+        """
+        diff = {"added": [], "removed": [], "changed": []}
+        try:
+            dir_mtime = os.stat(self.folder).st_mtime_ns
+        except OSError as e:
+            logger.error(f"Error listing host files: {e}")
+            with self._lock:
+                if self.entries:
+                    diff["removed"] = sorted(self.entries)
+                    self.entries = {}
+                    self.dir_mtime = None
+            return diff
+
+        with self._lock:
+            racy = dir_mtime >= self.scanned_at - RACY_WINDOW_NS
+            if not force and not racy and dir_mtime == self.dir_mtime:
+                return diff
+
+            scanned_at = time.time_ns()
+            current = scan_folder(self.folder)
+            old = self.entries
+            for name, info in current.items():
+                prev = old.get(name)
+                if prev is None:
+                    diff["added"].append(name)
+                elif prev["size"] != info["size"] or prev["mtime"] != info["mtime"]:
+                    diff["changed"].append(name)
+                else:
+                    # keep anything detected earlier (e.g. a sniffed format)
+                    current[name] = prev
+            diff["removed"] = [name for name in old if name not in current]
+            self.entries = current
+            self.dir_mtime = dir_mtime
+            self.scanned_at = scanned_at
+
+        self.save()
+        logger.debug(f"Index refresh {self.folder}: +{len(diff['added'])} "
+                     f"-{len(diff['removed'])} ~{len(diff['changed'])}")
+        return diff
+
+    def update_entries(self, names):
+        """
+        Re-stat only the given file names (e.g. reported by a folder watcher)
+        and return the same diff dict as refresh(). The folder mtime is left
+        alone so the next refresh() still verifies the full listing once.
+        """
+        diff = {"added": [], "removed": [], "changed": []}
+        with self._lock:
+            for name in sorted(names):
+                try:
+                    st = os.stat(os.path.join(self.folder, name))
+                    is_file = stat.S_ISREG(st.st_mode)
+                except OSError:
+                    is_file = False
+                prev = self.entries.get(name)
+                if not is_file:
+                    if prev is not None:
+                        del self.entries[name]
+                        diff["removed"].append(name)
+                    continue
+                if prev is not None and prev["size"] == st.st_size and prev["mtime"] == st.st_mtime_ns:
+                    continue
+                self.entries[name] = {"size": st.st_size, "mtime": st.st_mtime_ns, "format": file_format(name)}
+                diff["added" if prev is None else "changed"].append(name)
+
+        if any(diff.values()):
+            self.save()
+        return diff
+
+    def sniff(self, names=None, workers=None, known=None):
+        """
+        Detect the real format of entries not sniffed since they last changed
+        (see ffhelper_sniff) and store it in their "format", with "detected"
+        and "detail". known: optional {name: dict with the same keys plus
+        "size" and "mtime"} (e.g. catalog rows) used instead of reading files
+        that have not changed since. Returns {name: format} for names (default all entries).
+        """
+        with self._lock:
+            wanted = [n for n in (self.entries if names is None else names) if n in self.entries]
+            todo = [n for n in wanted if "detected" not in self.entries[n]]
+            results = {n: known[n] for n in todo if known and n in known
+                       and known[n]["size"] == self.entries[n]["size"]
+                       and known[n]["mtime"] == self.entries[n]["mtime"]}
+        if todo:
+            unknown = [n for n in todo if n not in results]
+            if unknown:
+                from ffhelper_sniff import sniff_folder   # image codecs load on first use, not at startup
+                results.update(sniff_folder(self.folder, unknown, workers))
+            with self._lock:
+                for name, result in results.items():
+                    entry = self.entries.get(name)
+                    # skip files that changed while being read; the next refresh re-sniffs them
+                    if entry is not None and entry["size"] == result["size"] and entry["mtime"] == result["mtime"]:
+                        entry.update(format=result["format"], detected=result["detected"], detail=result["detail"])
+            self.save()
+            logger.debug(f"Sniffed {len(results)} file(s) in {self.folder}")
+        return self.formats(wanted)
+
+    # ----------------------------
+    # Queries
+    # ----------------------------
+    def formats(self, names=None):
+        """{name: format} from the index (sniffed where sniff() ran, else the extension)."""
+        with self._lock:
+            return {n: self.entries[n]["format"] for n in (self.entries if names is None else names)
+                    if n in self.entries}
+
+    def files(self):
+        """Output: [(filename, size), ...] sorted by name, like utils.list_files."""
+        with self._lock:
+            return sorted((name, info["size"]) for name, info in self.entries.items())
+
+    def get(self, name):
+        with self._lock:
+            return self.entries.get(name)
+
+    def total_size(self):
+        with self._lock:
+            return sum(info["size"] for info in self.entries.values())
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_index(folder):
+    """Return the shared DirectoryIndex for folder."""
+    key = os.path.abspath(folder)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = DirectoryIndex(key)
+            _indexes[key] = index
+        return index
@@ -0,0 +1,183 @@
+# ffhelper_jobs.py
+import time
+import threading
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+class JobCancelled(RuntimeError):
+    """Raised by CancelToken.check() once a job has been cancelled."""
+
+class CancelToken:
+    """Cooperative cancellation flag, checked by workers between files."""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise JobCancelled("Cancelled")
+
+def format_rate(bytes_per_sec):
+    """Human readable throughput, e.g. '12.3 MB/s'."""
+    for unit in ("B/s", "KB/s", "MB/s", "GB/s"):
+        if bytes_per_sec < 1024 or unit == "GB/s":
+            return f"{bytes_per_sec:.1f} {unit}"
+        bytes_per_sec /= 1024
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds // 60 % 60:02d}m"
+
+class Job:
+    """
+    Progress for one long-running operation (insert, delete, export).
+
+    Workers call check() between files, wrap work in stage(name) and call
+    advance() when a file is done. Progress lines go to status_callback at
+    most every report_interval seconds and to the log every log_interval.
+    Stage times are summed over all worker threads (busy time, not wall time).
+    """
+
+    def __init__(self, name, total_files=0, total_bytes=0, status_callback=None,
+                 token=None, report_interval=0.5, log_interval=5.0):
+        self.name = name
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.status_callback = status_callback
+        self.token = token or CancelToken()
+        self.report_interval = report_interval
+        self.log_interval = log_interval
+        self.files_done = 0
+        self.bytes_done = 0
+        self.stage_times = {}
+        self.started = time.monotonic()
+        self.finished = None
+        self._last_report = 0.0
+        self._last_log = self.started
+        self._lock = threading.Lock()
+
+    # ----------------------------
+    # Worker API
+    # ----------------------------
+    def check(self):
+        self.token.check()
+
+    def cancel(self):
+        self.token.cancel()
+        logger.info(f"{self.name}: cancel requested")
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+    def add_totals(self, files=0, nbytes=0):
+        with self._lock:
+            self.total_files += files
+            self.total_bytes += nbytes
+
+    def advance(self, files=1, nbytes=0):
+        with self._lock:
+            self.files_done += files
+            self.bytes_done += nbytes
+        self._maybe_report()
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block of work under a stage name (copy, convert, ...)."""
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - t0
+            with self._lock:
+                self.stage_times[name] = self.stage_times.get(name, 0.0) + elapsed
+
+    # ----------------------------
+    # Reporting
+    # ----------------------------
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    def rates(self):
+        """(files per second, bytes per second) since the job started."""
+        elapsed = self.elapsed
+        if elapsed <= 0:
+            return 0.0, 0.0
+        return self.files_done / elapsed, self.bytes_done / elapsed
+
+    def eta(self):
+        """Seconds left, from bytes when totals are known, else from files; None if unknown."""
+        files_rate, bytes_rate = self.rates()
+        if self.total_bytes and bytes_rate > 0:
+            return max(self.total_bytes - self.bytes_done, 0) / bytes_rate
+        if self.total_files and files_rate > 0:
+            return max(self.total_files - self.files_done, 0) / files_rate
+        return None
+
+    def status_line(self):
+        files_rate, bytes_rate = self.rates()
+        done = f"{self.files_done}/{self.total_files}" if self.total_files else f"{self.files_done}"
+        line = f"{self.name}: {done} files, {format_rate(bytes_rate)}, {files_rate:.1f} files/s"
+        if self.finished is None:
+            eta = self.eta()
+            if eta is not None:
+                line += f", ETA {format_duration(eta)}"
+        else:
+            line += f", {format_duration(self.elapsed)}"
+        if self.cancelled:
+            line += " (cancelled)"
+        return line
+
+    def _maybe_report(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            send = force or now - self._last_report >= self.report_interval
+            log = force or now - self._last_log >= self.log_interval
+            if send:
+                self._last_report = now
+            if log:
+                self._last_log = now
+        if not (send or log):
+            return
+        line = self.status_line()
+        if log:
+            logger.info(line)
+        if send and self.status_callback:
+            self.status_callback(line)
+
+    def finish(self):
+        """Stop the clock, send a final progress line and return summary()."""
+        if self.finished is None:
+            self.finished = time.monotonic()
+        self._maybe_report(force=True)
+        return self.summary()
+
+    def summary(self):
+        files_rate, bytes_rate = self.rates()
+        with self._lock:
+            return {
+                "name": self.name,
+                "files": self.files_done,
+                "total_files": self.total_files,
+                "bytes": self.bytes_done,
+                "total_bytes": self.total_bytes,
+                "elapsed": round(self.elapsed, 3),
+                "files_per_sec": round(files_rate, 2),
+                "bytes_per_sec": round(bytes_rate, 1),
+                "stages": {name: round(t, 3) for name, t in self.stage_times.items()},
+                "cancelled": self.cancelled,
+            }
@@ -1,8 +1,17 @@
-import logging
+import os
 import sys
+import queue
+import atexit
+import codecs
+import logging
+import logging.handlers
 from pathlib import Path
-from datetime import datetime
-from ffhelper_utils import get_resource_path
+from ffhelper_utils import get_resource_path, parse_size
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+LOG_NAME = "ffhelper.log"
+
+_listener = None
 
 def get_app_root():
     """Return folder containing the executable when frozen,
@@ -15,27 +24,126 @@ def get_app_root():
         return Path(__file__).resolve().parent
 
 def get_log_path():
-    """Generate a new timestamped log file for each run."""
-    app_root = Path(get_resource_path("logs"))
-    logs_dir = app_root
+    """Path of the current log file (older runs rotate to ffhelper.log.1, .2, ...)."""
+    logs_dir = Path(get_resource_path("logs"))
     logs_dir.mkdir(exist_ok=True)
+    return logs_dir / LOG_NAME
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_filename = f"ffhelper_{timestamp}.log"
+def _log_level(value, default=logging.DEBUG):
+    """Level from a pref value such as 'INFO' or 20."""
+    if isinstance(value, int):
+        return value
+    level = logging.getLevelName(str(value).upper())
+    return level if isinstance(level, int) else default
 
-    return logs_dir / log_filename
+def setup_logging(console_level=logging.DEBUG):
+    """
+    Route all logging through a queue so worker threads never wait on disk.
+
+    A QueueListener thread writes records to a RotatingFileHandler
+    (prefs 'log_max_mb', default 10, and 'log_backups', default 5) and to the
+    console. The file level comes from prefs 'log_level' (default DEBUG).
+    Each launch starts a fresh file; the previous run becomes ffhelper.log.1.
+    Returns the log file path.
+    """
+    global _listener
+    import ffhelper_prefs as prefs
 
-def setup_logging():
     log_path = get_log_path()
+    level = _log_level(prefs.get_pref("log_level", "DEBUG"))
+    max_bytes = max(1, parse_size(prefs.get_pref("log_max_mb", 10))) * 1024 * 1024
+    backups = max(1, parse_size(prefs.get_pref("log_backups", 5)))
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True)
+    if log_path.exists() and log_path.stat().st_size > 0:
+        try:
+            file_handler.doRollover()
+        except OSError:
+            pass    # held open by another running instance (Windows); keep appending
+    file_handler.setLevel(level)
+    file_handler.setFormatter(formatter)
+
+    console = logging.StreamHandler()  # prints during dev
+    console.setLevel(console_level)
+    console.setFormatter(formatter)
+
+    if _listener is not None:
+        _listener.stop()
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
 
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-        handlers=[
-            logging.FileHandler(log_path, encoding="utf-8"),
-            logging.StreamHandler(),  # prints during dev
-        ],
-    )
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(min(level, console_level))
 
     logging.getLogger(__name__).info(f"Logging initialized: {log_path}")
     return log_path
+
+# ----------------------------
+# Log tailing
+# ----------------------------
+class LogTail:
+    """
+    Incremental reader for a growing log file: read_tail() returns the end of
+    the file, read_new() whatever was appended since, at most chunk_size bytes
+    per call. A rotated or truncated file is followed from its start.
+    """
+
+    def __init__(self, path, chunk_size=64 * 1024):
+        self.path = str(path)
+        self.chunk_size = chunk_size
+        self._file = None
+        self._inode = None
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def _open(self):
+        self.close()
+        self._file = open(self.path, "rb")
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        self._decoder.reset()
+
+    def read_tail(self, max_bytes):
+        """Open the file and return (text of its last max_bytes, bytes skipped before it)."""
+        if not os.path.exists(self.path):
+            return "", 0    # not written yet; read_new() picks it up
+        self._open()
+        size = os.fstat(self._file.fileno()).st_size
+        skipped = max(size - max_bytes, 0)
+        self._file.seek(skipped)
+        data = self._file.read(max_bytes)
+        if skipped:
+            # Start on a line boundary
+            newline = data.find(b"\n")
+            skipped += newline + 1
+            data = data[newline + 1:]
+        return self._decoder.decode(data), skipped
+
+    def _rotated(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return st.st_ino != self._inode or st.st_size < self._file.tell()
+
+    def read_new(self):
+        """Text appended since the last read (up to chunk_size bytes); '' if nothing new."""
+        if self._file is None:
+            if not os.path.exists(self.path):
+                return ""
+            self._open()
+        data = self._file.read(self.chunk_size)
+        if not data and self._rotated():
+            self._open()
+            data = self._file.read(self.chunk_size)
+        return self._decoder.decode(data)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
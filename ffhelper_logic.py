@@ -1,164 +1,371 @@
 # viewcpm_logic.py
 import os
 import shutil
-import platform
-import subprocess
 import ffhelper_prefs as prefs
 import shlex
+import struct
+import threading
 from ffhelper_utils import get_resource_path
 import ffhelper_utils as utils  # ensure list_files is available
+from ffhelper_planner import ConversionPlanner, file_format
+from ffhelper_cache import ConversionCache, evict_lru
+from ffhelper_copy import fast_copy
+from ffhelper_jobs import Job, JobCancelled
+from ffhelper_exec import ConverterRunner, ConverterError, IS_WINDOWS
+from ffhelper_tools import get_tool_registry
+from ffhelper_scratch import ScratchSpace
+from ffhelper_configurations import get_configurations
+from ffhelper_index import get_index
+from ffhelper_dedup import find_duplicates
+import ffhelper_dmk as dmk
+import ffhelper_imd as imd
+import ffhelper_hfe as hfe
+from ffhelper_diskimage import DSK_WRITERS
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 logger = logging.getLogger(__name__)
 
 # ----------------------------
 # Utilities
 # ----------------------------
+_runner = None
+_runner_lock = threading.Lock()
+
+def get_runner():
+    """
+    Return the shared ConverterRunner. Concurrency comes from prefs
+    'converter_concurrency' (default: CPU count, at least 4), the per-run timeout from
+    'converter_timeout' in seconds (default 300, 0 = no limit). Tools are
+    looked up in the ToolRegistry of their tools folder.
+    """
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = ConverterRunner(
+                max_concurrent=utils.parse_size(prefs.get_pref("converter_concurrency", 0)),
+                timeout=utils.parse_size(prefs.get_pref("converter_timeout", 300)),
+                resolver=lambda tools_path, exe: get_tool_registry(tools_path).path(exe))
+        return _runner
+
+def _diskdefs_context(use_diskdefs, directorystr):
+    """(cpmtools, cwd) for tools that read diskdefs via CPMTOOLS."""
+    if not use_diskdefs:
+        return None, None
+    cwd = get_resource_path(os.path.dirname(directorystr)) if directorystr else None
+    return directorystr, cwd
+
 def run_command(cmd, use_diskdefs=False, directorystr=None):
     """
-    Run shell command and return (success, output).
+    Run a command and return (success, output).
 
     Parameters:
-        cmd (str): Command to run.
-        cwd (str|None): Optional working directory.
-        use_diskdefs (bool): If True, set CPMTOOLS to directorystr.
+        cmd (str|list): Command line (split with shlex, no shell) or argument vector.
+        use_diskdefs (bool): If True, set CPMTOOLS to directorystr and run in its folder.
     """
+    runner = get_runner()
+    argv = shlex.split(cmd, posix=not IS_WINDOWS) if isinstance(cmd, str) else list(cmd)
+    cpmtools, cwd = _diskdefs_context(use_diskdefs, directorystr)
     try:
-        env = os.environ.copy()
-        if use_diskdefs and directorystr:
-            env['CPMTOOLS'] = directorystr
-            
-        if use_diskdefs:
-            cwd = os.path.dirname(directorystr)  # get directory
-            cwd = get_resource_path(cwd)
-        else:
-            cwd = None
-       
-        logger.debug(f"run_command {cmd} in {cwd}")
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            cwd=cwd,
-            env=env
-        )
-        return True, result.stdout
-    except subprocess.CalledProcessError as e:
-        return False, e.stderr
+        env = runner.environment(os.path.dirname(argv[0]), cpmtools)
+        return True, runner.run(argv, env=env, cwd=cwd)
+    except ConverterError as e:
+        return False, str(e)
+    except OSError as e:
+        return False, f"{argv[0]}: {e}"
+
+_tmp_cleaned = False
 
 def get_tmp_folder():
-    """Return path to tmp folder, create if missing."""
+    """Return path to tmp folder, create if missing. Old files are trimmed on first use only."""
+    global _tmp_cleaned
     tmp_dir = get_resource_path("tmp")
     os.makedirs(tmp_dir, exist_ok=True)
-    cleanup_tmp(tmp_dir)
+    if not _tmp_cleaned:
+        _tmp_cleaned = True
+        cleanup_tmp(tmp_dir)
     return tmp_dir
 
 def cleanup_tmp(tmp_dir):
-    """Delete oldest files if more than prefs['max_tmp_files'] exist."""
-    max_files = prefs.get_pref("max_tmp_files", 20)
-    files = [os.path.join(tmp_dir, f) for f in os.listdir(tmp_dir) if os.path.isfile(os.path.join(tmp_dir, f))]
-    if len(files) <= max_files:
-        return
-    # sort by modification time
-    files.sort(key=os.path.getmtime)
-    for f in files[:len(files)-max_files]:
-        os.remove(f)              
-        
+    """Delete least recently used tmp files once they exceed prefs['max_tmp_mb']."""
+    max_bytes = utils.parse_size(prefs.get_pref("max_tmp_mb", 256)) * 1024 * 1024
+    evict_lru(tmp_dir, max_bytes)
+
+# Intermediates are estimated at this multiple of the source size (TD0 and
+# IMD compress, the raw images they turn into do not)
+SCRATCH_SIZE_FACTOR = 4
+SCRATCH_MIN_HINT = 4 * 1024 * 1024
+
+_scratch_space = None
+_scratch_lock = threading.Lock()
+
+def get_scratch_space():
+    """
+    Return the shared ScratchSpace for intermediate images: up to
+    prefs 'scratch_memory_mb' (default 256, 0 = disk only) on tmpfs, the rest in tmp/scratch.
+    """
+    global _scratch_space
+    with _scratch_lock:
+        if _scratch_space is None:
+            budget_mb = utils.parse_size(prefs.get_pref("scratch_memory_mb", 256))
+            _scratch_space = ScratchSpace(os.path.join(get_tmp_folder(), "scratch"),
+                                          memory_budget=max(0, budget_mb) * 1024 * 1024)
+            logger.debug(f"Scratch space: {_scratch_space.memory_root or 'no tmpfs'}, "
+                          f"{_scratch_space.memory_budget // (1024 * 1024)} MB in memory")
+        return _scratch_space
+
+_conversion_cache = None
+_conversion_cache_lock = threading.Lock()
+
+def get_conversion_cache():
+    """Return the shared ConversionCache under the tmp folder, or None if disabled (conversion_cache_mb = 0)."""
+    global _conversion_cache
+    max_mb = utils.parse_size(prefs.get_pref("conversion_cache_mb", 512))
+    if max_mb <= 0:
+        return None
+    with _conversion_cache_lock:
+        if _conversion_cache is None:
+            _conversion_cache = ConversionCache(os.path.join(get_tmp_folder(), "cache"), max_mb * 1024 * 1024)
+        _conversion_cache.max_bytes = max_mb * 1024 * 1024
+        return _conversion_cache
+
 # ----------------------------
-# Conversion
+# Built-in converters
 # ----------------------------
+# In-process converters that can be named instead of an external tool in
+# convert.txt, e.g.  DMK->DSK:"undmk {infile} {outfile}"
+BUILTIN_CONVERTERS = {
+    "undmk": dmk.convert_dmk_to_dsk,
+}
+
+def get_builtin_converter(cmd_template):
+    """Return the in-process converter named by cmd_template, or None."""
+    if not cmd_template or not cmd_template.strip():
+        return None
+    return BUILTIN_CONVERTERS.get(cmd_template.split(None, 1)[0].lower())
+
+def template_option(cmd_template, option):
+    """Return the value following option in a command template, e.g. '-otype edsk' -> 'edsk'."""
+    words = cmd_template.split()
+    for i, word in enumerate(words[:-1]):
+        if word == option:
+            return words[i + 1]
+    return None
+
+def _template_prefixed(cmd_template, prefix):
+    """Return the value of a prefixed word, e.g. prefix '-conv:' in '-conv:HXC_HFE' -> 'HXC_HFE'."""
+    for word in cmd_template.split():
+        if word.startswith(prefix):
+            return word[len(prefix):]
+    return None
+
+# Formats the native codecs can decode into the shared track/sector model
+NATIVE_READERS = {
+    "IMD": imd.read_imd,
+    "DMK": dmk.read_dmk,
+}
+
+# What a native codec raises on images it cannot handle (odd or truncated
+# images surface as struct/index errors, a failed write as OSError)
+NATIVE_FAILURES = (ValueError, struct.error, IndexError, OSError)
+
+def get_native_converter(cmd_template, source_fmt, target_fmt):
+    """
+    Return an in-process replacement for an external converter hop, or None.
+    IMD/DMK -> DSK/EDSK is handled by ffhelper_imd / ffhelper_dmk when the
+    template's -otype (default by target, as libdsk) is one they write:
+    'dsk' (standard CPC DSK), 'edsk' or 'raw'; other types stay with the tool.
+    IMD/DMK -> HFE is handled by ffhelper_hfe.
+    """
+    if target_fmt in ("DSK", "EDSK") and source_fmt in NATIVE_READERS:
+        otype = (template_option(cmd_template or "", "-otype")
+                 or ("edsk" if target_fmt == "EDSK" else "dsk")).lower()
+        if otype not in DSK_WRITERS:
+            return None
+        if source_fmt == "IMD":
+            return lambda in_path, out_path: imd.convert_imd(in_path, out_path, otype)
+        return lambda in_path, out_path: dmk.convert_dmk_to_dsk(in_path, out_path, otype)
+    if target_fmt == "HFE" and source_fmt in NATIVE_READERS:
+        reader = NATIVE_READERS[source_fmt]
+        return lambda in_path, out_path: hfe.write_hfe(reader(in_path), out_path)
+    return None
+
+def verify_route_tools(routes, tools_path):
+    """
+    Check the external converters that planned routes need, without converting anything.
+    Returns warning strings for tools missing from tools_path and for probed tools
+    that do not list the template's -itype/-otype (or hxcfe -conv:) format.
+    Hops handled in-process are skipped.
+    """
+    warnings = []
+    registry = get_tool_registry(tools_path) if tools_path else None
+    seen = set()
+    for route in routes.values():
+        for hop in route or []:
+            cmd = hop["command"]
+            if cmd in seen:
+                continue
+            seen.add(cmd)
+            if get_builtin_converter(cmd) or get_native_converter(cmd, hop["source"], hop["target"]):
+                continue
+            words = shlex.split(cmd, posix=not IS_WINDOWS)
+            exe = words[0] if words else ""
+            label = f"{hop['source']} -> {hop['target']}"
+            if registry is None or registry.find(exe) is None:
+                warnings.append(f"{label}: converter '{exe}' not found in {tools_path or '(no tools path)'}")
+                continue
+            itype = template_option(cmd, "-itype")
+            otype = template_option(cmd, "-otype") or _template_prefixed(cmd, "-conv:")
+            if registry.supports(exe, itype, otype) is False:
+                warnings.append(f"{label}: '{exe}' does not list format {itype or ''}/{otype or ''}")
+    return warnings
 
 # ----------------------------
-# Export IMD to DSK
+# Conversion
 # ----------------------------
 
-def convert_imd_to_dsk(cmd_template, tools_path, imd_path, out_path):
+def convert_file(cmd_template, tools_path, in_path, out_path, error_label="Conversion",
+                 use_diskdefs=False, directorystr=None, source_fmt=None, target_fmt=None, scratch=False):
     """
-    Convert an .IMD file to .DSK using the dskconv-style command defined in prefs.json.
-    cmd_template: template like `"dskconv -otype dsk {infile} {outfile}"`
-    tools_path: folder where dskconv resides
-    imd_path: input IMD file
-    out_path: final DSK output path chosen by user
+    Run a single converter hop defined by a command template.
+    cmd_template: template like `"libdskcpmtools/dskdump -itype imd -otype edsk {infile} {outfile}"`
+    tools_path: folder the converter path in the template is relative to
+    in_path: input image
+    out_path: output image
+    use_diskdefs/directorystr: passed through to run_command
+    source_fmt/target_fmt: hop formats, default to the file extensions
+    scratch: out_path is a private intermediate, so a cache hit may hard-link it
+
+    Built-in converters (see BUILTIN_CONVERTERS) and native codecs (see
+    get_native_converter) run in-process; a native codec that fails on an
+    image (see NATIVE_FAILURES) falls back to the external tool. External
+    tool outputs are looked up in the conversion cache first (keyed by input
+    bytes, template and converter binary) and stored there after a successful run.
     """
 
-    if not cmd_template or not tools_path:
-        raise ValueError("Missing 'dskconv_command' or 'conversion_tools_path' in prefs")
-    
-    is_windows = platform.system().lower().startswith("win")
-    suffix = ".exe" if is_windows else ""    
+    builtin = get_builtin_converter(cmd_template)
+    if builtin:
+        logger.debug(f"convert_file :: built-in {cmd_template.split()[0]} {in_path} -> {out_path}")
+        try:
+            builtin(in_path, out_path)
+        except Exception as e:
+            raise RuntimeError(f"{error_label} failed:\n{e}") from e
+        return out_path
+
+    native = get_native_converter(cmd_template,
+                                  (source_fmt or file_format(in_path)).upper(),
+                                  (target_fmt or file_format(out_path)).upper())
+    if native:
+        try:
+            native(in_path, out_path)
+            logger.debug(f"convert_file :: native {in_path} -> {out_path}")
+            return out_path
+        except NATIVE_FAILURES as e:
+            logger.info(f"Native conversion of {in_path} failed ({type(e).__name__}: {e}), using external tool")
+            try:
+                os.remove(out_path)     # partial output must not pass for the tool's result
+            except FileNotFoundError:
+                pass
 
-    # Extract converter name and build its full path
-    cmd_words = shlex.split(cmd_template, posix=not is_windows)
-    exe_name = cmd_words[0]
-    converter_path = os.path.join(tools_path, exe_name + suffix)   
+    if not cmd_template or not tools_path:
+        raise ValueError("Missing converter command or 'conversion_tools_path' in prefs")
+
+    # Argument vector with the converter's full path (tool path and template split are cached)
+    runner = get_runner()
+    argv = runner.build_argv(cmd_template, tools_path, in_path, out_path)
+    converter_path = argv[0]
+
+    cache = get_conversion_cache()
+    cache_key = None
+    if cache:
+        key_template = cmd_template + (f"|CPMTOOLS={directorystr}" if use_diskdefs else "")
+        cache_key = cache.make_key(in_path, key_template, converter_path, os.path.splitext(out_path)[1])
+        if cache.fetch(cache_key, out_path, link=scratch):
+            return out_path
+
+    # Run the converter directly (no shell), output streamed to the log
+    cpmtools, cwd = _diskdefs_context(use_diskdefs, directorystr)
+    try:
+        runner.run(argv, env=runner.environment(tools_path, cpmtools), cwd=cwd)
+    except ConverterError as e:
+        raise RuntimeError(f"{error_label} failed:\n{e}") from e
 
-    if not os.path.isfile(converter_path):
-        raise FileNotFoundError(f"Converter executable not found: {converter_path}")
+    if cache and os.path.isfile(out_path):
+        cache.store(cache_key, out_path)
 
-    # Fill template placeholders
-    cmd_filled = cmd_template.format(infile=imd_path, outfile=out_path)
+    return out_path
 
-    # Replace exe name with full path
-    cmd_parts = shlex.split(cmd_filled, posix=not is_windows)
-    cmd_parts[0] = converter_path
-    
-    # Quote parts safely for execution
-    cmd = " ".join(f'"{part}"' for part in cmd_parts)
+def scratch_size_hint(path):
+    """Expected size of an intermediate converted from path (see SCRATCH_SIZE_FACTOR)."""
+    try:
+        return max(os.path.getsize(path) * SCRATCH_SIZE_FACTOR, SCRATCH_MIN_HINT)
+    except OSError:
+        return SCRATCH_MIN_HINT
 
-    # Run the command
-    success, output = run_command(cmd)
+def convert_chain(route, tools_path, src_path, out_path, scratch=None):
+    """
+    Run a planned chain of hops (see ffhelper_planner) from src_path to out_path.
+    Intermediate images go to a private scratch job (in memory when they fit,
+    see get_scratch_space) and each is deleted as soon as the next hop has read it.
+    """
+    if not route:
+        shutil.copy2(src_path, out_path)
+        return out_path
+
+    base = os.path.splitext(os.path.basename(out_path))[0]
+    hint = scratch_size_hint(src_path)
+    with (scratch or get_scratch_space()).job(base) as work:
+        in_path = src_path
+        for i, hop in enumerate(route):
+            if i == len(route) - 1:
+                hop_out = out_path
+            else:
+                hop_out = work.path(f"{base}.{i}.{hop['target'].lower()}", hint)
+            convert_file(hop["command"], tools_path, in_path, hop_out,
+                         error_label=f"{hop['source']} -> {hop['target']}",
+                         source_fmt=hop["source"], target_fmt=hop["target"], scratch=hop_out != out_path)
+            if in_path != src_path:
+                work.discard(in_path)
+            if hop_out != out_path:
+                work.settle(hop_out)
+            in_path = hop_out
+    return out_path
 
-    if not success:
-        raise RuntimeError(f"DSK export failed:\n{output}")
+# ----------------------------
+# Export IMD to DSK
+# ----------------------------
 
-    return out_path
+def convert_imd_to_dsk(cmd_template, tools_path, imd_path, out_path):
+    """
+    Convert an .IMD file to .DSK using the dskconv-style command defined in prefs.json.
+    cmd_template: template like `"dskconv -otype dsk {infile} {outfile}"`
+    tools_path: folder where dskconv resides
+    imd_path: input IMD file
+    out_path: final DSK output path chosen by user
+    """
+    return convert_file(cmd_template, tools_path, imd_path, out_path, error_label="DSK export")
 
-def convert_dsk_to_imd(cmd_template, tools_path, image_path):
+def convert_dsk_to_imd(cmd_template, tools_path, image_path, scratch_job=None):
     """
     Convert a .DSK/.TD0 file to IMD using the converter defined in prefs.json.
-    Returns the path to the converted IMD/RAW file in the tmp folder.
+    Returns the path to the converted IMD/RAW file in scratch_job (a ScratchJob
+    the caller closes when done with it); without one a job is opened that
+    lives until the app exits.
     """
 
     logger.debug("Entering convert_dsk_to_imd")
     if not cmd_template or not tools_path:
         raise ValueError("Missing 'teledisk_command' or 'conversion_tools_path' in prefs")
 
-    is_windows = platform.system().lower().startswith("win")
-    suffix = ".exe" if is_windows else ""
-
-    # Extract converter name and build its full path
-    cmd_words = shlex.split(cmd_template, posix=not is_windows)
-    exe_name = cmd_words[0]
-    converter_path = os.path.join(tools_path, exe_name + suffix)
-
-    logger.debug(f"convert_dsk_to_imd :: checking converter path {converter_path}")
-    if not os.path.isfile(converter_path):
-        raise FileNotFoundError(f"Converter executable not found: {converter_path}")
-
-    # Prepare output path in tmp folder
-    tmp_dir = get_tmp_folder()
+    # Unique scratch path, so images sharing a base name do not collide
+    work = scratch_job or get_scratch_space().job("imd")
     imd_filename = os.path.splitext(os.path.basename(image_path))[0] + ".IMD"
-    imd_path = os.path.join(tmp_dir, imd_filename)
-
-    # Fill in infile/outfile placeholders
-    cmd_filled = cmd_template.format(infile=image_path, outfile=imd_path)
-
-    # Split into args correctly for the current OS
-    cmd_parts = shlex.split(cmd_filled, posix=not is_windows)
-    cmd_parts[0] = converter_path  # Replace exe name with full path
-    
-    # Quote parts safely for execution
-    cmd = " ".join(f'"{part}"' for part in cmd_parts)    
-
-    logger.debug(f"convert_dsk_to_imd :: running command {cmd}")
-    success,output = run_command(cmd, True, prefs.get_pref("configurations_path"))
-
-    if not success:
-        raise RuntimeError(f"Conversion failed:\n{output}")
+    imd_path = work.path(imd_filename, scratch_size_hint(image_path))
 
+    logger.debug(f"convert_dsk_to_imd :: converting {image_path} -> {imd_path}")
+    convert_file(cmd_template, tools_path, image_path, imd_path, error_label="Conversion",
+                 use_diskdefs=True, directorystr=prefs.get_pref("configurations_path"), scratch=True)
+    work.settle(imd_path)
     return imd_path
 
 def copy_file_to_dir(src_file, dest_dir):
@@ -171,7 +378,7 @@ def copy_file_to_dir(src_file, dest_dir):
     filename = os.path.basename(src_file)
     dest_path = os.path.join(dest_dir, filename)
 
-    shutil.copy2(src_file, dest_path)  # copy2 preserves timestamps/metadata
+    fast_copy(src_file, dest_path)  # kernel-side copy, preserves timestamps/metadata like copy2
     return dest_path
 
 def delete_file(full_path):
@@ -183,7 +390,85 @@ def delete_file(full_path):
 
     os.remove(full_path)
     
-def export_files(staging_path, configurations_path, out_folder, target_ext, prefs):
+def _export_one(src_file, fname, size, out_folder, target_ext, route, tools_path, scratch, job):
+    """Copy or convert a single staged file along its planned route. Returns a per-file result dict."""
+    job.check()
+    base = os.path.splitext(fname)[0]
+
+    if not target_ext or not route:
+        # Keep original type, copy directly
+        with job.stage("copy"):
+            dest_file = copy_file_to_dir(src_file, out_folder)
+        action = "copy"
+    else:
+        # Conversion required
+        dest_file = os.path.join(out_folder, base + target_ext)
+        with job.stage("convert"):
+            convert_chain(route, tools_path, src_file, dest_file, scratch)
+        action = "convert"
+
+    job.advance(1, size)
+    return {"file": fname, "dest": dest_file, "action": action}
+
+def _copy_config_files(configurations_path, out_folder, job):
+    """Copy configuration files (always as-is). Returns list of copied paths."""
+    copied = []
+    if configurations_path and os.path.exists(configurations_path):
+        with job.stage("configs"):
+            for f in os.listdir(configurations_path):
+                src = os.path.join(configurations_path, f)
+                if os.path.isfile(src):
+                    copied.append(copy_file_to_dir(src, out_folder))
+    return copied
+
+def load_export_profile(configurations_path, disk_format):
+    """
+    Resolve a configuration folder and its convert.txt through the shared
+    ConfigurationsManager (parsed once, reused until the folder changes).
+    Returns (config_dir, final_format, conversions).
+    Raises FileNotFoundError if the folder or convert.txt is missing and
+    ValueError if convert.txt does not define FINALFORMAT.
+    """
+    profile = get_configurations(configurations_path).get_profile(disk_format)
+    if profile is None:
+        raise FileNotFoundError(f"Configuration '{disk_format}' not found in {configurations_path}")
+    convert = profile.convert
+    if not convert["final_format"]:
+        raise ValueError("FINALFORMAT not defined in convert.txt")
+    return profile.path, convert["final_format"], convert["conversions"]
+
+def detect_formats(staging_path, names=None):
+    """
+    {filename: FORMAT} for the staged files, read from their signatures
+    (ffhelper_sniff) and cached in the folder's DirectoryIndex, so only new or
+    changed files are read again (each file is stat'ed on every call, as an
+    in-place rewrite does not touch the folder mtime); files the image catalog
+    already knows (pref 'catalog') are not read at all. With pref
+    'sniff_formats' off, extensions only.
+    """
+    index = get_index(staging_path)
+    index.refresh()
+    # A file rewritten in place leaves the folder mtime alone: re-stat the files
+    # about to be planned so a changed one is sniffed again
+    index.update_entries(names if names is not None else index.formats())
+    if not prefs.get_pref("sniff_formats", True):
+        return index.formats(names)
+    known = None
+    if prefs.get_pref("catalog", True):
+        from ffhelper_catalog import get_catalog
+        known = get_catalog().folder_entries(staging_path)
+    return index.sniff(names, known=known)
+
+def get_export_workers(prefs):
+    """Return the number of export workers from prefs, defaulting to the CPU count."""
+    workers = utils.parse_size(prefs.get_pref("export_workers", 0))
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+def export_files(staging_path, configurations_path, out_folder, target_ext, prefs,
+                 conversions=None, workers=None, tools_path=None, job=None, files=None, formats=None,
+                 skip_duplicates=None, duplicates=None):
     """
     Export all files from staging and configuration folders to out_folder.
 
@@ -192,46 +477,116 @@ def export_files(staging_path, configurations_path, out_folder, target_ext, pref
     out_folder: output folder chosen by user
     target_ext: target extension string (e.g., '.dsk', '.imd'), or None to keep original
     prefs: preference module to get conversion templates/tools_path
+    conversions: conversion rules parsed from convert.txt (see utils.parse_convert_file).
+        If None, the 'imd.convparams' pref is used as a single IMD -> target rule.
+    workers: number of concurrent copy/convert jobs, defaults to prefs/CPU count
+    tools_path: conversion tools folder, defaults to the 'conversion_tools_path' pref
+    job: ffhelper_jobs.Job for progress and cancellation (one is created if None)
+    files: names of the staged files to export (e.g. a stick manifest from
+        ffhelper_packing), default all; names not in staging are reported as errors
+    formats: {filename: FORMAT} to plan with, default detect_formats() so that
+        misnamed images (IMD saved as .img, EDSK as .dsk) take the right route
+    skip_duplicates: export one file per disk when the same disk is staged
+        several times (see ffhelper_dedup); default the 'skip_duplicates' pref (off)
+    duplicates: a find_duplicates() report to skip by (e.g. the one the user
+        was shown) instead of checking the staged files again
+
+    A conversion route to target_ext is planned once per source format before
+    any file is touched; a format with no route raises NoConversionRoute.
+    Files are then copied or converted on a bounded thread pool (the work is
+    mostly waiting on converter processes), with the configuration copy running
+    alongside. Cancelling the job stops work between files. Returns a report dict:
+        {"out_folder": str, "configs": [paths], "results": [per-file dicts],
+         "errors": [{"file": name, "error": message}], "cancelled": [names],
+         "duplicates": find_duplicates() report or None,
+         "job": Job.summary() with rates and per-stage times}
     """
 
-    os.makedirs(out_folder, exist_ok=True)
+    if workers is None:
+        workers = get_export_workers(prefs)
+
+    if tools_path is None:
+        tools_path = prefs.get_pref("conversion_tools_path", "")
+    if tools_path:
+        tools_path = get_resource_path(tools_path)
+    staging_files = utils.list_files(staging_path)  # [(filename, size), ...]
+    missing = []
+    if files is not None:
+        wanted = set(files)
+        missing = sorted(wanted - {fname for fname, _ in staging_files})
+        staging_files = [(fname, size) for fname, size in staging_files if fname in wanted]
 
     # ----------------------------
-    # Copy configuration files (always as-is)
+    # Plan conversion routes (once per format, fail before any work)
     # ----------------------------
-    if configurations_path and os.path.exists(configurations_path):
-        for f in os.listdir(configurations_path):
-            src = os.path.join(configurations_path, f)
-            if os.path.isfile(src):
-                copy_file_to_dir(src, out_folder)
+    routes = {}
+    if target_ext:
+        final_format = target_ext.lstrip(".").upper()
+        if conversions is None:
+            conversions = {"IMD": {"target": final_format,
+                                   "command": prefs.get_pref("imd.convparams", "")}}
+        if formats is None:
+            formats = detect_formats(staging_path, [fname for fname, _ in staging_files])
+        planner = ConversionPlanner(conversions, final_format)
+        routes = planner.plan_files((fname for fname, _ in staging_files), formats)
+        for fmt, route in routes.items():
+            logger.info(f"Export plan {fmt}: {planner.describe(route)}")
+        for warning in verify_route_tools(routes, tools_path):
+            logger.warning(f"Export plan: {warning}")
 
     # ----------------------------
-    # Copy or convert staging files
+    # Drop redundant copies of the same disk
     # ----------------------------
-    staging_files = utils.list_files(staging_path)  # [(filename, size), ...]
-    for fname, _ in staging_files:
-        src_file = os.path.join(staging_path, fname)
-        base, ext = os.path.splitext(fname)
-        ext = ext.lower()
-
-        # Determine destination filename
-        if target_ext is '':
-            # Keep original type
-            dest_file = os.path.join(out_folder, fname)
-        else:
-            dest_file = os.path.join(out_folder, base + target_ext)
-
-        if target_ext is '' or ext == target_ext:
-            # Copy directly
-            copy_file_to_dir(src_file, out_folder)
-        else:
-            # Conversion required
-            cmd_template = prefs.get_pref("imd.convparams", "")
-            tools_path = prefs.get_pref("conversion_tools_path", "")
-            convert_imd_to_dsk(cmd_template, tools_path, src_file, dest_file)
-
-    return out_folder
-
-
-
+    if skip_duplicates is None:
+        skip_duplicates = prefs.get_pref("skip_duplicates", False)
+    if not skip_duplicates:
+        duplicates = None
+    elif duplicates is None:
+        duplicates = find_duplicates(staging_path, [fname for fname, _ in staging_files], formats, routes, workers)
+    if duplicates:
+        skipped = set(duplicates["skip"])
+        for group in duplicates["groups"]:
+            logger.info(f"Export: {group['keep']} kept, duplicates skipped: "
+                        f"{', '.join(n for n in group['files'] if n != group['keep'])}")
+        staging_files = [(fname, size) for fname, size in staging_files if fname not in skipped]
 
+    os.makedirs(out_folder, exist_ok=True)
+    scratch = get_scratch_space() if routes else None
+
+    job = job or Job("Export")
+    job.add_totals(files=len(staging_files), nbytes=sum(size for _, size in staging_files))
+    report = {"out_folder": out_folder, "configs": [], "results": [], "cancelled": [], "duplicates": duplicates,
+              "errors": [{"file": fname, "error": "Not in staging folder"} for fname in missing]}
+    logger.info(f"Exporting {len(staging_files)} file(s) to {out_folder} with {workers} worker(s)")
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        config_future = pool.submit(_copy_config_files, configurations_path, out_folder, job)
+        futures = {
+            pool.submit(_export_one, os.path.join(staging_path, fname), fname, size, out_folder,
+                        target_ext, routes.get((formats or {}).get(fname) or file_format(fname)),
+                        tools_path, scratch, job): fname
+            for fname, size in staging_files
+        }
+
+        for future in as_completed(futures):
+            fname = futures[future]
+            try:
+                report["results"].append(future.result())
+            except JobCancelled:
+                report["cancelled"].append(fname)
+            except Exception as e:
+                logger.error(f"Export of {fname} failed: {e}")
+                report["errors"].append({"file": fname, "error": str(e)})
+
+        try:
+            report["configs"] = config_future.result()
+        except Exception as e:
+            logger.error(f"Copying configuration files failed: {e}")
+            report["errors"].append({"file": configurations_path, "error": str(e)})
+
+    report["results"].sort(key=lambda r: r["file"])
+    report["cancelled"].sort()
+    report["job"] = job.finish()
+    logger.info(f"Export finished: {len(report['results'])} ok, {len(report['errors'])} failed, "
+                f"{len(report['cancelled'])} cancelled; stage times {report['job']['stages']}")
+    return report
@@ -0,0 +1,231 @@
+# ffhelper_packing.py
+import os
+import re
+import json
+import bisect
+import shutil
+import tempfile
+import threading
+import logging
+import ffhelper_logic as logic
+import ffhelper_utils as utils
+from ffhelper_planner import file_format
+from ffhelper_diskimage import dsk_size
+from ffhelper_hfe import hfe_layout, hfe_size
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+DEFAULT_CLUSTER = 32 * 1024     # FAT32/exFAT allocation unit on typical sticks (rounded up)
+
+# Raw sector bytes per file byte, for images the native codecs cannot read
+RAW_PER_FILE_BYTE = {"TD0": 2.0, "DMK": 0.6, "HFE": 0.1}
+
+SIZE_UNITS = {"": 1, "K": 1000, "M": 1000 ** 2, "G": 1000 ** 3, "T": 1000 ** 4,
+              "KI": 1024, "MI": 1024 ** 2, "GI": 1024 ** 3, "TI": 1024 ** 4}
+SIZE_PATTERN = re.compile(r"^\s*([\d.]+)\s*([KMGT]I?)?B?\s*$", re.IGNORECASE)
+
+def parse_capacity(value):
+    """
+    Parse a stick size like '16G', '16GB' (decimal, as sold) or '15GiB' into bytes.
+    Raises ValueError for anything else.
+    """
+    if isinstance(value, int):
+        return value
+    m = SIZE_PATTERN.match(str(value))
+    if not m:
+        raise ValueError(f"Not a size: {value!r}")
+    return int(float(m.group(1)) * SIZE_UNITS[(m.group(2) or "").upper()])
+
+def round_up(size, cluster):
+    return -(-size // cluster) * cluster if cluster > 1 else size
+
+# ----------------------------
+# Size prediction
+# ----------------------------
+def imd_size(image):
+    """Upper bound for an uncompressed IMD of image (header, comment, per-track maps, sectors)."""
+    total = 32 + len(image.comment or "")
+    for track in image.tracks:
+        total += 5 + len(track.sectors) + sum(1 + s.size for s in track.sectors)
+    return total
+
+def image_size(image, fmt, command=""):
+    """Size of image written as fmt by the hop command, or None if unknown."""
+    if fmt == "HFE":
+        return hfe_size(image)
+    if fmt in ("DSK", "EDSK"):
+        otype = (logic.template_option(command or "", "-otype") or ("edsk" if fmt == "EDSK" else "dsk")).lower()
+        return dsk_size(image, otype)
+    if fmt in ("IMG", "IMA", "ST", "RAW"):
+        return image.data_size()
+    if fmt == "IMD":
+        return imd_size(image)
+    return None
+
+def estimate_from_raw(raw_bytes, fmt):
+    """Size of fmt for a disk holding about raw_bytes of sector data (no geometry known)."""
+    if fmt == "HFE":
+        rate = 500 if raw_bytes > 1000 * 1024 else 250
+        cyls = 40 if raw_bytes <= 420 * 1024 else 80
+        return hfe_layout(cyls, rate)[3]
+    if fmt in ("DSK", "EDSK", "IMD"):
+        return int(raw_bytes * 1.05) + 256     # track headers / sector maps
+    return int(raw_bytes)
+
+def predict_size(path, route, size=None):
+    """
+    Predict the exported size of one staged image along its planned route.
+    Returns (bytes, exact): exact when a native codec could read the source
+    and compute the final format's size, else an estimate from the file size.
+    """
+    size = os.path.getsize(path) if size is None else size
+    if not route:
+        return size, True
+    source, target, command = route[0]["source"], route[-1]["target"], route[-1]["command"]
+
+    reader = logic.NATIVE_READERS.get(source)
+    if reader is not None:
+        try:
+            predicted = image_size(reader(path), target, command)
+            if predicted is not None:
+                return predicted, True
+        except logic.NATIVE_FAILURES as e:
+            logger.debug(f"predict_size {path}: {e}")
+
+    raw = size * RAW_PER_FILE_BYTE.get(source, 1.0)
+    return estimate_from_raw(raw, target), False
+
+_predictions = {}
+_predictions_lock = threading.Lock()
+
+def predict_staging(staging_path, routes, files=None, formats=None):
+    """
+    Predict exported sizes for the staged files (utils.list_files order).
+    routes: {FORMAT: route} from ConversionPlanner.plan_files ({} to copy as-is).
+    formats: the {filename: FORMAT} the routes were planned with, default by extension.
+    Results are cached by path, size, mtime and route until the file changes.
+    Returns [{"file", "format", "size", "predicted", "exact"}].
+    """
+    results = []
+    for name, size in (files if files is not None else utils.list_files(staging_path)):
+        path = os.path.join(staging_path, name)
+        fmt = (formats or {}).get(name) or file_format(name)
+        route = routes.get(fmt)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+        key = (path, size, mtime, tuple(hop["command"] for hop in route or ()))
+        with _predictions_lock:
+            cached = _predictions.get(key)
+        if cached is None:
+            cached = predict_size(path, route, size)
+            with _predictions_lock:
+                _predictions[key] = cached
+        predicted, exact = cached
+        results.append({"file": name, "format": fmt, "size": size, "predicted": predicted, "exact": exact})
+    return results
+
+# ----------------------------
+# Target space
+# ----------------------------
+def target_space(folder):
+    """{"free": bytes, "total": bytes, "cluster": allocation unit} of the filesystem holding folder."""
+    usage = shutil.disk_usage(folder)
+    cluster = DEFAULT_CLUSTER
+    if hasattr(os, "statvfs"):
+        cluster = os.statvfs(folder).f_bsize or DEFAULT_CLUSTER
+    return {"free": usage.free, "total": usage.total, "cluster": cluster}
+
+def check_fit(predictions, folder, config_bytes=0):
+    """Compare predicted export sizes with the free space in folder. Returns a dict with "fits"."""
+    space = target_space(folder)
+    needed = sum(round_up(p["predicted"], space["cluster"]) for p in predictions) + config_bytes
+    return {"needed": needed, "free": space["free"], "cluster": space["cluster"],
+            "fits": needed <= space["free"], "exact": all(p["exact"] for p in predictions)}
+
+# ----------------------------
+# Packing
+# ----------------------------
+def pack_items(items, capacity, reserved=0, max_bins=None):
+    """
+    Best-fit decreasing: place (name, bytes) items, largest first, into the
+    fullest bin that still has room, opening a new bin when none has.
+    Each bin starts with reserved bytes used. Free space per bin is kept in a
+    sorted list, so each placement is a binary search.
+    Returns (bins, overflow): bins = [{"files": [names], "used": bytes}],
+    overflow = names that did not fit (too big, or max_bins reached).
+    """
+    bins, overflow = [], []
+    free = []   # sorted (free_bytes, bin_index)
+    for name, size in sorted(items, key=lambda item: (-item[1], item[0])):
+        if size + reserved > capacity:
+            overflow.append(name)
+            continue
+        i = bisect.bisect_left(free, (size, -1))
+        if i < len(free):
+            space, b = free.pop(i)
+        elif max_bins is None or len(bins) < max_bins:
+            bins.append({"files": [], "used": reserved})
+            space, b = capacity - reserved, len(bins) - 1
+        else:
+            overflow.append(name)
+            continue
+        bins[b]["files"].append(name)
+        bins[b]["used"] += size
+        bisect.insort(free, (space - size, b))
+    for b in bins:
+        b["files"].sort()
+    return bins, overflow
+
+def plan_sticks(predictions, capacity, max_sticks=None, cluster=DEFAULT_CLUSTER, config_bytes=0):
+    """
+    Spread predicted exports over sticks of capacity bytes. Every stick also
+    gets the configuration files (config_bytes). Sizes are rounded up to the
+    filesystem cluster. Returns {"sticks": [{"stick", "files", "used", "free"}],
+    "overflow": [names], "capacity", "cluster", "predicted_total", "exact"}.
+    """
+    by_name = {p["file"]: p for p in predictions}
+    items = [(p["file"], round_up(p["predicted"], cluster)) for p in predictions]
+    bins, overflow = pack_items(items, capacity, reserved=config_bytes, max_bins=max_sticks)
+    sticks = [{"stick": i + 1, "files": b["files"], "used": b["used"], "free": capacity - b["used"],
+               "predicted": {name: by_name[name]["predicted"] for name in b["files"]}}
+              for i, b in enumerate(bins)]
+    logger.info(f"Packing plan: {len(predictions)} image(s) on {len(sticks)} stick(s) of {capacity:,} bytes"
+                f"{f', {len(overflow)} not placed' if overflow else ''}")
+    return {"sticks": sticks, "overflow": sorted(overflow), "capacity": capacity, "cluster": cluster,
+            "predicted_total": sum(size for _, size in items),
+            "exact": all(p["exact"] for p in predictions)}
+
+# ----------------------------
+# Manifests
+# ----------------------------
+def build_manifests(plan, disk_format, staging_path):
+    """One manifest dict per stick; export_files(files=manifest["files"]) exports just that stick."""
+    return [{"version": MANIFEST_VERSION, "format": disk_format, "staging": os.path.abspath(staging_path),
+             "stick": stick["stick"], "sticks": len(plan["sticks"]), "capacity": plan["capacity"],
+             "files": stick["files"], "used": stick["used"], "free": stick["free"]}
+            for stick in plan["sticks"]]
+
+def write_manifests(manifests, folder):
+    """Write manifests as stick-NN.json (atomically) into folder. Returns the paths."""
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for manifest in manifests:
+        path = os.path.join(folder, f"stick-{manifest['stick']:02d}.json")
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".manifest.", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, path)
+        paths.append(path)
+    return paths
+
+def load_manifest(path):
+    """Read a stick manifest. Raises ValueError if it is not one."""
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION \
+            or not isinstance(manifest.get("files"), list):
+        raise ValueError(f"Not a stick manifest: {path}")
+    return manifest
@@ -0,0 +1,125 @@
+# ffhelper_planner.py
+import os
+from collections import deque
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Formats planned with another format's rules when they have none of their
+# own (convert.txt names extended CPC images after their .DSK extension)
+FORMAT_ALIASES = {"EDSK": "DSK"}
+
+class NoConversionRoute(ValueError):
+    """Raised when a staged format cannot be converted to FINALFORMAT."""
+    def __init__(self, missing, final_format):
+        self.missing = missing              # {EXT: [filenames]}
+        self.final_format = final_format
+        lines = [f"No conversion route to {final_format} for:"]
+        for ext, files in sorted(missing.items()):
+            sample = ", ".join(files[:3]) + (" ..." if len(files) > 3 else "")
+            lines.append(f"  {ext or '(no extension)'} ({len(files)} file(s): {sample})")
+        super().__init__("\n".join(lines))
+
+def file_format(filename):
+    """Return the upper-cased extension of filename without the dot, e.g. 'IMD'."""
+    return os.path.splitext(filename)[1].lstrip(".").upper()
+
+def build_graph(conversions):
+    """
+    Turn the convert.txt conversions dict into an adjacency map.
+
+    conversions: {SOURCE: {"target": TARGET, "command": cmd}} as returned by
+    utils.parse_convert_file. A list of such rule dicts per source is accepted too.
+    Output: {SOURCE: [(TARGET, cmd), ...]}
+    """
+    graph = {}
+    for source, rules in (conversions or {}).items():
+        if isinstance(rules, dict):
+            rules = [rules]
+        for rule in rules:
+            graph.setdefault(source.upper(), []).append((rule["target"].upper(), rule["command"]))
+    return graph
+
+def find_route(graph, source, final_format):
+    """
+    Breadth-first search for the shortest chain of hops from source to final_format.
+
+    Returns a list of hop dicts [{"source", "target", "command"}, ...],
+    an empty list if no conversion is needed, or None if there is no route.
+    """
+    source = source.upper()
+    final_format = final_format.upper()
+    if source == final_format:
+        return []
+
+    previous = {source: None}
+    queue = deque([source])
+    while queue:
+        node = queue.popleft()
+        for target, cmd in graph.get(node, []):
+            if target in previous:
+                continue
+            previous[target] = (node, cmd)
+            if target == final_format:
+                route = []
+                while previous[target] is not None:
+                    node, cmd = previous[target]
+                    route.append({"source": node, "target": target, "command": cmd})
+                    target = node
+                return route[::-1]
+            queue.append(target)
+    return None
+
+class ConversionPlanner:
+    """Plans conversion chains once per source format and caches them."""
+
+    def __init__(self, conversions, final_format):
+        if not final_format:
+            raise ValueError("FINALFORMAT not defined")
+        self.final_format = final_format.upper()
+        self.graph = build_graph(conversions)
+        self._routes = {}
+
+    def plan(self, fmt):
+        """Return the cached route for fmt (see find_route)."""
+        fmt = fmt.upper()
+        if fmt not in self._routes:
+            self._routes[fmt] = find_route(self.graph, fmt, self.final_format)
+            logger.debug(f"Planned {fmt} -> {self.final_format}: {self.describe(self._routes[fmt])}")
+        return self._routes[fmt]
+
+    def plan_files(self, filenames, formats=None):
+        """
+        Plan every distinct format in filenames up front.
+
+        formats: optional {filename: FORMAT} of detected formats (see
+        ffhelper_sniff); files not in it are planned by extension.
+        Returns {FORMAT: route}. Raises NoConversionRoute listing every format
+        (and its files) that cannot reach FINALFORMAT, before any work is done.
+        """
+        formats = formats or {}
+        by_format = {}
+        for fname in filenames:
+            by_format.setdefault(formats.get(fname) or file_format(fname), []).append(fname)
+
+        routes = {}
+        missing = {}
+        for fmt, files in by_format.items():
+            route = self.plan(fmt)
+            if route is None and fmt in FORMAT_ALIASES:
+                route = self.plan(FORMAT_ALIASES[fmt])
+            if route is None:
+                missing[fmt] = sorted(files)
+            else:
+                routes[fmt] = route
+        if missing:
+            raise NoConversionRoute(missing, self.final_format)
+        return routes
+
+    def describe(self, route):
+        """Human readable chain, e.g. 'TD0 -> IMD -> DSK'."""
+        if route is None:
+            return "no route"
+        if not route:
+            return "copy"
+        return " -> ".join([route[0]["source"]] + [hop["target"] for hop in route])
@@ -1,7 +1,10 @@
 import json
 import os
-import tkinter as tk
-from tkinter import filedialog
+import stat
+import time
+import atexit
+import tempfile
+import threading
 import ffhelper_prefs as prefs  # safe self-import for get/set_pref
 import ffhelper_utils as utils
 from ffhelper_utils import get_resource_path
@@ -11,6 +14,8 @@ PREF_FILE = get_resource_path("ffhelper_prefs.json")
 
 logger = logging.getLogger(__name__)
 
+MAX_RETRY_DELAY = 300.0
+
 def load_prefs():
     """Load preferences from JSON file."""
     logger.info(f"Loading preferences from {PREF_FILE}")
@@ -32,19 +37,139 @@ def load_prefs():
         return {}
 
 
+def _file_mode(path):
+    """Permission bits of path, or what a plain open() would create it with."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
 def save_prefs(prefs):
-    """Save preferences to JSON file."""
-    with open(PREF_FILE, "w") as f:
-        json.dump(prefs, f, indent=2)
+    """Save preferences to JSON file atomically (write a temp file, then rename), keeping its permissions."""
+    pref_dir = os.path.dirname(PREF_FILE) or "."
+    mode = _file_mode(PREF_FILE)
+    fd, tmp_path = tempfile.mkstemp(dir=pref_dir, prefix=".ffhelper_prefs.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(prefs, f, indent=2)
+        os.chmod(tmp_path, mode)    # mkstemp creates 0600
+        os.replace(tmp_path, PREF_FILE)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class PrefsStore:
+    """
+    Process-wide in-memory view of ffhelper_prefs.json.
+
+    The file is read once and re-read only when its mtime changes (checked at
+    most every reload_interval seconds). Updates land in memory immediately
+    and are written back after write_delay seconds, so bursts of set_pref
+    calls cost a single atomic write. A failed write stays pending and is
+    retried after retry_delay seconds, backing off to MAX_RETRY_DELAY.
+    """
+
+    def __init__(self, path, write_delay=0.5, reload_interval=1.0, retry_delay=5.0):
+        self.path = path
+        self.write_delay = write_delay
+        self.retry_delay = retry_delay
+        self._next_retry = retry_delay
+        self.reload_interval = reload_interval
+        self._lock = threading.RLock()
+        self._prefs = None
+        self._mtime = None
+        self._last_check = 0.0
+        self._dirty = False
+        self._timer = None
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _ensure_loaded(self):
+        now = time.monotonic()
+        if self._prefs is not None:
+            if self._dirty or now - self._last_check < self.reload_interval:
+                return
+            self._last_check = now
+            if self._file_mtime() == self._mtime:
+                return
+            logger.info("Preferences file changed on disk, reloading.")
+        self._last_check = now
+        self._mtime = self._file_mtime()
+        self._prefs = load_prefs()
+
+    def get(self, key, default=None):
+        with self._lock:
+            self._ensure_loaded()
+            return self._prefs.get(key, default)
+
+    def snapshot(self):
+        """Return a copy of all preferences."""
+        with self._lock:
+            self._ensure_loaded()
+            return dict(self._prefs)
+
+    def update(self, values):
+        """Apply a dict of updates and schedule a single write-behind."""
+        with self._lock:
+            self._ensure_loaded()
+            changed = {k: v for k, v in values.items() if self._prefs.get(k) != v}
+            if not changed:
+                return
+            self._prefs.update(changed)
+            self._dirty = True
+            if self._timer is None:
+                self._schedule(self.write_delay)
+
+    def _schedule(self, delay):
+        self._timer = threading.Timer(delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self):
+        """Write pending changes to disk now."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            try:
+                save_prefs(self._prefs)
+            except Exception as e:
+                logger.error(f"Failed to save preferences to {self.path}: {e} (retrying in {self._next_retry:g}s)")
+                self._schedule(self._next_retry)     # still dirty; a set_pref meanwhile is written too
+                self._next_retry = min(self._next_retry * 2, MAX_RETRY_DELAY)
+                return
+            self._next_retry = self.retry_delay
+            self._dirty = False
+            self._mtime = self._file_mtime()
+            logger.debug(f"Preferences written to {self.path}")
+
+
+_store = PrefsStore(PREF_FILE)
+atexit.register(_store.flush)
 
 def get_pref(key, default=None):
-    prefs = load_prefs()
-    return prefs.get(key, default)
+    return _store.get(key, default)
 
 def set_pref(key, value):
-    prefs = load_prefs()
-    prefs[key] = value
-    save_prefs(prefs)
+    _store.update({key: value})
+
+def set_prefs(values):
+    """Update several preferences with one write."""
+    _store.update(values)
+
+def flush_prefs():
+    """Write any pending preference changes to disk immediately."""
+    _store.flush()
     
     
 def check_paths_button(parent):
@@ -56,6 +181,8 @@ def check_paths_button(parent):
     # ----------------------------
 def open_prefs_dialog(parent):
     """Show the Preferences dialog window."""
+    import tkinter as tk
+    from tkinter import filedialog
     dialog = tk.Toplevel(parent)
     dialog.title("Preferences")
     dialog.transient(parent)
@@ -116,11 +243,14 @@ def open_prefs_dialog(parent):
 
     # --- Save & Close / Check Paths ---
     def save_all_prefs():
-        prefs.set_pref("tele.convparams", entry_teledisk.get())
-        prefs.set_pref("imagedisk_command", entry_imagedisk.get())
-        prefs.set_pref("dsk.convparams", entry_dskdisk.get())
-        prefs.set_pref("conversion_tools_path", entry_cpmtools.get())
-        prefs.set_pref("configurations_path", entry_diskdefs.get())
+        prefs.set_prefs({
+            "tele.convparams": entry_teledisk.get(),
+            "imagedisk_command": entry_imagedisk.get(),
+            "dsk.convparams": entry_dskdisk.get(),
+            "conversion_tools_path": entry_cpmtools.get(),
+            "configurations_path": entry_diskdefs.get(),
+        })
+        prefs.flush_prefs()
         parent.teledisk_command = prefs.get_pref("tele.convparams", "")
         parent.imagedisk_command = prefs.get_pref("imd.convparams", "")
         parent.dsk_command = prefs.get_pref("dsk.convparams", "")
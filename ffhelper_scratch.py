@@ -0,0 +1,209 @@
+# ffhelper_scratch.py
+import os
+import sys
+import time
+import shutil
+import atexit
+import tempfile
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+JOB_PREFIX = "ffjob-"
+MEMORY_ROOT = "/dev/shm"             # tmpfs on Linux (the same memory memfd uses)
+MEMORY_HEADROOM = 64 * 1024 * 1024   # leave this much of tmpfs free for everyone else
+STALE_AGE = 6 * 3600                 # job folders older than this are left over from a crash
+
+def default_memory_root():
+    """tmpfs folder usable for scratch files, or None where there is none."""
+    if sys.platform.startswith("linux") and os.path.isdir(MEMORY_ROOT) and os.access(MEMORY_ROOT, os.W_OK):
+        return MEMORY_ROOT
+    return None
+
+def _pid_alive(pid):
+    if os.name != "posix":
+        return True     # cannot cheaply tell on Windows, rely on STALE_AGE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+class ScratchJob:
+    """
+    Private scratch folders for one conversion job.
+
+    path() hands out unique file paths, in memory while the space's budget
+    allows and on disk otherwise. close() removes the job's own folders and
+    returns its memory reservation; nothing else is scanned.
+    """
+
+    def __init__(self, space, label="job"):
+        self.space = space
+        self.label = label
+        self.mem_dir = None
+        self.disk_dir = None
+        self._reserved = {}     # path -> bytes reserved in memory
+        self._names = set()
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def _make_dir(self, root):
+        return tempfile.mkdtemp(prefix=f"{JOB_PREFIX}{os.getpid()}-", dir=root)
+
+    def _unique(self, name):
+        with self._lock:
+            candidate, n = name, 1
+            while candidate in self._names:
+                base, ext = os.path.splitext(name)
+                candidate = f"{base}.{n}{ext}"
+                n += 1
+            self._names.add(candidate)
+            return candidate
+
+    def path(self, name, size_hint=0):
+        """
+        Return a fresh path for a scratch file called name. size_hint is the
+        expected size in bytes; the file goes to memory if that fits the budget.
+        """
+        if self.closed:
+            raise RuntimeError(f"Scratch job {self.label} is closed")
+        name = self._unique(name)
+        if self.space.reserve(size_hint):
+            with self._lock:
+                if self.mem_dir is None:
+                    self.mem_dir = self._make_dir(self.space.memory_root)
+                path = os.path.join(self.mem_dir, name)
+                self._reserved[path] = size_hint
+            return path
+        with self._lock:
+            if self.disk_dir is None:
+                os.makedirs(self.space.disk_root, exist_ok=True)
+                self.disk_dir = self._make_dir(self.space.disk_root)
+            return os.path.join(self.disk_dir, name)
+
+    def settle(self, path):
+        """Swap the size hint reserved for path for its real size once it has been written."""
+        with self._lock:
+            reserved = self._reserved.get(path)
+            if reserved is None:
+                return
+            try:
+                actual = os.path.getsize(path)
+            except OSError:
+                actual = 0
+            self._reserved[path] = actual
+        self.space.adjust(actual - reserved)
+
+    def discard(self, path):
+        """Delete a scratch file that is no longer needed and release its reservation."""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            reserved = self._reserved.pop(path, 0)
+        self.space.adjust(-reserved)
+
+    def in_memory(self, path):
+        return path in self._reserved
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for folder in (self.mem_dir, self.disk_dir):
+            if folder:
+                shutil.rmtree(folder, ignore_errors=True)
+        with self._lock:
+            reserved = sum(self._reserved.values())
+            self._reserved.clear()
+        self.space.adjust(-reserved)
+        self.space._forget(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ScratchSpace:
+    """
+    Scratch storage for intermediate images (TD0 -> IMD -> DSK chains and the like).
+
+    Up to memory_budget bytes live on tmpfs (memory_root, e.g. /dev/shm); the
+    rest spills to disk_root. Converters are separate processes, so scratch
+    files need real paths, which rules out anonymous memfds. Each job gets its
+    own folders (see job()), so there are no name clashes between jobs.
+    """
+
+    def __init__(self, disk_root, memory_budget=0, memory_root=None):
+        self.disk_root = disk_root
+        self.memory_root = memory_root if memory_root is not None else default_memory_root()
+        self.memory_budget = memory_budget if self.memory_root else 0
+        self.memory_used = 0
+        self._jobs = set()
+        self._lock = threading.Lock()
+        self.remove_stale()
+        atexit.register(self.close_all)
+
+    def job(self, label="job"):
+        """Open a ScratchJob; use it as a context manager or call close()."""
+        job = ScratchJob(self, label)
+        with self._lock:
+            self._jobs.add(job)
+        return job
+
+    def reserve(self, nbytes):
+        """Reserve nbytes of the memory budget. Returns False if they do not fit."""
+        if not self.memory_budget:
+            return False
+        with self._lock:
+            if self.memory_used + nbytes > self.memory_budget:
+                return False
+            try:
+                st = os.statvfs(self.memory_root)
+                if st.f_bavail * st.f_frsize - nbytes < MEMORY_HEADROOM:
+                    return False
+            except OSError:
+                return False
+            self.memory_used += nbytes
+        return True
+
+    def adjust(self, delta):
+        with self._lock:
+            self.memory_used = max(0, self.memory_used + delta)
+
+    def _forget(self, job):
+        with self._lock:
+            self._jobs.discard(job)
+
+    def close_all(self):
+        with self._lock:
+            jobs = list(self._jobs)
+        for job in jobs:
+            job.close()
+
+    def remove_stale(self):
+        """Remove job folders left behind by processes that no longer run (once, at startup)."""
+        now = time.time()
+        for root in (self.memory_root, self.disk_root):
+            if not root:
+                continue
+            try:
+                with os.scandir(root) as it:
+                    entries = [e for e in it if e.name.startswith(JOB_PREFIX) and e.is_dir(follow_symlinks=False)]
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    pid = int(entry.name[len(JOB_PREFIX):].split("-", 1)[0])
+                    stale = pid != os.getpid() and (not _pid_alive(pid) or now - entry.stat().st_mtime > STALE_AGE)
+                except (ValueError, OSError):
+                    continue
+                if stale:
+                    logger.debug(f"Removing stale scratch folder {entry.path}")
+                    shutil.rmtree(entry.path, ignore_errors=True)
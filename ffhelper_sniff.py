@@ -0,0 +1,162 @@
+# ffhelper_sniff.py
+import os
+import struct
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from ffhelper_planner import file_format
+from ffhelper_dmk import DMKError, parse_header as parse_dmk_header
+import ffhelper_imd as imd
+import ffhelper_hfe as hfe
+
+logger = logging.getLogger(__name__)
+
+SNIFF_BYTES = 512
+SNIFF_WORKERS = 8
+
+TD0_NORMAL = b"TD"
+TD0_ADVANCED = b"td"            # LZSS-compressed after the header
+EDSK_MAGIC = b"EXTENDED CPC DSK File"
+DSK_MAGIC = b"MV - CPC"
+HFE_V3_MAGIC = b"HXCHFEV3"
+ADF_SIZES = (80 * 2 * 11 * 512, 80 * 2 * 22 * 512)      # DD, HD
+ST_MAX_SIZE = 84 * 2 * 11 * 512
+PC_JUMPS = (0xE9, 0xEB)
+
+# Formats that carry a signature; a file named like one of these without
+# its signature is re-identified from the raw-image checks below
+SIGNED_FORMATS = {"IMD", "TD0", "DSK", "EDSK", "DMK", "HFE"}
+
+# ----------------------------
+# Signature checks
+# ----------------------------
+def _sniff_dmk(head, size):
+    """DMK has no magic: accept a sane header whose geometry accounts for the file size exactly."""
+    if len(head) < 16 or any(head[5:12]) or head[12:16] not in (b"\0\0\0\0", b"\x78\x56\x34\x12"):
+        return None
+    try:
+        geometry = parse_dmk_header(head, size)
+    except DMKError:
+        return None
+    if size != 16 + geometry["tracks"] * geometry["heads"] * geometry["track_length"]:
+        return None
+    return f"{geometry['tracks']} tracks, {geometry['heads']} side(s)"
+
+def _sniff_st(head, size):
+    """Atari ST: a FAT12 boot sector (68000 branch, not a PC jump) whose sector count matches the size."""
+    if len(head) < 32 or size > ST_MAX_SIZE or head[0] in PC_JUMPS:
+        return None
+    bps, spc, reserved, fats, _, sectors = struct.unpack_from("<HBHBHH", head, 11)
+    spt, heads = struct.unpack_from("<HH", head, 24)
+    if bps != 512 or spc not in (1, 2, 4) or not reserved or fats not in (1, 2) \
+            or not 1 <= heads <= 2 or not 8 <= spt <= 11 or sectors * bps != size:
+        return None
+    return f"{sectors // (spt * heads)} tracks, {heads} side(s), {spt} sectors"
+
+def sniff_bytes(head, size):
+    """
+    Identify an image from its first bytes (SNIFF_BYTES is plenty) and total size.
+    Returns (FORMAT, detail, strong) or None. strong is False for raw images
+    (ADF, ST) recognised only by size and boot sector, which have no signature.
+    """
+    if head.startswith(imd.SIGNATURE):
+        return "IMD", head[4:].split(b":", 1)[0][:8].decode("ascii", "replace"), True
+    if head.startswith(EDSK_MAGIC):
+        return "EDSK", "extended", True
+    if head.startswith(DSK_MAGIC):
+        return "DSK", "standard", True
+    if head.startswith(hfe.SIGNATURE):
+        return "HFE", "v1", True
+    if head.startswith(HFE_V3_MAGIC):
+        return "HFE", "v3", True
+    # 12-byte header: signature, volume sequence 0, check byte, version 1.0-3.0 as 10-30
+    if head[:2] in (TD0_NORMAL, TD0_ADVANCED) and len(head) >= 12 and head[2] == 0 and 10 <= head[4] <= 30:
+        return "TD0", "advanced compression" if head[:2] == TD0_ADVANCED else "normal", True
+    detail = _sniff_dmk(head, size)
+    if detail:
+        return "DMK", detail, True
+    if size in ADF_SIZES:
+        return "ADF", "HD" if size == ADF_SIZES[1] else "DD", False
+    detail = _sniff_st(head, size)
+    if detail:
+        return "ST", detail, False
+    return None
+
+def header_geometry(fmt, head, size):
+    """
+    Geometry readable from the head of a header-described image:
+    {"cylinders", "heads", "sectors", "sector_size"} (values may be None),
+    or {} for formats whose geometry needs a full decode (IMD, DMK, TD0).
+    """
+    if fmt in ("EDSK", "DSK") and len(head) >= 0x118:
+        geometry = {"cylinders": head[0x30], "heads": head[0x31], "sectors": None, "sector_size": None}
+        if head[0x100:0x10C] == b"Track-Info\r\n":     # first track block (if track 0 is formatted)
+            geometry.update(sectors=head[0x115], sector_size=128 << min(head[0x114], 6))
+        return geometry
+    if fmt == "HFE" and len(head) >= 11:
+        return {"cylinders": head[9], "heads": head[10], "sectors": None, "sector_size": None}
+    if fmt == "ADF":
+        return {"cylinders": 80, "heads": 2, "sectors": 22 if size == ADF_SIZES[1] else 11, "sector_size": 512}
+    if fmt == "ST" and len(head) >= 32:
+        sectors = struct.unpack_from("<H", head, 19)[0]
+        spt, heads = struct.unpack_from("<HH", head, 24)
+        return {"cylinders": sectors // (spt * heads), "heads": heads, "sectors": spt, "sector_size": 512}
+    return {}
+
+def resolve_format(name, found):
+    """
+    The format to plan name with: a signature wins over the extension; a
+    raw-image match only replaces an extension that names a signed format
+    (the signature was missing) or a file without an extension.
+    """
+    ext = file_format(name)
+    if found is None:
+        return ext
+    fmt, _, strong = found
+    if strong or ext in SIGNED_FORMATS or not ext:
+        return fmt
+    return ext
+
+# ----------------------------
+# Files and folders
+# ----------------------------
+def sniff_file(path):
+    """
+    Read the head of one file. Returns {"format", "detected", "detail", "size", "mtime"}:
+    format is what to plan with (see resolve_format), detected the sniffed
+    format or None. Raises OSError if the file cannot be read.
+    """
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        head = f.read(SNIFF_BYTES)
+    found = sniff_bytes(head, st.st_size)
+    return {"format": resolve_format(os.path.basename(path), found),
+            "detected": found[0] if found else None,
+            "detail": found[1] if found else "",
+            "size": st.st_size, "mtime": st.st_mtime_ns}
+
+def sniff_folder(folder, names, workers=None):
+    """
+    Sniff names in folder on a thread pool (the reads are tiny; the time goes
+    to opening files, which overlaps well on network shares and USB).
+    Returns {name: sniff_file() dict}; unreadable files are left out.
+    """
+    names = list(names)
+    results = {}
+    if not names:
+        return results
+
+    def sniff(name):
+        try:
+            return name, sniff_file(os.path.join(folder, name))
+        except OSError as e:
+            logger.debug(f"sniff {name}: {e}")
+            return name, None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers or SNIFF_WORKERS, len(names)))) as pool:
+        for name, result in pool.map(sniff, names):
+            if result is None:
+                continue
+            results[name] = result
+            if result["format"] != file_format(name):
+                logger.info(f"{name}: contents are {result['format']} ({result['detail']}), not {file_format(name) or 'unknown'}")
+    return results
@@ -0,0 +1,247 @@
+# ffhelper_tools.py
+import os
+import re
+import json
+import platform
+import tempfile
+import threading
+import subprocess
+import logging
+from ffhelper_utils import get_resource_path
+from ffhelper_exec import IS_WINDOWS, EXE_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+PROBE_TIMEOUT = 5
+
+# Tool families, by binary name
+LIBDSK_TOOLS = {"dskconv", "dskdump", "dskform", "dskid", "dsklabel", "dskscan",
+                "dsktrans", "dskutil", "dskparse", "apriboot", "md3serial", "lsgotek"}
+HXCFE_TOOLS = {"hxcfe"}
+
+# "  tele    : Sydex TeleDisk" (libdsk -types)
+LIBDSK_TYPE_LINE = re.compile(r"^\s*([A-Za-z0-9_\-]+)\s*:\s*\S")
+# "TELEDISK_TD0;R ;TELEDISK TD0 Loader;*.td0;" (hxcfe -modulelist)
+HXCFE_MODULE_LINE = re.compile(r"^([A-Z0-9_]+);([RW ]{1,2});[^;]*;([^;]*);")
+
+def platform_tools_dir():
+    """Default tools folder for this OS: support/osx, support/win or support/linux."""
+    system = platform.system()
+    name = {"Darwin": "osx", "Windows": "win"}.get(system, "linux")
+    return get_resource_path(os.path.join("support", name))
+
+def tool_family(name):
+    base = os.path.basename(name)
+    if base in LIBDSK_TOOLS:
+        return "libdsk"
+    if base in HXCFE_TOOLS:
+        return "hxcfe"
+    if base.startswith("cpm") or base.endswith(".cpm"):
+        return "cpmtools"
+    return "other"
+
+# ----------------------------
+# Probes
+# ----------------------------
+def _probe_output(path, args):
+    """Run a tool briefly and return its combined output ('' if it produced none)."""
+    result = subprocess.run([path] + args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            stdin=subprocess.DEVNULL, timeout=PROBE_TIMEOUT,
+                            text=True, errors="replace", cwd=os.path.dirname(path))
+    return result.stdout or ""
+
+def _first_line(text):
+    for line in text.splitlines():
+        if line.strip():
+            return line.strip()
+    return ""
+
+def probe_tool(path, family):
+    """
+    Ask a tool for its version and the formats it reads/writes.
+    Returns {"version", "itypes", "otypes", "error"}; itypes/otypes are None when unknown.
+    """
+    info = {"version": "", "itypes": None, "otypes": None, "error": None}
+    try:
+        if family == "libdsk":
+            info["version"] = _first_line(_probe_output(path, ["--version"]))
+            types = sorted({m.group(1).lower() for line in _probe_output(path, ["-types"]).splitlines()
+                            if (m := LIBDSK_TYPE_LINE.match(line))})
+            if types:
+                info["itypes"] = info["otypes"] = types
+        elif family == "hxcfe":
+            output = _probe_output(path, ["-modulelist"])
+            info["version"] = _first_line(output)
+            readers, writers = set(), set()
+            for line in output.splitlines():
+                m = HXCFE_MODULE_LINE.match(line.strip())
+                if m:
+                    if "R" in m.group(2):
+                        readers.add(m.group(1))
+                    if "W" in m.group(2):
+                        writers.add(m.group(1))
+            if readers or writers:
+                info["itypes"], info["otypes"] = sorted(readers), sorted(writers)
+        elif family == "other":
+            info["version"] = _first_line(_probe_output(path, ["--version"]))
+    except (OSError, subprocess.SubprocessError) as e:
+        # e.g. a binary for another OS (Exec format error) or a tool that hangs
+        info["error"] = str(e)
+    return info
+
+# ----------------------------
+# Registry
+# ----------------------------
+class ToolRegistry:
+    """
+    Converter binaries under one tools folder (e.g. support/osx).
+
+    The folder is scanned once; version and format probes run on first use
+    of each tool and are cached on disk keyed by binary size and mtime, so
+    they only run again when a tool is replaced.
+    """
+
+    def __init__(self, tools_path, cache_path=None):
+        self.tools_path = os.path.abspath(tools_path)
+        self.cache_path = cache_path or get_resource_path(os.path.join("cache", "tools.json"))
+        self.tools = {}         # relative name without suffix -> {"path", "size", "mtime"}
+        self._by_base = {}      # basename -> relative name
+        self._probes = {}       # path -> probe dict with "size"/"mtime"
+        self._lock = threading.RLock()
+        self._load_cache()
+        self.scan()
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable tool cache {self.cache_path}: {e}")
+            return
+        if data.get("version") == CACHE_VERSION:
+            self._probes = data.get("probes", {})
+
+    def _save_cache(self):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        with self._lock:
+            # keep probes of other tools folders that share the cache file
+            try:
+                with open(self.cache_path, "r", encoding="utf-8") as f:
+                    probes = json.load(f).get("probes", {})
+            except Exception:
+                probes = {}
+            probes.update(self._probes)
+            data = {"version": CACHE_VERSION, "probes": probes}
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.cache_path), prefix=".tools.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=1)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            logger.warning(f"Could not save tool cache {self.cache_path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def scan(self):
+        """Walk the tools folder and record executables. Returns the tools dict."""
+        tools, by_base = {}, {}
+        for root, dirs, files in os.walk(self.tools_path):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for fname in files:
+                path = os.path.join(root, fname)
+                if IS_WINDOWS:
+                    if not fname.lower().endswith(".exe"):
+                        continue
+                    name = fname[:-4]
+                else:
+                    if fname.startswith(".") or "." in fname and not fname.endswith(".cpm"):
+                        continue  # data files (*.hfe, *.dylib, converttype.txt)
+                    name = fname
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if not IS_WINDOWS and not os.access(path, os.X_OK):
+                    continue
+                rel = os.path.relpath(os.path.join(root, name), self.tools_path).replace(os.sep, "/")
+                tools[rel] = {"path": path, "size": st.st_size, "mtime": st.st_mtime_ns}
+                by_base.setdefault(name, rel)
+        with self._lock:
+            self.tools, self._by_base = tools, by_base
+        logger.debug(f"Tool scan {self.tools_path}: {len(tools)} tools")
+        return tools
+
+    def find(self, name):
+        """
+        Look up a tool by its template name: a path relative to the tools folder
+        ('libdskcpmtools/dskdump') or a bare name ('dskdump'). Returns the entry or None.
+        """
+        name = name.replace("\\", "/")
+        if IS_WINDOWS and name.lower().endswith(".exe"):
+            name = name[:-4]
+        with self._lock:
+            entry = self.tools.get(name)
+            if entry is None and "/" not in name:
+                rel = self._by_base.get(name)
+                entry = self.tools.get(rel) if rel else None
+        return entry
+
+    def path(self, name):
+        """Full path for a tool name, or raise FileNotFoundError."""
+        entry = self.find(name)
+        if entry is None:
+            raise FileNotFoundError(f"Converter executable not found: "
+                                    f"{os.path.join(self.tools_path, name + EXE_SUFFIX)}")
+        return entry["path"]
+
+    def info(self, name):
+        """Tool entry plus cached probe results (version, itypes, otypes, error); None if missing."""
+        entry = self.find(name)
+        if entry is None:
+            return None
+        path = entry["path"]
+        with self._lock:
+            probe = self._probes.get(path)
+        if probe is None or probe.get("size") != entry["size"] or probe.get("mtime") != entry["mtime"]:
+            family = tool_family(name)
+            probe = probe_tool(path, family)
+            probe.update({"family": family, "size": entry["size"], "mtime": entry["mtime"]})
+            logger.info(f"Probed {path}: {probe['version'] or 'no version'}"
+                        f"{' (' + probe['error'] + ')' if probe['error'] else ''}")
+            with self._lock:
+                self._probes[path] = probe
+            self._save_cache()
+        return dict(entry, **probe)
+
+    def supports(self, name, itype=None, otype=None):
+        """
+        True/False if the probes say whether the tool handles itype/otype,
+        None when that is unknown (tool not probed successfully or lists nothing).
+        """
+        info = self.info(name)
+        if info is None:
+            return False
+        result = True
+        for wanted, known in ((itype, info["itypes"]), (otype, info["otypes"])):
+            if not wanted:
+                continue
+            if known is None:
+                return None
+            result = result and wanted.lower() in {k.lower() for k in known}
+        return result
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+def get_tool_registry(tools_path=None):
+    """Return the shared ToolRegistry for tools_path (default: platform_tools_dir())."""
+    key = os.path.abspath(tools_path or platform_tools_dir())
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = ToolRegistry(key)
+            _registries[key] = registry
+        return registry
@@ -1,9 +1,8 @@
 import os
-import platform
 import logging
 import sys
-from tkinter import messagebox, filedialog
-import tkinter as tk
+import time
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -63,6 +62,72 @@ def get_resource_path(relative_path):
     return final_path
 
 
+class StartupProfile:
+    """
+    Wall-clock timings of startup phases (enabled with --startup-profile).
+
+    mark(phase) records a step on the main path. begin(phase)/end(phase)
+    bracket background work; the table is reported once the window is up
+    and every background phase has ended. Does nothing when disabled.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.phases = []        # (phase, seconds since start, seconds since previous step)
+        self.pending = set()
+        self.ready = False
+        self.reported = False
+        self._last = self.started
+        self._begun = {}
+        self._lock = threading.Lock()
+
+    def mark(self, phase):
+        if not self.enabled:
+            return
+        with self._lock:
+            now = time.perf_counter()
+            self.phases.append((phase, now - self.started, now - self._last))
+            self._last = now
+
+    def begin(self, phase):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.pending.add(phase)
+            self._begun[phase] = time.perf_counter()
+
+    def end(self, phase):
+        """Record a background phase (its own duration); ignored unless begun and still pending."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if phase not in self.pending:
+                return
+            now = time.perf_counter()
+            self.pending.discard(phase)
+            self.phases.append((phase, now - self.started, now - self._begun.pop(phase)))
+        self._maybe_report()
+
+    def set_ready(self):
+        """Main path finished (window shown)."""
+        if not self.enabled:
+            return
+        self.ready = True
+        self._maybe_report()
+
+    def _maybe_report(self):
+        with self._lock:
+            if self.reported or not self.ready or self.pending:
+                return
+            self.reported = True
+            phases = sorted(self.phases, key=lambda p: p[1])
+        lines = ["Startup profile (ms):", f"{'at':>9} {'took':>9}  phase"]
+        lines += [f"{at * 1000:9.1f} {took * 1000:9.1f}  {phase}" for phase, at, took in phases]
+        report = "\n".join(lines)
+        logger.info(report)
+        print(report, file=sys.stderr)
+
 def list_files(folder_path):
     """
     Returns a list of files in the host folder with their sizes.
@@ -70,11 +135,10 @@ def list_files(folder_path):
     """
     file_list = []
     try:
-        for f in os.listdir(folder_path):
-            full_path = os.path.join(folder_path, f)
-            if os.path.isfile(full_path):
-                size = os.path.getsize(full_path)
-                file_list.append((f, size))
+        with os.scandir(folder_path) as it:
+            for entry in it:
+                if entry.is_file():
+                    file_list.append((entry.name, entry.stat().st_size))
     except Exception as e:
         print(f"Error listing host files: {e}")
     return file_list
@@ -89,24 +153,23 @@ def is_directory(path):
 
 def check_paths(samdisk_path, conversion_tools_path):
     """Check cpmtools paths. Returns (ok: bool, messages: list)."""
+    from ffhelper_tools import get_tool_registry, EXE_SUFFIX
     messages = []
 
     if not conversion_tools_path or not is_directory(conversion_tools_path):
         messages.append("cpmtools path is missing or not a directory.")
     else:
-        # On Windows, executables end with .exe
-        is_windows = platform.system().lower().startswith("win")
-        suffix = ".exe" if is_windows else ""
-
+        # Looked up in the cached tool scan (finds tools in subfolders too)
+        registry = get_tool_registry(conversion_tools_path)
         for exe in ["cpmls", "cpmcp"]:
-            exe_path = os.path.join(conversion_tools_path, exe + suffix)
-            if not is_executable_file(exe_path):
-                messages.append(f"{exe + suffix} not found or not executable in cpmtools directory.")
+            if registry.find(exe) is None:
+                messages.append(f"{exe + EXE_SUFFIX} not found or not executable in cpmtools directory.")
 
     return len(messages) == 0, messages
 
 def show_path_check_result(iparent, ok, messages):
     """Display results in a messagebox."""
+    from tkinter import messagebox
     if ok:
         messagebox.showinfo("Success", "All paths are valid!", parent=iparent)
     else:
@@ -124,6 +187,7 @@ def create_modal_toplevel(parent, width, height, title=""):
 
     Returns the Toplevel instance.
     """
+    import tkinter as tk
     top = tk.Toplevel(parent)
     top.title(title)
     top.transient(parent)   # keep on top of parent
@@ -0,0 +1,231 @@
+# ffhelper_watcher.py
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------
+# inotify (Linux) via ctypes
+# ----------------------------
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct("iIII")
+
+def _load_inotify():
+    """Return a libc handle exposing inotify_*, or None when unavailable."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError) as e:
+        logger.info(f"inotify unavailable, falling back to polling: {e}")
+        return None
+
+class FolderWatcher:
+    """
+    Watches a set of folders on a background thread and reports changes.
+
+    callback(folder, names) is called from the watcher thread after events
+    have been quiet for `debounce` seconds. names is the set of changed file
+    names, or None when the whole folder should be rescanned (polling mode,
+    event queue overflow, or the folder itself moved).
+    Uses inotify on Linux and polls folder mtimes everywhere else.
+    force_poll_every: also rescan every folder after this many polls, for
+    shares whose folder mtime misses files rewritten in place (0: never).
+    """
+
+    def __init__(self, callback, debounce=0.3, poll_interval=2.0, force_poll_every=0):
+        self.callback = callback
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.force_poll_every = force_poll_every
+        self._folders = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._wake_r = self._wake_w = None   # select()able wake-up pipe, inotify mode only
+        self._stop = False
+        self._libc = _load_inotify()
+        self._fd = None
+        if self._libc is not None:
+            fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                logger.info(f"inotify_init1 failed (errno {os.strerror(self._libc_errno())}), polling instead")
+                self._libc = None
+            else:
+                self._fd = fd
+                self._wake_r, self._wake_w = os.pipe()
+        self._watches = {}      # wd -> folder
+        self._thread = threading.Thread(target=self._run, name="FolderWatcher", daemon=True)
+        self._thread.start()
+
+    @property
+    def mode(self):
+        return "inotify" if self._fd is not None else "polling"
+
+    def _libc_errno(self):
+        import ctypes
+        return ctypes.get_errno()
+
+    def set_folders(self, folders):
+        """Replace the watched set (None/empty entries are ignored)."""
+        with self._lock:
+            self._folders = {os.path.abspath(f) for f in folders if f}
+        self._notify()
+
+    def stop(self):
+        self._stop = True
+        self._notify()
+        self._thread.join(timeout=2)
+
+    def _notify(self):
+        """Wake the watcher thread (select() on Windows only takes sockets, so polling waits on an Event)."""
+        self._wake.set()
+        if self._wake_w is not None:
+            os.write(self._wake_w, b"w")
+
+    # ----------------------------
+    # Thread
+    # ----------------------------
+    def _run(self):
+        try:
+            if self._fd is not None:
+                self._run_inotify()
+            else:
+                self._run_polling()
+        except Exception as e:
+            logger.error(f"Folder watcher stopped: {e}")
+        finally:
+            if self._fd is not None:
+                os.close(self._fd)
+
+    def _drain_wake(self):
+        try:
+            os.read(self._wake_r, 4096)
+        except BlockingIOError:
+            pass
+
+    def _dispatch(self, pending):
+        for folder, names in pending.items():
+            try:
+                self.callback(folder, names)
+            except Exception as e:
+                logger.error(f"Folder watcher callback failed for {folder}: {e}")
+
+    def _sync_watches(self):
+        with self._lock:
+            wanted = set(self._folders)
+        current = {folder: wd for wd, folder in self._watches.items()}
+        for folder, wd in current.items():
+            if folder not in wanted:
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._watches[wd]
+        for folder in wanted - set(current):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(folder), WATCH_MASK)
+            if wd < 0:
+                logger.warning(f"Cannot watch {folder}: {os.strerror(self._libc_errno())}")
+                continue
+            self._watches[wd] = folder
+            logger.debug(f"Watching {folder} (inotify)")
+
+    def _read_events(self, pending):
+        try:
+            buf = os.read(self._fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return
+            raise
+        pos = 0
+        while pos + EVENT_HEADER.size <= len(buf):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(buf, pos)
+            pos += EVENT_HEADER.size
+            name = os.fsdecode(buf[pos:pos + length].rstrip(b"\0"))
+            pos += length
+
+            if mask & IN_Q_OVERFLOW:
+                for folder in self._watches.values():
+                    pending[folder] = None
+                continue
+            folder = self._watches.get(wd)
+            if folder is None:
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF) or not name:
+                pending[folder] = None
+            elif pending.get(folder, set()) is not None:
+                pending.setdefault(folder, set()).add(name)
+
+    def _run_inotify(self):
+        self._sync_watches()
+        pending = {}
+        deadline = None
+        while not self._stop:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            ready, _, _ = select.select([self._fd, self._wake_r], [], [], timeout)
+            if self._wake_r in ready:
+                self._drain_wake()
+                if self._stop:
+                    break
+                self._sync_watches()
+            if self._fd in ready:
+                self._read_events(pending)
+                if pending:
+                    deadline = time.monotonic() + self.debounce  # coalesce bursts
+            if pending and deadline is not None and time.monotonic() >= deadline:
+                batch, pending, deadline = pending, {}, None
+                self._dispatch(batch)
+
+    def _run_polling(self):
+        mtimes = {}
+        polls = 0
+        while not self._stop:
+            if self._wake.wait(self.poll_interval):
+                self._wake.clear()
+                if self._stop:
+                    break
+            polls += 1
+            force = self.force_poll_every and polls % self.force_poll_every == 0
+            with self._lock:
+                folders = set(self._folders)
+            pending = {}
+            for folder in folders:
+                try:
+                    mtime = os.stat(folder).st_mtime_ns
+                except OSError:
+                    mtime = None
+                if folder not in mtimes:
+                    mtimes[folder] = mtime
+                    continue
+                if force or mtime != mtimes[folder]:
+                    mtimes[folder] = mtime
+                    pending[folder] = None
+            for folder in list(mtimes):
+                if folder not in folders:
+                    del mtimes[folder]
+            self._dispatch(pending)
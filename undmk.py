@@ -1,56 +1,38 @@
 # undmk
-# usage: $ python3 ./undmk.py <DMKFILENAME>
+# usage: $ python3 ./undmk.py <DMKFILENAME> [<DMKFILENAME> ...]
 # (c)2019 ben ferguson
+# Decoding now lives in ffhelper_dmk, which reads the DMK header and IDAM
+# tables so any track count, density or sector size works (not just MSX).
 
 import os
-import sys 
-
-input = sys.argv[1]
-
-try:
-    filesize = os.path.getsize(input)
-except:
-    print('Bad filename, try again.')
-    sys.exit()
-
-print('DMK filesize: ' + str(filesize))
-if filesize != 1049616:
-    print("I don't think this is an MSX DMK! Quitting...")
-    sys.exit()
-
-def read_dmk(path):
-    with open(path, 'rb') as f:
-        return f.read()
-
-inbytes = read_dmk(input)
-
-tracksize = inbytes[1]
-print('Num of tracks: ' + str(tracksize))
-
-out=[]
-i = 16
-while i < len(inbytes):
-    if inbytes[i] == 161:
-        if inbytes[i+1] == 161:
-            if inbytes[i+2] == 161:
-                if inbytes[i+3] == 251:
-                    # found start of track
-                    i = i + 4
-                    t = 0
-                    while t < 512:
-                        out.append(inbytes[i])
-                        i += 1
-                        t += 1
-    i += 1
-
-try:
-    ofn = os.path.splitext(input)[0]
-    fn = ofn+'.DSK'
-    fo = open(fn, 'wb')
-    ob = bytes(out)
-    fo.write(ob)
-    print(fn + ' written successfully.')
-except:
-    print('Write failed - permissions error?')
-finally:
-    fo.close()
+import sys
+import ffhelper_dmk as dmk
+
+if len(sys.argv) < 2:
+    print('usage: python3 ./undmk.py <DMKFILENAME> [<DMKFILENAME> ...]')
+    sys.exit(1)
+
+status = 0
+for input in sys.argv[1:]:
+    try:
+        filesize = os.path.getsize(input)
+    except OSError:
+        print('Bad filename, try again: ' + input)
+        status = 1
+        continue
+
+    print('DMK filesize: ' + str(filesize))
+    fn = os.path.splitext(input)[0] + '.DSK'
+    try:
+        image = dmk.read_dmk(input)
+        print('Num of tracks: ' + str(image.cylinders) + ' x ' + str(image.heads) + ' side(s)')
+        dmk.write_raw_dsk(image, fn)
+        print(fn + ' written successfully.')
+    except dmk.DMKError as e:
+        print("I don't think this is a DMK! (" + str(e) + ')')
+        status = 1
+    except OSError as e:
+        print('Write failed - permissions error? (' + str(e) + ')')
+        status = 1
+
+sys.exit(status)